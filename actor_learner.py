@@ -0,0 +1,219 @@
+import multiprocessing
+import queue
+import random
+import time
+import numpy as np
+
+import environment as brisc
+from agents.q_agent import QAgent
+from evaluate import CheckpointEvaluator
+from networks.replay_memory import CompactReplayMemory, EpisodeReplayMemory, SharedReplayMemory
+from utils import BriscolaLogger
+
+
+class ActorAgent(QAgent):
+    ''' QAgent playing in a worker process: instead of learning it only stores
+        its transitions in the replay memory shared with the learner
+    '''
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.name = 'ActorAgent'
+        self.num_transitions = 0
+
+
+    def update(self, reward):
+        self.reward = reward
+        self.increment_epsilon()
+
+        self.q_learning.store(*self.get_transition())
+        self.num_transitions += 1
+
+
+    def pop_transitions(self):
+        ''' returns the number of transitions stored since the last call'''
+        num_transitions = self.num_transitions
+        self.num_transitions = 0
+        return num_transitions
+
+
+
+def actor_worker(agent_config, replay_memory, opponent, cards_order, episodes_queue, weights_queue, stop_event, seed):
+    ''' plays games against opponent with the last weights published by the learner,
+        storing the transitions in replay_memory and sending their number after each episode
+    '''
+    random.seed(seed)
+    np.random.seed(seed)
+
+    logger = BriscolaLogger(BriscolaLogger.LoggerLevels.TEST)
+    game = brisc.BriscolaGame(2, logger, cards_order)
+    actor = ActorAgent(replay_memory=replay_memory, **agent_config)
+    agents = [actor, opponent]
+
+    weights = weights_queue.get()
+    while not stop_event.is_set():
+        if weights is not None:
+            actor.q_learning.set_weights(weights)
+
+        brisc.play_episode(game, agents)
+        transitions = actor.pop_transitions()
+
+        while not stop_event.is_set():
+            try:
+                episodes_queue.put(transitions, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+
+        # keep only the most recent weights
+        weights = None
+        try:
+            while True:
+                weights = weights_queue.get_nowait()
+        except queue.Empty:
+            pass
+
+
+
+def receive(episodes_queue, block):
+    ''' returns the number of transitions of an episode or None if there are not any'''
+    try:
+        return episodes_queue.get(block, timeout=1.)
+    except queue.Empty:
+        return None
+
+
+
+def publish(weights_queue, weights):
+    ''' sends weights to an actor, replacing the weights it has not read yet'''
+    try:
+        while True:
+            weights_queue.get_nowait()
+    except queue.Empty:
+        pass
+    weights_queue.put(weights)
+
+
+
+def train_actor_learner(game, agents, agent_config, num_workers, num_epochs, evaluate_every, num_evaluations, model_dir="", weights_every=100, seed=0,
+                        evaluation_workers=0, sequential_evaluation=False, deals=None):
+    ''' trains agents[0] on the games played by num_workers actor processes against agents[1].
+        The actors write their transitions in a replay memory shared with the learner, which
+        only runs the training steps, keeping the ratio of training steps per transition of
+        QAgent.update; the actors receive the learner weights every weights_every training steps.
+        agent_config are the keyword arguments used for creating agents[0]. The checkpoints are
+        evaluated as in train, with evaluation_workers, sequential_evaluation and deals.
+        returns the win rate of the best checkpoint
+    '''
+    learner = agents[0]
+    network = learner.q_learning
+    if getattr(network, 'prioritized_replay', False):
+        raise ValueError("train_actor_learner does not support prioritized replay")
+
+    # spawn instead of fork, tensorflow sessions are not fork safe
+    context = multiprocessing.get_context('spawn')
+
+    # move the learner replay memory into shared memory
+    replay_memory = network.replay_memory
+    if isinstance(replay_memory, EpisodeReplayMemory):
+        shared_memory = EpisodeReplayMemory(replay_memory.capacity, network.n_features, replay_memory.num_rows, True, context)
+        shared_memory.arrays.copy_from(replay_memory.arrays)
+    elif isinstance(replay_memory, CompactReplayMemory):
+        shared_memory = CompactReplayMemory(replay_memory.capacity, replay_memory.encoder, True, context)
+        shared_memory.arrays.copy_from(replay_memory.arrays)
+    else:
+        shared_memory = SharedReplayMemory(replay_memory.capacity, network.n_features, context)
+        shared_memory.memory[:] = replay_memory.memory
+        shared_memory.memory_counter = replay_memory.memory_counter
+    network.replay_memory = shared_memory
+
+    # the exploration schedule of each actor advances only on its own transitions
+    actor_config = dict(agent_config)
+    actor_config['epsilon_increment'] = agent_config.get('epsilon_increment', 0) * num_workers
+
+    episodes_queue = context.Queue(maxsize=16 * num_workers)
+    stop_event = context.Event()
+    weights = network.get_weights()
+    weights_queues = []
+    workers = []
+
+    replace_target_every = max(1, network.replace_target_iter // network.update_each)
+    # the evaluation processes are spawned once for the whole training
+    evaluator = CheckpointEvaluator(num_evaluations, evaluation_workers, sequential_evaluation, deals)
+    episodes = 0
+    transitions = 0
+    updates = 0
+    start_time = time.time()
+
+    try:
+        for worker_id in range(num_workers):
+            weights_queue = context.Queue()
+            weights_queue.put(weights)
+            worker = context.Process(
+                target=actor_worker,
+                args=(actor_config, shared_memory, agents[1], game.cards_order, episodes_queue, weights_queue, stop_event, seed + worker_id),
+                daemon=True)
+            worker.start()
+            weights_queues.append(weights_queue)
+            workers.append(worker)
+
+        while episodes < num_epochs:
+
+            if updates * network.update_each < transitions - network.update_after:
+                # training step, the transitions are received once the training steps are even with them
+                loss = network.optimize()
+                if loss is not None:
+                    updates += 1
+                    if updates % replace_target_every == 0:
+                        network.replace_target()
+                    if updates % weights_every == 0:
+                        weights = network.get_weights()
+                        for weights_queue in weights_queues:
+                            publish(weights_queue, weights)
+                    continue
+
+            episode_transitions = receive(episodes_queue, block=True)
+            if episode_transitions is None:
+                if not any(worker.is_alive() for worker in workers):
+                    raise RuntimeError("train_actor_learner: all the actor processes terminated")
+                continue
+
+            network.learn_step_counter += episode_transitions
+            transitions += episode_transitions
+            episodes += 1
+
+            elapsed = time.time() - start_time
+            print("Epoch: ", episodes, " transitions/sec: {:.0f}".format(transitions / elapsed), " updates/sec: {:.0f}".format(updates / elapsed), end='\r')
+
+            if episodes % evaluate_every == 0:
+                better, win_rate = evaluator.evaluate(game, agents)
+                if better:
+                    learner.save_model(model_dir)
+    finally:
+        evaluator.close()
+        stop_event.set()
+        # weights not read by the actors would block this process at exit, waiting for the queues to be flushed
+        for weights_queue in weights_queues:
+            try:
+                while True:
+                    weights_queue.get_nowait()
+            except queue.Empty:
+                pass
+            weights_queue.cancel_join_thread()
+            weights_queue.close()
+
+        # empty the queue so that the actors blocked on it can terminate
+        while any(worker.is_alive() for worker in workers):
+            while receive(episodes_queue, block=False) is not None:
+                pass
+            for worker in workers:
+                worker.join(timeout=0.1)
+
+        # the learner keeps training on a private copy of the memory
+        shared_memory.unshare()
+
+    elapsed = time.time() - start_time
+    print("\nActors: ", num_workers, " transitions: ", transitions, " updates: ", updates)
+    print("Transitions/sec: {:.0f}".format(transitions / elapsed), " updates/sec: {:.0f}".format(updates / elapsed))
+
+    return evaluator.best_win_rate
@@ -3,11 +3,13 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 
 import numpy as np
 import environment as brisc
+from endgame_solver import EndgameSolver
 
 class AIAgent:
 
-    def __init__(self):
+    def __init__(self, solve_endgame=False):
         self.name = 'AIAgent'
+        self.endgame_solver = EndgameSolver() if solve_endgame else None
 
 
     def observe(self, game, player):
@@ -16,10 +18,16 @@ class AIAgent:
         self.points = player.points
         self.played_cards = game.played_cards
         self.briscola_seed = game.briscola.seed
+        self.game = game
+        self.player_id = player.id
 
 
     def select_action(self, actions):
 
+        if self.endgame_solver and self.endgame_solver.is_solvable(self.game):
+            # play the last turns perfectly
+            return self.endgame_solver.select_action(self.game, self.player_id)
+
         # count how many points are present on table
         points_on_table =  0
         for played_card in self.played_cards:
@@ -99,6 +107,10 @@ class AIAgent:
             return weakest_index
 
 
+    def start_episode(self):
+        pass
+
+
     def update(self, reward):
         pass
 
@@ -33,6 +33,10 @@ class HumanAgent:
         return action
 
 
+    def start_episode(self):
+        pass
+
+
     def update(self, reward):
         pass
 
@@ -0,0 +1,239 @@
+import sys, os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import math
+import random
+import time
+from array import array
+
+import environment as brisc
+from utils import BriscolaLogger
+
+
+class ISMCTSAgent:
+    ''' Single observer Information Set Monte Carlo Tree Search agent.
+        Each iteration determinizes the hidden cards and descends a tree whose edges are the
+        played cards, so a node is shared by all the determinizations consistent with it.
+        Nodes are stored in preallocated arrays and the subtree reached by the cards played
+        since the last move is reused as the new root.
+    '''
+
+    def __init__(self, iterations=1000, time_budget=None, exploration=0.7, capacity=200000):
+        ''' each move stops after iterations or when time_budget (seconds) is over, if set.
+            capacity is the maximum number of nodes in the tree.
+        '''
+        self.name = 'ISMCTSAgent'
+
+        self.iterations = iterations
+        self.time_budget = time_budget
+        self.exploration = exploration
+        self.capacity = capacity
+
+        # node storage, children are linked lists starting from first_child
+        self.parent = array('i', [-1]) * capacity
+        self.first_child = array('i', [-1]) * capacity
+        self.next_sibling = array('i', [-1]) * capacity
+        self.card = array('b', [-1]) * capacity
+        self.player = array('b', [-1]) * capacity
+        self.visits = array('i', [0]) * capacity
+        self.availability = array('i', [0]) * capacity
+        self.rewards = array('d', [0.]) * capacity
+        self.num_nodes = 0
+
+        self.root = -1
+        self.root_history_length = 0
+        self.root_briscola = -1
+        self.search_game = None
+
+        # search statistics of the last move and of all the moves
+        self.stats = {}
+        self.total_iterations = 0
+        self.total_nodes = 0
+        self.total_time = 0.
+
+
+    def observe(self, game, player):
+        self.game = game
+        self.player_id = player.id
+
+
+    def select_action(self, actions):
+
+        if len(actions) == 1:
+            return actions[0]
+
+        if self.search_game is None or self.search_game.num_players != self.game.num_players:
+            # the search runs on a silent copy of the game
+            logger = BriscolaLogger(BriscolaLogger.LoggerLevels.TEST)
+            self.search_game = brisc.BriscolaGame(self.game.num_players, logger, self.game.cards_order)
+
+        start_time = time.time()
+        reused_visits = self.update_root()
+        start_nodes = self.num_nodes
+        root_state = self.game.snapshot()
+
+        iterations = 0
+        while iterations < self.iterations:
+            if self.time_budget and iterations and time.time() - start_time > self.time_budget:
+                break
+            self.search_game.restore(root_state)
+            self.search_game.determinize(self.player_id)
+            self.iterate(self.search_game)
+            iterations += 1
+
+        # play the most visited card
+        hand = self.game.players[self.player_id].hand_ids
+        best_action = actions[0]
+        best_visits = -1
+        for action in actions:
+            child = self.find_child(self.root, hand[action])
+            if child >= 0 and self.visits[child] > best_visits:
+                best_action = action
+                best_visits = self.visits[child]
+
+        elapsed = max(time.time() - start_time, 1e-9)
+        new_nodes = self.num_nodes - start_nodes
+        self.total_iterations += iterations
+        self.total_nodes += new_nodes
+        self.total_time += elapsed
+        self.stats = {
+            'iterations': iterations,
+            'new_nodes': new_nodes,
+            'reused_visits': reused_visits,
+            'seconds': elapsed,
+            'iterations_per_second': iterations / elapsed,
+            'nodes_per_second': new_nodes / elapsed,
+        }
+
+        return best_action
+
+
+    def update_root(self):
+        ''' move the root to the node reached by the cards played since the last search,
+            returns the number of visits of the reused subtree
+        '''
+        history = self.game.history_ids
+        node = self.root
+        if node < 0 or self.root_briscola != self.game.briscola_id or len(history) < self.root_history_length or self.num_nodes > self.capacity // 2:
+            node = -1
+        else:
+            for card in history[self.root_history_length:]:
+                node = self.find_child(node, card)
+                if node < 0:
+                    break
+
+        if node < 0:
+            # start a new tree
+            self.num_nodes = 0
+            node = self.new_node(-1, -1, -1)
+
+        self.root = node
+        self.root_history_length = len(history)
+        self.root_briscola = self.game.briscola_id
+        return self.visits[node]
+
+
+    def new_node(self, parent, card, player_id):
+        node = self.num_nodes
+        self.num_nodes += 1
+
+        self.parent[node] = parent
+        self.first_child[node] = -1
+        self.card[node] = card
+        self.player[node] = player_id
+        self.visits[node] = 0
+        self.availability[node] = 0
+        self.rewards[node] = 0.
+
+        if parent >= 0:
+            self.next_sibling[node] = self.first_child[parent]
+            self.first_child[parent] = node
+        else:
+            self.next_sibling[node] = -1
+
+        return node
+
+
+    def find_child(self, node, card):
+        child = self.first_child[node]
+        while child >= 0 and self.card[child] != card:
+            child = self.next_sibling[child]
+        return child
+
+
+    def iterate(self, game):
+        ''' one selection, expansion, rollout and backpropagation on a determinized game'''
+        node = self.root
+        path = []
+
+        while not game.check_end_game():
+            player_id = game.players_order[len(game.played_ids)]
+            hand = game.players[player_id].hand_ids
+            children = [self.find_child(node, card) for card in hand]
+
+            if -1 in children and self.num_nodes < self.capacity:
+                # expansion of a random untried card
+                card = random.choice([card for card, child in zip(hand, children) if child < 0])
+                node = self.new_node(node, card, player_id)
+                path.append(node)
+                self.play(game, player_id, card)
+                break
+
+            # selection of the compatible child with the highest upper confidence bound
+            best_child = -1
+            best_value = -math.inf
+            for child in children:
+                if child < 0:
+                    continue
+                self.availability[child] += 1
+                value = self.rewards[child] / self.visits[child] + \
+                    self.exploration * math.sqrt(math.log(self.availability[child]) / self.visits[child])
+                if value > best_value:
+                    best_child = child
+                    best_value = value
+
+            if best_child < 0:
+                # the tree is full
+                break
+
+            node = best_child
+            path.append(node)
+            self.play(game, player_id, self.card[node])
+
+        # random rollout
+        while not game.check_end_game():
+            player_id = game.players_order[len(game.played_ids)]
+            hand = game.players[player_id].hand_ids
+            self.play(game, player_id, hand[random.randrange(len(hand))])
+
+        # each node is rewarded with the final points difference of the player who played its card
+        points = [player.points for player in game.players]
+        total_points = sum(points)
+        self.visits[self.root] += 1
+        for node in path:
+            self.visits[node] += 1
+            self.rewards[node] += (2 * points[self.player[node]] - total_points) / total_points
+
+
+    def play(self, game, player_id, card):
+        game.play_step(game.players[player_id].hand_ids.index(card), player_id)
+        if len(game.played_ids) == game.num_players:
+            game.evaluate_step()
+            game.draw_step()
+
+
+    def start_episode(self):
+        # the tree of the last game can not be reused
+        self.root = -1
+
+
+    def update(self, reward):
+        pass
+
+
+    def make_greedy(self):
+        pass
+
+
+    def restore_epsilon(self):
+        pass
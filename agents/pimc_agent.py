@@ -0,0 +1,148 @@
+import sys, os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import time
+import numpy as np
+
+import environment as brisc
+from agents.ai_agent import AIAgent
+from utils import BriscolaLogger
+
+
+class PIMCAgent:
+    ''' Determinized Monte Carlo agent.
+        For each move it samples determinizations of the cards it cannot see and scores
+        each available action by the final points difference of rollouts played from them.
+    '''
+
+    def __init__(self, num_determinizations=200, batch_size=50, time_budget=None, rollout_policy='random'):
+        ''' num_determinizations is the maximum number of determinizations for each move,
+            if time_budget (seconds) is set they are sampled in batches until the budget is over.
+            rollout_policy is 'random', played in a BatchedBriscolaGame, or 'ai', played by AIAgents.
+        '''
+        self.name = 'PIMCAgent'
+
+        if rollout_policy not in ['random', 'ai']:
+            raise ValueError("PIMCAgent rollout_policy must be 'random' or 'ai'")
+
+        self.num_determinizations = num_determinizations
+        self.batch_size = min(batch_size, num_determinizations)
+        self.time_budget = time_budget
+        self.rollout_policy = rollout_policy
+
+        self.search_game = None
+        self.batched_game = None
+        self.rollout_agents = None
+        self.num_rollouts = 0
+
+
+    def observe(self, game, player):
+        self.game = game
+        self.player_id = player.id
+
+
+    def select_action(self, actions):
+
+        if len(actions) == 1:
+            return actions[0]
+
+        if self.search_game is None or self.search_game.num_players != self.game.num_players:
+            # the search runs on silent copies of the game
+            logger = BriscolaLogger(BriscolaLogger.LoggerLevels.TEST)
+            self.search_game = brisc.BriscolaGame(self.game.num_players, logger, self.game.cards_order)
+            self.batched_game = brisc.BatchedBriscolaGame(self.batch_size * brisc.HAND_SIZE, self.game.num_players, logger)
+            self.rollout_agents = [AIAgent() for _ in range(self.game.num_players)]
+
+        start_time = time.time()
+        root_state = self.game.snapshot()
+        scores = np.zeros(len(actions))
+        counts = np.zeros(len(actions))
+
+        num_determinizations = 0
+        while num_determinizations < self.num_determinizations:
+            if self.time_budget and num_determinizations and time.time() - start_time > self.time_budget:
+                break
+
+            # rows of the batch are determinizations repeated for each action
+            states = []
+            for _ in range(self.batch_size):
+                self.search_game.restore(root_state)
+                self.search_game.determinize(self.player_id)
+                states += [self.search_game.snapshot()] * brisc.HAND_SIZE
+            row_actions = np.arange(len(states)) % brisc.HAND_SIZE % len(actions)
+
+            if self.rollout_policy == 'random':
+                results = self.random_rollouts(states, row_actions)
+            else:
+                results = self.ai_rollouts(states, row_actions)
+
+            scores += np.bincount(row_actions, weights=results, minlength=len(actions))
+            counts += np.bincount(row_actions, minlength=len(actions))
+            num_determinizations += self.batch_size
+            self.num_rollouts += len(states)
+
+        return actions[int(np.argmax(scores / counts))]
+
+
+    def random_rollouts(self, states, row_actions):
+        ''' play the actions and then random moves in all the determinizations at once,
+            returns the final points difference of the agent
+        '''
+        game = self.batched_game
+        game.restore(states)
+        game.play_step(row_actions)
+
+        while not game.check_end_game().all():
+            while game.num_played < game.num_players:
+                sizes = game.get_player_actions().sum(axis=1)
+                game.play_step((np.random.random(game.num_games) * sizes).astype(np.int64))
+            game.evaluate_step()
+            game.draw_step()
+
+        return 2 * game.points[:, self.player_id] - game.points.sum(axis=1)
+
+
+    def ai_rollouts(self, states, row_actions):
+        ''' play the actions and then let AIAgents play until the end of each determinization,
+            returns the final points difference of the agent
+        '''
+        game = self.search_game
+        results = np.zeros(len(states))
+
+        for i, state in enumerate(states):
+            game.restore(state)
+            player_id = self.player_id
+            action = row_actions[i]
+
+            while not game.check_end_game():
+                while len(game.played_ids) < game.num_players:
+                    if action is None:
+                        player_id = game.players_order[len(game.played_ids)]
+                        agent = self.rollout_agents[player_id]
+                        agent.observe(game, game.players[player_id])
+                        action = agent.select_action(game.get_player_actions(player_id))
+                    game.play_step(action, player_id)
+                    action = None
+                game.evaluate_step()
+                game.draw_step()
+
+            points = [player.points for player in game.players]
+            results[i] = 2 * points[self.player_id] - sum(points)
+
+        return results
+
+
+    def start_episode(self):
+        pass
+
+
+    def update(self, reward):
+        pass
+
+
+    def make_greedy(self):
+        pass
+
+
+    def restore_epsilon(self):
+        pass
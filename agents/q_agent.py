@@ -2,21 +2,34 @@ import sys, os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 import numpy as np
-import tensorflow as tf
 import itertools, time, random, os, shutil
 
-from networks.dqn import DQN
-from networks.drqn import DRQN
-from utils import NetworkTypes
+from networks.numpy_dqn import NumpyDQN
+from networks.replay_memory import CompactReplayMemory
+from endgame_solver import EndgameSolver
+from state_encoder import StateEncoder
+from utils import CardsEncoding, NetworkTypes, PlayerState
+
+def layers_from_weights(network, weights):
+    ''' sizes of the hidden layers of a network, from the shapes of the arrays returned by its get_weights()'''
+    if network == NetworkTypes.DRQN:
+        # input dense layer, kernel and bias of each LSTM layer with its 4 gates, then two dense layers
+        return [kernel.shape[1] // 4 for kernel in weights[2:-4:2]]
+    return [kernel.shape[1] for kernel in weights[0:-2:2]]
+
 
 class QAgent():
     ''' Trainable agent which uses a neural network to determine best action'''
 
-    def __init__(self, epsilon=0.85, epsilon_increment=0, epsilon_max=0.85, discount=0.95, network=NetworkTypes.DRQN, layers=[256, 128], learning_rate=1e-3, replace_target_iter=2000, batch_size=100):
+    def __init__(self, epsilon=0.85, epsilon_increment=0, epsilon_max=0.85, discount=0.95, network=NetworkTypes.DRQN, layers=[256, 128], learning_rate=1e-3, replace_target_iter=2000, batch_size=100, solve_endgame=False, cards_encoding=CardsEncoding.HOT_ON_NUM_SEED, player_state=PlayerState.HAND_PLAYED_BRISCOLA, replay_memory=None, prioritized_replay=False, compact_replay=False, replay_capacity=10000):
         self.name = 'QAgent'
 
+        self.encoder = StateEncoder(cards_encoding, player_state)
+        self.cards_encoding = cards_encoding
+        self.player_state = player_state
+
         self.n_actions = 3
-        self.n_features = 70
+        self.n_features = self.encoder.n_features
         self.epsilon_max = epsilon_max
         self.epsilon = epsilon
         self.epsilon_backup = epsilon
@@ -28,54 +41,84 @@ class QAgent():
         self.state = None
         self.terminal = None
         self.network = network
+        self.layers = layers
+
+        # observations are encoded alternating two preallocated buffers, so that last_state is preserved
+        self.state_buffers = np.zeros((2, self.n_features), dtype=np.float32)
+        self.state_buffer_index = 0
+        # when the replay memory supports it, observations are encoded in place in its slots instead
+        self.direct_replay = False
+
+        # with a compact replay memory the stored states are the compact records of the observations
+        self.compact_replay = compact_replay
+        self.compact_buffers = np.zeros((2, self.encoder.compact_size), dtype=np.uint8)
+        self.last_compact_state = None
+        self.compact_state = None
+
+        # optional InferenceBroker batching the q values requests of concurrent games
+        self.inference = None
+
+        self.solve_endgame = solve_endgame
+        self.endgame_solver = EndgameSolver() if solve_endgame else None
 
         # create q learning algorithm
-        if network == NetworkTypes.DQN:
-            self.q_learning = DQN(self.n_actions, self.n_features, layers, learning_rate, batch_size, replace_target_iter, discount)
+        if network == NetworkTypes.DQN and compact_replay and prioritized_replay:
+            raise ValueError("Compact replay does not support prioritized replay")
+        elif network == NetworkTypes.DQN:
+            # tensorflow is imported only by the trainable networks
+            from networks.dqn import DQN
+            if compact_replay and replay_memory is None:
+                replay_memory = CompactReplayMemory(replay_capacity, self.encoder)
+            self.q_learning = DQN(self.n_actions, self.n_features, layers, learning_rate, batch_size, replace_target_iter, discount, replay_memory, prioritized_replay, replay_capacity)
+        elif network == NetworkTypes.DRQN and (prioritized_replay or compact_replay):
+            raise ValueError("Prioritized and compact replay are implemented only for the DQN network")
         elif network == NetworkTypes.DRQN:
-            self.q_learning = DRQN(self.n_actions, self.n_features, layers, learning_rate, batch_size, replace_target_iter, discount)
+            from networks.drqn import DRQN
+            self.q_learning = DRQN(self.n_actions, self.n_features, layers, learning_rate, batch_size, replace_target_iter, discount, replay_memory)
+        elif network == NetworkTypes.NUMPY:
+            # inference only, the weights are loaded with load_model from a model exported by export_numpy.py
+            self.q_learning = NumpyDQN(self.n_actions, self.n_features, layers)
         else:
             raise ValueError("Not implemented type of network passed to QAgent")
 
 
     def observe(self, game, player):
         ''' create an encoded state representation of the game to be fed into the neural network
-            the state is composed of 5 cards (3 in hand, 1 played card on table, 1 briscola)
-            each card is array of size 14, separating one hot encoded number and seed i.e. [number_one_hot, seed_one_hot]
+            using the agent StateEncoder, by default the state is composed of 5 cards
+            (3 in hand, 1 played card on table, 1 briscola) each encoded as an array of size 14
+            separating one hot encoded number and seed i.e. [number_one_hot, seed_one_hot]
             if there are no cards at a particular location, the array is all zeros.
         '''
 
-        # Reordering the player hand in descending order (high value -> low value)
-        #game.reorder_hand(player.id)
-
-        state = np.zeros(self.n_features)
-        # add hand to state
-
-        for i, card in enumerate(player.hand):
-            number_index = i * 14 + card.number
-            state[number_index] = 1
-            seed_index = i * 14 + 10 + card.seed
-            state[seed_index] = 1
-        # add played cards to state
-        for i, card in enumerate(game.played_cards):
-            number_index = (i + 3) * 14 + card.number
-            state[number_index] = 1
-            seed_index = (i + 3) * 14 + 10 + card.seed
-            state[seed_index] = 1
-        # add briscola to state
-        number_index = 4 * 14 + game.briscola.number
-        state[number_index] = 1
-        seed_index = 4 * 14 + 10 + game.briscola.seed
-        state[seed_index] = 1
-        # add seen cards
-        #for card in game.history:
-            #card_index = 5 * 14 + card.id
-            #state[card_index] = 1
-
-
-        self.last_state = self.state
+        buffer_index = self.state_buffer_index
+        self.state_buffer_index = 1 - buffer_index
+
+        replay_memory = self.q_learning.replay_memory
+        self.direct_replay = not self.compact_replay and hasattr(replay_memory, 'prepare')
+        if self.direct_replay:
+            # encode the state directly in the replay memory slot of the next transition
+            last_state, state = replay_memory.prepare(self.state)
+        else:
+            last_state, state = self.state, self.state_buffers[buffer_index]
+        self.encoder.encode(game, player, out=state)
+        self.q_learning.observe_state(state)
+
+        self.last_state = last_state
         self.state = state
+
+        if self.compact_replay:
+            compact_state = self.compact_buffers[buffer_index]
+            self.encoder.encode_compact(game, player, out=compact_state)
+            self.last_compact_state = self.compact_state
+            self.compact_state = compact_state
         self.terminal = int(game.check_end_game())
+        self.game = game
+        self.player_id = player.id
+
+
+    def start_episode(self):
+        ''' reset the recurrent state of the network at the beginning of a game'''
+        self.q_learning.start_episode()
 
 
     def select_action(self, available_actions):
@@ -84,9 +127,15 @@ class QAgent():
         if self.state is None:
             raise ValueError("DeepAgent.select_action called before observing the state")
 
-        if np.random.uniform() > self.epsilon:
+        if self.endgame_solver and self.endgame_solver.is_solvable(self.game):
+            # play the last turns perfectly
+            action = self.endgame_solver.select_action(self.game, self.player_id)
+        elif np.random.uniform() > self.epsilon:
             # select action randomly with probability (1 - epsilon)
             action = np.random.choice(available_actions)
+        elif self.inference is not None:
+            # the greedy action is computed in a batch with the other games served by the broker
+            action = self.inference.select_action(self.state, available_actions)
         else:
             q = self.q_learning.get_q_table(self.state)
             # sort actions from highest to lowest predicted q value
@@ -118,24 +167,50 @@ class QAgent():
             self.reward = reward
         '''
 
+        if self.network == NetworkTypes.NUMPY:
+            raise ValueError("QAgent with the numpy network is inference only, train a DQN or DRQN network and export it with export_numpy.py")
+
         # update last reward
         self.reward = reward
 
-        # update epsilon grediness
+        self.increment_epsilon()
+
+        if self.direct_replay:
+            # the states of the transition are already in the replay memory
+            self.q_learning.commit(self.action, self.reward, self.terminal)
+        else:
+            self.q_learning.learn(*self.get_transition())
+
+
+    def get_transition(self):
+        ''' last collected transition (s, a, r, s_, t) in the format of the replay memory'''
+        if self.compact_replay:
+            return self.last_compact_state, self.action, self.reward, self.compact_state, self.terminal
+        return self.last_state, self.action, self.reward, self.state, self.terminal
+
+
+    def increment_epsilon(self):
+        ''' update epsilon grediness'''
         if self.epsilon < self.epsilon_max:
             self.epsilon += self.epsilon_increment
             if self.epsilon >= self.epsilon_max:
                 self.epsilon = self.epsilon_max
                 print("Epsilon max: ", self.epsilon_max, " reached!")
 
-        self.q_learning.learn(self.last_state, self.action, self.reward, self.state, self.terminal)
-
 
     def save_model(self, output_dir):
         self.q_learning.save_model(output_dir)
 
     def load_model(self, saved_model_dir):
         self.q_learning.load_model(saved_model_dir)
+        # the loaded model can have layers different from the ones the agent was created with
+        self.layers = layers_from_weights(self.network, self.q_learning.get_weights())
+
+    def save_replay_memory(self, output_dir):
+        self.q_learning.save_replay_memory(output_dir)
+
+    def load_replay_memory(self, snapshot_dir):
+        self.q_learning.load_replay_memory(snapshot_dir)
 
     def make_greedy(self):
         self.epsilon_backup = self.epsilon
@@ -13,6 +13,9 @@ class RandomAgent:
     def select_action(self, actions):
         return np.random.choice(actions)
 
+    def start_episode(self):
+        pass
+
     def update(self, reward):
         pass
 
@@ -0,0 +1,252 @@
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import time
+import uuid
+import numpy as np
+
+from utils import NetworkTypes
+
+
+def sample_config(seed):
+    ''' configuration of a trial, sampled from the space of hyperopt_optimize.py'''
+    from hyperopt.pyll import stochastic
+    from hyperopt_optimize import space
+    return stochastic.sample(space, np.random.RandomState(seed))
+
+
+
+def get_rungs(min_epochs, max_epochs, reduction_factor):
+    ''' epochs at which the trials are compared: min_epochs, then multiplied by reduction_factor up to max_epochs'''
+    rungs = []
+    epochs = min_epochs
+    while epochs < max_epochs:
+        rungs.append(epochs)
+        epochs *= reduction_factor
+    return rungs
+
+
+
+def load_results(results_file):
+    ''' records of the results file, skipping a line truncated by an interrupted search'''
+    records = []
+    if os.path.exists(results_file):
+        with open(results_file) as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    pass
+    return records
+
+
+def write_result(results_file, lock, record):
+    with lock:
+        with open(results_file, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+
+
+class SuccessiveHalving:
+    ''' train callback stopping a trial when its win rate at a rung is not in the best
+        1 / reduction_factor of the win rates of all the trials which reached that rung.
+        rung_results is shared by the processes of the search, so trials are pruned asynchronously
+        as soon as they reach a rung, without waiting for the other trials (ASHA).
+        The rung results are recorded with the attempt id of the trial training.
+    '''
+
+    def __init__(self, trial, attempt, rungs, reduction_factor, rung_results, lock, results_file):
+        self.trial = trial
+        self.attempt = attempt
+        self.rungs = list(rungs)
+        self.reduction_factor = reduction_factor
+        self.rung_results = rung_results
+        self.lock = lock
+        self.results_file = results_file
+        self.epoch = 0
+        self.stopped = False
+
+
+    def __call__(self, epoch, win_rate):
+        self.epoch = epoch
+        while self.rungs and epoch >= self.rungs[0]:
+            rung = self.rungs.pop(0)
+            with self.lock:
+                results = self.rung_results.get(rung, []) + [win_rate]
+                self.rung_results[rung] = results
+            write_result(self.results_file, self.lock, {'trial': self.trial, 'attempt': self.attempt, 'rung': rung, 'win_rate': win_rate})
+
+            cutoff = np.percentile(results, 100 * (1 - 1 / self.reduction_factor))
+            if win_rate < cutoff:
+                self.stopped = True
+                return True
+        return False
+
+
+
+def run_trial(trial, config, settings, rung_results, lock):
+    ''' trains an agent with the configuration of the trial, in a process of its own'''
+    from agents.q_agent import QAgent
+    from agents.random_agent import RandomAgent
+    import environment as brisc
+    from train import train
+    from utils import BriscolaLogger
+
+    random.seed(settings['seed'] + trial)
+    np.random.seed(settings['seed'] + trial)
+
+    logger = BriscolaLogger(BriscolaLogger.LoggerLevels.TEST)
+    game = brisc.BriscolaGame(2, logger)
+
+    agent = QAgent(
+        epsilon=config['epsilon'],
+        epsilon_increment=config['epsilon_increment'],
+        epsilon_max=config['epsilon_max'],
+        discount=config['discount'],
+        network=settings['network'],
+        layers=config['layers'],
+        learning_rate=config['learning_rate'],
+        replace_target_iter=config['replace_target_iter'])
+    agents = [agent, RandomAgent()]
+
+    # a trial interrupted by the end of the search is trained again with another attempt id
+    attempt = uuid.uuid4().hex
+    callback = SuccessiveHalving(trial, attempt, settings['rungs'], settings['reduction_factor'], rung_results, lock, settings['results_file'])
+    model_dir = os.path.join(settings['model_dir'], 'trial_{}'.format(trial))
+
+    start_time = time.time()
+    best_win_rate = train(game, agents, settings['max_epochs'], settings['evaluate_every'], settings['num_evaluations'], model_dir,
+                            deals=settings['deals'], callback=callback)
+
+    record = {
+        'trial': trial,
+        'attempt': attempt,
+        'config': config,
+        'status': 'stopped' if callback.stopped else 'completed',
+        'epochs': callback.epoch if callback.stopped else settings['max_epochs'],
+        'best_win_rate': best_win_rate,
+        'seconds': time.time() - start_time,
+        'model_dir': model_dir,
+    }
+    write_result(settings['results_file'], lock, record)
+    return record
+
+
+def trial_worker(args):
+    return run_trial(*args)
+
+
+def format_win_rate(win_rate):
+    return 'none' if win_rate is None else '{:.2%}'.format(win_rate)
+
+
+
+def asha_search(num_trials, num_workers, results_file, min_epochs, max_epochs, reduction_factor=3, evaluate_every=5000,
+                num_evaluations=1000, model_dir='asha_models', network=NetworkTypes.DQN, seed=0, deals=None):
+    ''' random search over the hyperopt space with asynchronous successive halving.
+        num_trials configurations are trained in num_workers processes, each trial in a new process
+        so that every one has its own tensorflow graph and session. A trial is stopped at the first
+        rung where its win rate is not in the best 1 / reduction_factor of the trials reaching it,
+        the others train for max_epochs. Every rung result and finished trial is appended to
+        results_file, running again with the same results_file resumes the search: finished trials
+        are skipped and the rung results of the attempts which finished them are kept for pruning
+        the remaining ones.
+        returns the records of the finished trials, best first
+    '''
+    rungs = get_rungs(min_epochs, max_epochs, reduction_factor)
+    if any(rung % evaluate_every for rung in rungs):
+        raise ValueError("asha_search: the rungs {} have to be multiples of evaluate_every {}".format(rungs, evaluate_every))
+    # a trial which is never evaluated has no best win rate
+    if max_epochs < evaluate_every:
+        raise ValueError("asha_search: max_epochs {} has to be at least evaluate_every {}".format(max_epochs, evaluate_every))
+
+    records = load_results(results_file)
+    finished = {record['trial']: record for record in records if 'status' in record}
+    settings = dict(
+        rungs=rungs,
+        reduction_factor=reduction_factor,
+        max_epochs=max_epochs,
+        evaluate_every=evaluate_every,
+        num_evaluations=num_evaluations,
+        model_dir=model_dir,
+        network=network,
+        seed=seed,
+        results_file=results_file,
+        deals=deals)
+
+    # spawn instead of fork, tensorflow sessions are not fork safe
+    context = multiprocessing.get_context('spawn')
+    with context.Manager() as manager:
+        # the results of the attempts which did not finish are discarded, their trials are trained again
+        rung_results = manager.dict()
+        for record in records:
+            if 'rung' in record and record['trial'] in finished and record['attempt'] == finished[record['trial']]['attempt']:
+                rung_results[record['rung']] = rung_results.get(record['rung'], []) + [record['win_rate']]
+        lock = manager.Lock()
+
+        trials = [(trial, sample_config(seed + trial), settings, rung_results, lock) for trial in range(num_trials) if trial not in finished]
+        print("Trials: ", num_trials, " finished: ", len(finished), " rungs: ", rungs)
+
+        start_time = time.time()
+        # a process for each trial
+        with context.Pool(num_workers, maxtasksperchild=1) as pool:
+            for record in pool.imap_unordered(trial_worker, trials):
+                finished[record['trial']] = record
+                print("Trial {} {} after {} epochs, best win rate {}, {}/{} trials in {:.0f} s".format(
+                    record['trial'], record['status'], record['epochs'], format_win_rate(record['best_win_rate']), len(finished), num_trials, time.time() - start_time))
+
+    # trials without an evaluation, from a results file of an older search, come last
+    results = sorted(finished.values(), key=lambda record: -1 if record['best_win_rate'] is None else record['best_win_rate'], reverse=True)
+    if results:
+        best = results[0]
+        total_epochs = sum(record['epochs'] for record in results)
+        print("Best trial ", best['trial'], " with win rate " + format_win_rate(best['best_win_rate']), " saved in ", best['model_dir'])
+        print(best['config'])
+        print("Trained epochs: ", total_epochs, " of ", len(results) * max_epochs, " without pruning")
+    return results
+
+
+
+def main(argv=None):
+
+    if FLAGS.deals_file:
+        from evaluate import get_deals
+        deals = get_deals(FLAGS.deals_file, FLAGS.num_deals)
+    else:
+        deals = None
+
+    asha_search(FLAGS.num_trials, FLAGS.num_workers, FLAGS.results_file, FLAGS.min_epochs, FLAGS.max_epochs, FLAGS.reduction_factor,
+                FLAGS.evaluate_every, FLAGS.num_evaluations, FLAGS.model_dir, FLAGS.network, FLAGS.seed, deals)
+
+
+
+if __name__ == '__main__':
+
+    # Parameters
+    # ==================================================
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("--num_trials", default=250, help="Number of configurations sampled from the search space", type=int)
+    parser.add_argument("--num_workers", default=os.cpu_count(), help="Number of trials trained in parallel, each in its own process", type=int)
+    parser.add_argument("--results_file", default="asha_results.jsonl", help="File where the trial results are appended, the search resumes from it", type=str)
+    parser.add_argument("--model_dir", default="asha_models", help="Directory with the best checkpoint of each trial", type=str)
+    parser.add_argument("--seed", default=0, help="Seed of the sampled configurations, trial i uses seed + i", type=int)
+    parser.add_argument("--network", default=NetworkTypes.DQN, choices=[NetworkTypes.DQN, NetworkTypes.DRQN], help="Neural Network used for approximating value function")
+
+    # Successive halving parameters
+    parser.add_argument("--min_epochs", default=5000, help="Training games before the first comparison between trials", type=int)
+    parser.add_argument("--max_epochs", default=30000, help="Training games of a trial which is never stopped", type=int)
+    parser.add_argument("--reduction_factor", default=3, help="Only the best 1 / reduction_factor trials at each rung keep training", type=int)
+    parser.add_argument("--evaluate_every", default=5000, help="Evaluate the trials after this many epochs", type=int)
+    parser.add_argument("--num_evaluations", default=1000, help="Number of evaluation games of each evaluation", type=int)
+    parser.add_argument("--deals_file", default=None, help="Evaluate on a pool of deals (.npy) each played twice with the agents swapping seats, generated if it does not exist", type=str)
+    parser.add_argument("--num_deals", default=500, help="Number of deals of the deals file played in each evaluation", type=int)
+
+    FLAGS = parser.parse_args()
+
+    main()
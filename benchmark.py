@@ -0,0 +1,264 @@
+import argparse
+import random
+import time
+import tracemalloc
+import numpy as np
+
+from agents.random_agent import RandomAgent
+import environment as brisc
+from networks.replay_memory import PrioritizedReplayMemory, ReplayMemory
+from state_encoder import StateEncoder
+from utils import BriscolaLogger, NetworkTypes
+
+
+def extract_deal(game):
+    ''' shuffled deck and starting player of a BriscolaGame which has just been reset'''
+    return list(game.deck.permutation), game.turn_player
+
+
+def validate_batched_game(num_games, num_players=2):
+    ''' play random games with BriscolaGame and replay the same deals and actions
+        with BatchedBriscolaGame, checking that points and winners are identical
+    '''
+    logger = BriscolaLogger(BriscolaLogger.LoggerLevels.TEST)
+    game = brisc.BriscolaGame(num_players, logger)
+
+    num_actions = brisc.DECK_SIZE
+    decks = np.zeros((num_games, brisc.DECK_SIZE), dtype=np.int8)
+    turn_players = np.zeros(num_games, dtype=np.int64)
+    actions = np.zeros((num_games, num_actions), dtype=np.int64)
+    points = np.zeros((num_games, num_players), dtype=np.int64)
+    winners = np.zeros(num_games, dtype=np.int64)
+
+    for i in range(num_games):
+        game.reset()
+        decks[i], turn_players[i] = extract_deal(game)
+
+        step = 0
+        while not game.check_end_game():
+            for player_id in game.get_players_order():
+                action = np.random.choice(game.get_player_actions(player_id))
+                game.play_step(action, player_id)
+                actions[i, step] = action
+                step += 1
+            game.get_rewards_from_step()
+            game.draw_step()
+
+        winners[i], _ = game.end_game()
+        points[i] = [player.points for player in game.players]
+
+    batched_game = brisc.BatchedBriscolaGame(num_games, num_players, logger)
+    batched_game.reset(decks, turn_players)
+
+    step = 0
+    while not batched_game.check_end_game().all():
+        for _ in range(num_players):
+            batched_game.play_step(actions[:, step])
+            step += 1
+        batched_game.get_rewards_from_step()
+        batched_game.draw_step()
+
+    batched_winners, _ = batched_game.end_game()
+
+    if not (batched_game.points == points).all() or not (batched_winners == winners).all():
+        raise AssertionError("BatchedBriscolaGame diverged from BriscolaGame")
+
+    print("BatchedBriscolaGame matches BriscolaGame on", num_games, "games")
+
+
+def validate_evaluation_workers(num_games, num_workers, network):
+    ''' evaluate a QAgent with random weights against AIAgent in this process and with num_workers
+        processes, checking that the seeded results are identical
+    '''
+    from agents.ai_agent import AIAgent
+    from agents.q_agent import QAgent
+    from evaluate import evaluate, EvaluationPool
+
+    logger = BriscolaLogger(BriscolaLogger.LoggerLevels.TEST)
+    game = brisc.BriscolaGame(2, logger)
+
+    agent = QAgent(network=network)
+    agent.q_learning.set_weights([np.random.standard_normal(weights.shape).astype(np.float32) for weights in agent.q_learning.get_weights()])
+    agent.make_greedy()
+    agents = [agent, AIAgent()]
+
+    results = evaluate(game, agents, num_games, seed=0, verbose=False)
+    # every process plays some of the games
+    with EvaluationPool(num_workers, min_games_per_worker=1) as pool:
+        pool_results = evaluate(game, agents, num_games, seed=0, verbose=False, pool=pool)
+
+    if results != pool_results:
+        raise AssertionError("The evaluation with {} processes diverged from the one in this process".format(num_workers))
+
+    print("Evaluation of a", network, "QAgent matches with 0 and", num_workers, "processes on", num_games, "games")
+
+
+def benchmark_scalar_game(num_games, num_players=2):
+    ''' games/sec of play_episode between RandomAgents'''
+    logger = BriscolaLogger(BriscolaLogger.LoggerLevels.TEST)
+    game = brisc.BriscolaGame(num_players, logger)
+    agents = [RandomAgent() for _ in range(num_players)]
+
+    start_time = time.time()
+    for _ in range(num_games):
+        brisc.play_episode(game, agents, train=False)
+    elapsed = time.time() - start_time
+
+    print("BriscolaGame: {:.0f} games/sec".format(num_games / elapsed))
+
+
+def benchmark_batched_game(num_games, num_players=2):
+    ''' games/sec of BatchedBriscolaGame playing random actions'''
+    logger = BriscolaLogger(BriscolaLogger.LoggerLevels.TEST)
+    game = brisc.BatchedBriscolaGame(num_games, num_players, logger)
+
+    start_time = time.time()
+    game.reset()
+    while not game.check_end_game().all():
+        for _ in range(num_players):
+            sizes = game.get_player_actions().sum(axis=1)
+            game.play_step((np.random.random(num_games) * sizes).astype(np.int64))
+        game.get_rewards_from_step()
+        game.draw_step()
+    game.end_game()
+    elapsed = time.time() - start_time
+
+    print("BatchedBriscolaGame: {:.0f} games/sec".format(num_games / elapsed))
+
+
+def benchmark_replay_sampling(capacity, batch_size=100, n_features=70, num_samples=1000):
+    ''' cost of sampling a batch and updating its priorities in a full PrioritizedReplayMemory,
+        compared with the uniform sampling of the DQN replay memory on the same array
+    '''
+    memory = PrioritizedReplayMemory(capacity, n_features)
+    memory.memory[:] = np.random.random(memory.memory.shape)
+    memory.memory_counter = capacity
+    memory.update_priorities(np.arange(capacity), np.random.random(capacity))
+
+    start_time = time.time()
+    for _ in range(num_samples):
+        sample_index = np.random.choice(memory.size(), size=batch_size)
+        batch_memory = memory.memory[sample_index, :]
+    uniform_elapsed = time.time() - start_time
+
+    start_time = time.time()
+    for _ in range(num_samples):
+        batch_memory, sample_index, weights = memory.sample_prioritized(batch_size)
+        memory.update_priorities(sample_index, np.random.random(batch_size))
+    prioritized_elapsed = time.time() - start_time
+
+    print("Replay capacity {}: uniform {:.1f} us/batch, prioritized {:.1f} us/batch".format(
+        capacity, 1e6 * uniform_elapsed / num_samples, 1e6 * prioritized_elapsed / num_samples))
+
+
+def write_transitions(game, encoder, memories, num_games, direct):
+    ''' plays num_games random games writing the transitions of each player in its memory,
+        returns the number of written transitions and the seconds spent writing them.
+        With direct the observations are encoded in place with prepare/commit, otherwise
+        in two alternating buffers and stacked in a transition as QAgent.learn does.
+    '''
+    buffers = np.zeros((game.num_players, 2, encoder.n_features), dtype=np.float32)
+    steps = 0
+    elapsed = 0.
+
+    for _ in range(num_games):
+        game.reset()
+        states = [None] * game.num_players
+        buffer_index = 0
+        end = False
+        while not end:
+            end = game.check_end_game()
+            for player_id in game.get_players_order():
+                player = game.players[player_id]
+
+                start_time = time.perf_counter()
+                last_state = states[player_id]
+                if direct:
+                    last_state, state = memories[player_id].prepare(last_state)
+                    encoder.encode(game, player, out=state)
+                    if states[player_id] is not None:
+                        memories[player_id].commit(0, 0., end)
+                else:
+                    state = encoder.encode(game, player, out=buffers[player_id, buffer_index])
+                    if last_state is not None:
+                        memories[player_id].push(np.hstack((last_state, [0, 0.], state, [end])))
+                elapsed += time.perf_counter() - start_time
+                steps += states[player_id] is not None
+                states[player_id] = state
+
+                if not end:
+                    hand_size = len(player.hand_ids)
+                    game.play_step(random.randrange(hand_size), player_id)
+            buffer_index = 1 - buffer_index
+
+            if not end:
+                game.evaluate_step()
+                game.draw_step()
+
+    return steps, elapsed
+
+
+def benchmark_transition_writes(num_games, capacity=100000):
+    ''' transitions/sec and temporary memory per transition of the replay memory write path,
+        stacking each transition or encoding the observations in place with prepare/commit
+    '''
+    logger = BriscolaLogger(BriscolaLogger.LoggerLevels.TEST)
+    game = brisc.BriscolaGame(2, logger)
+    encoder = StateEncoder()
+
+    for direct in (False, True):
+        memories = [ReplayMemory(capacity, encoder.n_features) for _ in range(game.num_players)]
+        steps, elapsed = write_transitions(game, encoder, memories, num_games, direct)
+
+        # the temporary arrays are measured on a few traced games, tracing slows down the writes
+        tracemalloc.start()
+        traced_steps, _ = write_transitions(game, encoder, memories, max(1, num_games // 100), direct)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        print("{} writes: {:.0f} transitions/sec, {:.1f} us/transition, peak temporary memory {} bytes".format(
+            "In place" if direct else "Stacked", steps / elapsed, 1e6 * elapsed / steps, peak))
+
+
+def main(argv=None):
+
+    if FLAGS.validate:
+        validate_batched_game(FLAGS.num_validations, FLAGS.num_players)
+
+    if FLAGS.validate_evaluation:
+        validate_evaluation_workers(FLAGS.num_validations, FLAGS.evaluation_workers, FLAGS.network)
+
+    benchmark_scalar_game(FLAGS.num_games, FLAGS.num_players)
+    benchmark_batched_game(FLAGS.num_games, FLAGS.num_players)
+
+    if FLAGS.benchmark_replay:
+        for capacity in FLAGS.replay_capacities:
+            benchmark_replay_sampling(capacity, FLAGS.batch_size)
+
+    if FLAGS.benchmark_writes:
+        benchmark_transition_writes(FLAGS.num_games)
+
+
+
+if __name__ == '__main__':
+
+    # Parameters
+    # ==================================================
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("--num_games", default=10000, help="Number of games played by each benchmark", type=int)
+    parser.add_argument("--num_players", default=2, help="Number of players in each game", type=int)
+    parser.add_argument("--validate", action="store_true", help="Check that the batched engine reproduces the scalar one before benchmarking")
+    parser.add_argument("--num_validations", default=1000, help="Number of games used for the validation", type=int)
+    parser.add_argument("--validate_evaluation", action="store_true", help="Check that the seeded evaluation of a QAgent does not depend on the number of evaluation processes")
+    parser.add_argument("--evaluation_workers", default=2, help="Number of processes of the evaluation validation", type=int)
+    parser.add_argument("--network", default=NetworkTypes.DQN, choices=[NetworkTypes.DQN, NetworkTypes.DRQN, NetworkTypes.NUMPY], help="Network of the QAgent of the evaluation validation")
+    parser.add_argument("--benchmark_replay", action="store_true", help="Also measure the sampling cost of the prioritized replay memory")
+    parser.add_argument("--replay_capacities", default=[10000, 100000, 1000000], help="Capacities of the benchmarked replay memories", type=int, nargs='+')
+    parser.add_argument("--benchmark_writes", action="store_true", help="Also measure the cost of writing the transitions in the replay memory")
+    parser.add_argument("--batch_size", default=100, help="Batch size of the replay sampling benchmark", type=int)
+
+    FLAGS = parser.parse_args()
+
+    main()
@@ -0,0 +1,88 @@
+import environment as brisc
+
+
+# python lists versions of the environment tables, faster to index with scalars
+_card_points = brisc.POINTS.tolist()
+_winner_lists = brisc.WINNER_TABLE.tolist()
+
+
+class EndgameSolver:
+    ''' Perfect-information solver for the last turns of a two players game.
+        Once the deck is over each player can deduce the other hand, so the remaining
+        turns are solved by minimax on the points difference, caching solved positions
+        in a transposition table keyed by a compact position hash.
+    '''
+
+    def __init__(self, max_table_size=1000000):
+        self.max_table_size = max_table_size
+        self.transposition_table = {}
+
+
+    def is_solvable(self, game):
+        ''' check if the game is in a perfect-information endgame'''
+        return game.num_players == 2 and game.deck.end_deck
+
+
+    def select_action(self, game, player_id):
+        ''' returns the index in the player hand of the card maximizing the final points difference'''
+        if not self.is_solvable(game):
+            raise ValueError("EndgameSolver.select_action called before the end of the deck")
+
+        if len(self.transposition_table) > self.max_table_size:
+            self.transposition_table = {}
+
+        player = game.players[player_id]
+        other = game.players[1 - player_id]
+        briscola_seed = game.briscola.seed
+        played_card = game.played_ids[0] if game.played_ids else -1
+
+        best_action = 0
+        best_value = None
+        for action, card in enumerate(player.hand_ids):
+            value = self.play_value(briscola_seed, player.hand_mask, other.hand_mask, played_card, card)
+            if best_value is None or value > best_value:
+                best_action = action
+                best_value = value
+
+        return best_action
+
+
+    def solve(self, briscola_seed, hand_mask, other_hand_mask, played_card):
+        ''' best points difference the player to move can obtain from the position.
+            played_card is the card id already played by the other player in this turn, or -1
+        '''
+        if not hand_mask:
+            return 0
+
+        # position hash: two 40 bits masks, the played card and the briscola seed
+        key = (((hand_mask << brisc.DECK_SIZE | other_hand_mask) << 6 | played_card + 1) << 2) | briscola_seed
+        value = self.transposition_table.get(key)
+        if value is not None:
+            return value
+
+        remaining_cards = hand_mask
+        while remaining_cards:
+            card_bit = remaining_cards & -remaining_cards
+            remaining_cards ^= card_bit
+            card_value = self.play_value(briscola_seed, hand_mask, other_hand_mask, played_card, card_bit.bit_length() - 1)
+            if value is None or card_value > value:
+                value = card_value
+
+        self.transposition_table[key] = value
+        return value
+
+
+    def play_value(self, briscola_seed, hand_mask, other_hand_mask, played_card, card):
+        ''' points difference for the player to move after playing card and then playing perfectly'''
+        hand_mask &= ~(1 << card)
+
+        if played_card < 0:
+            # the other player answers to the played card
+            return -self.solve(briscola_seed, other_hand_mask, hand_mask, card)
+
+        points = _card_points[played_card] + _card_points[card]
+        if _winner_lists[briscola_seed][played_card][card]:
+            # the player to move wins the turn and leads the next one
+            return points + self.solve(briscola_seed, hand_mask, other_hand_mask, -1)
+
+        return -points - self.solve(briscola_seed, other_hand_mask, hand_mask, -1)
@@ -1,7 +1,22 @@
 import random
 import numpy as np
 
-from utils import BriscolaLogger
+from utils import BriscolaLogger, CardsOrder
+
+
+# Static description of the deck: card id = seed * 10 + number
+DECK_SIZE = 40
+HAND_SIZE = 3
+SEED_NAMES = ['Spade','Coppe','Denari','Bastoni']
+NUMBER_NAMES = ['Asso', 'Due', 'Tre', 'Quattro', 'Cinque', 'Sei', 'Sette', 'Fante', 'Cavallo', 'Re']
+NUMBER_POINTS = [11,0,10,0,0,0,0,2,3,4]
+NUMBER_STRENGTHS = [9,0,8,1,2,3,4,5,6,7]
+
+# card attributes indexed by card id
+SEED = np.repeat(np.arange(len(SEED_NAMES)), len(NUMBER_NAMES))
+NUMBER = np.tile(np.arange(len(NUMBER_NAMES)), len(SEED_NAMES))
+POINTS = np.array(NUMBER_POINTS)[NUMBER]
+STRENGTH = np.array(NUMBER_STRENGTHS)[NUMBER]
 
 
 class BriscolaCard:
@@ -16,59 +31,95 @@ class BriscolaCard:
 
 
 
+def create_cards():
+    ''' Create all the BriscolaCard, the card with id i is at index i'''
+    cards = []
+    id = 0
+    for s, seed in enumerate(SEED_NAMES):
+        for n, name in enumerate(NUMBER_NAMES):
+            card = BriscolaCard()
+            card.id = id
+            card.name = name + ' di ' + seed
+            card.seed = s
+            card.number = n
+            card.strength = NUMBER_STRENGTHS[n]
+            card.points = NUMBER_POINTS[n]
+            cards.append(card)
+            id += 1
+
+    return tuple(cards)
+
+
+# The game core only handles card ids, these objects are used for displaying and by the agents
+CARDS = create_cards()
+
+# python lists versions of the card attributes, faster to index with scalars
+_card_ids = list(range(DECK_SIZE))
+_card_points = POINTS.tolist()
+_empty_slots = [-1] * DECK_SIZE
+
+# Layout of the flat records of BriscolaGame.snapshot(): the deck permutation, the
+# scalars below, the history padded to DECK_SIZE, the played cards padded to num_players
+# and, for each player, [points, hand_mask, hand length, hand padded to HAND_SIZE, draw index]
+STATE_CURSOR = DECK_SIZE
+STATE_DECK_BRISCOLA = DECK_SIZE + 1
+STATE_END_DECK = DECK_SIZE + 2
+STATE_BRISCOLA = DECK_SIZE + 3
+STATE_TURN_PLAYER = DECK_SIZE + 4
+STATE_SEEN_MASK = DECK_SIZE + 5
+STATE_HISTORY_LENGTH = DECK_SIZE + 6
+STATE_PLAYED_LENGTH = DECK_SIZE + 7
+STATE_HISTORY = DECK_SIZE + 8
+STATE_PLAYED = STATE_HISTORY + DECK_SIZE
+STATE_PLAYER_SIZE = 4 + HAND_SIZE
+
+
+
 class BriscolaDeck:
+    ''' The deck is a preallocated permutation of the card ids:
+        cards are drawn from its end, the first drawn card is placed as briscola
+    '''
 
     def __init__(self):
         self.create_decklist()
+        self.permutation = list(range(DECK_SIZE))
         self.reset()
 
 
     def create_decklist(self):
-        ''' Create all the BriscolaCard and add them to deck'''
-        points = [11,0,10,0,0,0,0,2,3,4]
-        strengths = [9,0,8,1,2,3,4,5,6,7]
-        seeds = ['Spade','Coppe','Denari','Bastoni']
-        names = ['Asso', 'Due', 'Tre', 'Quattro', 'Cinque', 'Sei', 'Sette', 'Fante', 'Cavallo', 'Re']
-
-        self.deck = []
-        id = 0
-        for s, seed in enumerate(seeds):
-            for n, name in enumerate(names):
-                card = BriscolaCard()
-                card.id = id
-                card.name = name + ' di ' + seed
-                card.seed = s
-                card.number = n
-                card.strength = strengths[n]
-                card.points = points[n]
-                self.deck.append(card)
-                id += 1
+        ''' Add all the BriscolaCard to deck'''
+        self.deck = CARDS
 
 
-    def reset(self):
-        ''' Prepare the deck for a new game'''
+    def reset(self, permutation=None):
+        ''' Prepare the deck for a new game, shuffled or in the order of permutation'''
         self.briscola = None
         self.end_deck = False
-        self.current_deck = self.deck.copy()
-        self.shuffle()
+        self.cursor = DECK_SIZE
+        if permutation is None:
+            self.shuffle()
+        else:
+            self.permutation[:] = [int(card_id) for card_id in permutation]
 
 
     def shuffle(self):
         ''' Shuffle the deck'''
-        random.shuffle(self.current_deck)
+        self.permutation[:] = _card_ids
+        random.shuffle(self.permutation)
 
 
     def place_briscola(self, briscola):
-        ''' Set a card as briscola and allows to draw it after last card of the deck'''
+        ''' Set a card id as briscola and allows to draw it after last card of the deck'''
         if self.briscola is not None:
             raise ValueError("Trying BriscolaDeck.place_briscola, but BriscolaDeck.briscola is not None")
         self.briscola = briscola
 
 
     def draw_card(self):
-        ''' If deck is not empty, then draw a card, else return the briscola or nothing'''
-        if self.current_deck:
-            drawn_card =  self.current_deck.pop()
+        ''' If deck is not empty, then draw a card id, else return the briscola or nothing'''
+        if self.cursor:
+            self.cursor -= 1
+            drawn_card = self.permutation[self.cursor]
         else:
             drawn_card = self.briscola
             self.briscola = None
@@ -84,22 +135,40 @@ class BriscolaDeck:
 
     def get_current_deck_size(self):
         '''Size of the current deck'''
-        current_deck_size = len(self.current_deck)
-        current_deck_size += 1 if self.briscola else 0
+        current_deck_size = self.cursor
+        current_deck_size += 1 if self.briscola is not None else 0
         return current_deck_size
 
 
+    @property
+    def current_deck(self):
+        ''' cards still in the deck, excluding the briscola'''
+        return [CARDS[card_id] for card_id in self.permutation[:self.cursor]]
+
+
 
 class BriscolaPlayer:
 
-    def __init__(self, _id):
+    def __init__(self, _id, cards_order=CardsOrder.APPEND):
         self.id = _id
+        self.cards_order = cards_order
+        self.hand_ids = []
         self.reset()
 
 
     def reset(self):
-        self.hand = []
+        # actions are indices in the ordered hand_ids, hand_mask is the same set as a bitmask
+        del self.hand_ids[:]
+        self.hand_mask = 0
         self.points = 0
+        # where the next drawn card is inserted in the hand
+        self.draw_index = HAND_SIZE
+
+
+    @property
+    def hand(self):
+        ''' cards in hand as BriscolaCard'''
+        return [CARDS[card_id] for card_id in self.hand_ids]
 
 
     def draw(self, deck):
@@ -107,18 +176,24 @@ class BriscolaPlayer:
 
         new_card = deck.draw_card()
         if new_card is not None:
-            self.hand.append(new_card)
+            self.hand_ids.insert(self.draw_index, new_card)
+            self.hand_mask |= 1 << new_card
+        self.draw_index = HAND_SIZE
 
-        if len(self.hand) > 3:
+        if len(self.hand_ids) > 3:
             raise ValueError("player.draw caused the player to have more than 3 cards in hand!")
 
 
     def play_card(self, hand_index):
-        ''' Try to play a card from the hand and return the chosen card or None if invalid index'''
+        ''' Try to play a card from the hand and return the chosen card id or None if invalid index'''
 
         try:
-            card = self.hand[hand_index]
-            del self.hand[hand_index]
+            card = self.hand_ids[hand_index]
+            del self.hand_ids[hand_index]
+            self.hand_mask &= ~(1 << card)
+            if self.cards_order == CardsOrder.REPLACE:
+                # the drawn card will take the place of the played one
+                self.draw_index = hand_index
             return card
         except:
             raise ValueError("player.play_card called with invalid hand_index!")
@@ -128,51 +203,74 @@ class BriscolaPlayer:
 
 class BriscolaGame:
 
-    def __init__(self, num_players=2, logger=BriscolaLogger()):
+    def __init__(self, num_players=2, logger=BriscolaLogger(), cards_order=CardsOrder.APPEND):
         self.num_players = num_players
         self.deck = BriscolaDeck()
         self.logger = logger
+        self.cards_order = cards_order
+        self.players = [BriscolaPlayer(i, cards_order) for i in range(self.num_players)]
+        self.history_ids = []
+        self.played_ids = []
 
 
-    def reset(self):
-        ''' starts a new game'''
-        self.deck.reset()
-        self.history = []
-        self.played_cards = []
+    def reset(self, deal=None):
+        ''' starts a new game.
+            deal is an optional (deck, turn_player) pair, the deck permutation and the starting
+            player to replay, by default they are random
+        '''
+        deck, turn_player = deal if deal is not None else (None, None)
+        self.deck.reset(deck)
+        del self.history_ids[:]
+        del self.played_ids[:]
+        # bitmask of the played cards
+        self.seen_mask = 0
 
         # Initilize the players
-        self.players = [BriscolaPlayer(i) for i in range(self.num_players)]
-        self.turn_player = random.randint(0, self.num_players - 1)
+        for player in self.players:
+            player.reset()
+        self.turn_player = random.randint(0, self.num_players - 1) if turn_player is None else int(turn_player)
         self.players_order = self.get_players_order()
 
         # Initialize the briscola
-        self.briscola = self.deck.draw_card()
-        self.deck.place_briscola(self.briscola)
+        self.briscola_id = self.deck.draw_card()
+        self.briscola = CARDS[self.briscola_id]
+        self.deck.place_briscola(self.briscola_id)
 
         for _ in range(0,3):
             for i in self.players_order:
                 self.players[i].draw(self.deck)
 
+        if self.cards_order == CardsOrder.VALUE:
+            for player in self.players:
+                self.reorder_hand(player.id)
+
+
+    @property
+    def played_cards(self):
+        ''' cards played in the current turn as BriscolaCard'''
+        return [CARDS[card_id] for card_id in self.played_ids]
+
+
+    @property
+    def history(self):
+        ''' all the cards played in the game as BriscolaCard'''
+        return [CARDS[card_id] for card_id in self.history_ids]
+
 
     def reorder_hand(self, player_id):
         ''' reorders the cards in a player hand from strongest to weakest,
             taking briscola seed into account
         '''
         player = self.players[player_id]
+        strength_rank = _strength_rank_lists[self.briscola.seed]
 
-        # bubble sort algorithm using scoring() as comparator
-        for passnum in range(len(player.hand)-1,0,-1):
-            for i in range(passnum):
-                if scoring(self.briscola.seed, player.hand[i], player.hand[i+1], keep_order=False):
-                    temp = player.hand[i]
-                    player.hand[i] = player.hand[i+1]
-                    player.hand[i+1] = temp
+        player.hand_ids.sort(key=lambda card_id: strength_rank[card_id], reverse=True)
 
 
     def get_player_actions(self, player_id):
         ''' get list of available actions for a player'''
         player = self.players[player_id]
-        return list(range(len(player.hand)))
+        return list(range(len(player.hand_ids)))
 
 
     def get_players_order(self):
@@ -185,13 +283,16 @@ class BriscolaGame:
         ''' each player, in order, tries to draw a card'''
         self.logger.PVP("----------- NEW TURN -----------")
 
-        self.played_cards = []
+        del self.played_ids[:]
 
         for player_id in self.players_order:
             player = self.players[player_id]
 
             player.draw(self.deck)
 
+            if self.cards_order == CardsOrder.VALUE:
+                self.reorder_hand(player_id)
+
 
 
     def play_step(self, action, player_id):
@@ -199,17 +300,18 @@ class BriscolaGame:
 
         player = self.players[player_id]
 
-        self.logger.DEBUG("Player ", player_id, " hand: ", [card.name for card in player.hand])
+        self.logger.DEBUG("Player ", player_id, " hand: ", player.hand_ids)
         self.logger.DEBUG("Player ", player_id, " choose action ", action)
 
         card = player.play_card(action)
         if card is None:
             raise ValueError("player.play_card failed!")
 
-        self.logger.PVP("Player ", player_id, " played ", card.name)
+        self.logger.PVP("Player ", player_id, " played ", CARDS[card].name)
 
-        self.played_cards.append(card)
-        self.history.append(card)
+        self.played_ids.append(card)
+        self.history_ids.append(card)
+        self.seen_mask |= 1 << card
 
 
     def get_rewards_from_step(self):
@@ -232,15 +334,23 @@ class BriscolaGame:
     def evaluate_step(self):
         ''' look at played cards and decide which player won the hand'''
 
-        ordered_winner_id, strongest_card = get_strongest_card(self.briscola.seed, self.played_cards)
-        winner_player_id = self.players_order[ordered_winner_id]
+        winner_table = _winner_lists[self.briscola.seed]
+        ordered_winner_id = 0
+        strongest_card = self.played_ids[0]
+        points = _card_points[strongest_card]
+        for ordered_id in range(1, len(self.played_ids)):
+            card = self.played_ids[ordered_id]
+            points += _card_points[card]
+            if winner_table[strongest_card][card]:
+                ordered_winner_id = ordered_id
+                strongest_card = card
 
-        points = sum([card.points for card in self.played_cards])
+        winner_player_id = self.players_order[ordered_winner_id]
         winner_player = self.players[winner_player_id]
 
         self.update_game(winner_player, points)
 
-        self.logger.PVP("Player ", winner_player_id, " wins ", points, " points with ", strongest_card.name)
+        self.logger.PVP("Player ", winner_player_id, " wins ", points, " points with ", CARDS[strongest_card].name)
 
         return winner_player_id, points
 
@@ -250,7 +360,7 @@ class BriscolaGame:
         end_deck = self.deck.end_deck
         player_has_cards = False
         for player in self.players:
-            if player.hand:
+            if player.hand_ids:
                 player_has_cards = True
                 break
 
@@ -291,16 +401,343 @@ class BriscolaGame:
         self.players_order = self.get_players_order()
 
 
+    def snapshot(self):
+        ''' flat, fixed-size record of the game state, see the STATE_* layout'''
+        deck = self.deck
+        state = deck.permutation + [
+            deck.cursor,
+            -1 if deck.briscola is None else deck.briscola,
+            int(deck.end_deck),
+            self.briscola_id,
+            self.turn_player,
+            self.seen_mask,
+            len(self.history_ids),
+            len(self.played_ids)]
+
+        state += self.history_ids
+        state += _empty_slots[len(self.history_ids):]
+        state += self.played_ids
+        state += _empty_slots[len(self.played_ids):self.num_players]
+
+        for player in self.players:
+            state += [player.points, player.hand_mask, len(player.hand_ids)]
+            state += player.hand_ids
+            state += _empty_slots[len(player.hand_ids):HAND_SIZE]
+            state.append(player.draw_index)
+
+        return state
+
+
+    def restore(self, state):
+        ''' set the game to a state returned by snapshot()'''
+        deck = self.deck
+        deck.permutation[:] = state[:DECK_SIZE]
+        deck.cursor = state[STATE_CURSOR]
+        deck.briscola = state[STATE_DECK_BRISCOLA] if state[STATE_DECK_BRISCOLA] >= 0 else None
+        deck.end_deck = bool(state[STATE_END_DECK])
+
+        self.briscola_id = state[STATE_BRISCOLA]
+        self.briscola = CARDS[self.briscola_id]
+        self.turn_player = state[STATE_TURN_PLAYER]
+        self.players_order = self.get_players_order()
+        self.seen_mask = state[STATE_SEEN_MASK]
+        self.history_ids[:] = state[STATE_HISTORY:STATE_HISTORY + state[STATE_HISTORY_LENGTH]]
+        self.played_ids[:] = state[STATE_PLAYED:STATE_PLAYED + state[STATE_PLAYED_LENGTH]]
+
+        offset = STATE_PLAYED + self.num_players
+        for player in self.players:
+            player.points = state[offset]
+            player.hand_mask = state[offset + 1]
+            player.hand_ids[:] = state[offset + 3:offset + 3 + state[offset + 2]]
+            player.draw_index = state[offset + 3 + HAND_SIZE]
+            offset += STATE_PLAYER_SIZE
+
+
+    def get_state_size(self):
+        ''' length of the records returned by snapshot()'''
+        return STATE_PLAYED + self.num_players * (1 + STATE_PLAYER_SIZE)
+
+
+    def clone(self):
+        ''' independent copy of the game, sharing the logger'''
+        game = BriscolaGame(self.num_players, self.logger, self.cards_order)
+        game.restore(self.snapshot())
+        return game
+
+
+    def determinize(self, player_id, rng=random):
+        ''' re-deal the cards player_id has not seen (the deck and the other players hands)
+            consistently with what it has observed: the face up briscola is never moved
+        '''
+        deck = self.deck
+        unseen = deck.permutation[:deck.cursor]
+        for player in self.players:
+            if player.id != player_id:
+                unseen += [card for card in player.hand_ids if card != self.briscola_id]
+
+        rng.shuffle(unseen)
+
+        deck.permutation[:deck.cursor] = unseen[:deck.cursor]
+        next_card = deck.cursor
+        for player in self.players:
+            if player.id == player_id:
+                continue
+            hand_mask = 0
+            for i, card in enumerate(player.hand_ids):
+                if card != self.briscola_id:
+                    card = unseen[next_card]
+                    next_card += 1
+                    player.hand_ids[i] = card
+                hand_mask |= 1 << card
+            player.hand_mask = hand_mask
+
+
+
+class BatchedBriscolaGame:
+    ''' Plays num_games independent games in lockstep using numpy arrays.
+        Every game has the same number of turns, so all the games are always at the
+        same turn and at the same position inside the turn: only the cards and the
+        players order differ between games.
+        Cards are represented by their id, empty slots by -1.
+    '''
+
+    def __init__(self, num_games, num_players=2, logger=BriscolaLogger()):
+        if DECK_SIZE % num_players != 0:
+            raise ValueError("BatchedBriscolaGame requires a number of players dividing the deck size")
+
+        self.num_games = num_games
+        self.num_players = num_players
+        self.logger = logger
+        self.games = np.arange(num_games)
+
+        # preallocate the state of all the games
+        self.decks = np.zeros((num_games, DECK_SIZE), dtype=np.int8)
+        self.briscola = np.zeros(num_games, dtype=np.int8)
+        self.hands = np.full((num_games, num_players, HAND_SIZE), -1, dtype=np.int8)
+        self.hand_sizes = np.zeros((num_games, num_players), dtype=np.int8)
+        self.points = np.zeros((num_games, num_players), dtype=np.int32)
+        self.played_cards = np.full((num_games, num_players), -1, dtype=np.int8)
+        self.history = np.full((num_games, DECK_SIZE), -1, dtype=np.int8)
+        self.turn_player = np.zeros(num_games, dtype=np.int64)
+        self.players_order = np.zeros((num_games, num_players), dtype=np.int64)
+
+        # counters shared by all the games
+        self.deck_cursor = 0
+        self.briscola_placed = False
+        self.end_deck = False
+        self.num_played = 0
+        self.history_length = 0
+
+
+    def reset(self, decks=None, turn_players=None):
+        ''' starts num_games new games.
+            decks[i] is the shuffled deck of the i-th game, cards are drawn from its end
+            as in BriscolaDeck.draw_card, turn_players[i] is the player starting it.
+        '''
+        if decks is None:
+            decks = np.argsort(np.random.random((self.num_games, DECK_SIZE)), axis=1)
+        if turn_players is None:
+            turn_players = np.random.randint(0, self.num_players, size=self.num_games)
+
+        self.decks[:] = decks
+        self.deck_cursor = DECK_SIZE
+        self.end_deck = False
+        self.hands.fill(-1)
+        self.hand_sizes.fill(0)
+        self.points.fill(0)
+        self.played_cards.fill(-1)
+        self.num_played = 0
+        self.history.fill(-1)
+        self.history_length = 0
+
+        self.turn_player[:] = turn_players
+        self.players_order = self.get_players_order()
+
+        # the briscola is the first drawn card and it is placed under the deck
+        self.deck_cursor -= 1
+        self.briscola[:] = self.decks[:, self.deck_cursor]
+        self.briscola_placed = True
+
+        for _ in range(0, HAND_SIZE):
+            for i in range(self.num_players):
+                self.draw_cards(self.players_order[:, i])
+
+
+    def restore(self, states):
+        ''' set each game to one of the BriscolaGame.snapshot() records, which have to be
+            at the same turn and at the same position inside the turn
+        '''
+        states = np.asarray(states, dtype=np.int64)
+        if len(states) != self.num_games:
+            raise ValueError("BatchedBriscolaGame.restore requires one state for each game")
+
+        self.decks[:] = states[:, :DECK_SIZE]
+        self.deck_cursor = int(states[0, STATE_CURSOR])
+        self.briscola_placed = bool(states[0, STATE_DECK_BRISCOLA] >= 0)
+        self.end_deck = bool(states[0, STATE_END_DECK])
+        self.briscola[:] = states[:, STATE_BRISCOLA]
+
+        self.turn_player[:] = states[:, STATE_TURN_PLAYER]
+        self.players_order = self.get_players_order()
+
+        self.history_length = int(states[0, STATE_HISTORY_LENGTH])
+        self.history[:] = states[:, STATE_HISTORY:STATE_HISTORY + DECK_SIZE]
+        self.num_played = int(states[0, STATE_PLAYED_LENGTH])
+        self.played_cards[:] = states[:, STATE_PLAYED:STATE_PLAYED + self.num_players]
+
+        players = states[:, STATE_PLAYED + self.num_players:]
+        players = players.reshape(self.num_games, self.num_players, STATE_PLAYER_SIZE)
+        self.points[:] = players[:, :, 0]
+        self.hand_sizes[:] = players[:, :, 2]
+        self.hands[:] = players[:, :, 3:3 + HAND_SIZE]
+
+
+    def get_players_order(self):
+        ''' compute the clockwise players order starting from the current turn player of each game'''
+        return (self.turn_player[:, np.newaxis] + np.arange(self.num_players)) % self.num_players
+
+
+    def get_current_players(self):
+        ''' ids of the players which have to play a card in each game'''
+        return self.players_order[:, self.num_played]
+
+
+    def get_player_actions(self):
+        ''' boolean mask of the available actions of the current players'''
+        sizes = self.hand_sizes[self.games, self.get_current_players()]
+        return np.arange(HAND_SIZE) < sizes[:, np.newaxis]
+
+
+    def draw_cards(self, player_ids):
+        ''' player_ids[i] tries to draw a card in the i-th game'''
+        if self.deck_cursor > 0:
+            self.deck_cursor -= 1
+            cards = self.decks[:, self.deck_cursor]
+        elif self.briscola_placed:
+            cards = self.briscola
+            self.briscola_placed = False
+            self.end_deck = True
+        else:
+            self.end_deck = True
+            return
+
+        sizes = self.hand_sizes[self.games, player_ids]
+        if (sizes >= HAND_SIZE).any():
+            raise ValueError("BatchedBriscolaGame.draw_cards caused a player to have more than 3 cards in hand!")
+
+        self.hands[self.games, player_ids, sizes] = cards
+        self.hand_sizes[self.games, player_ids] += 1
+
+
+    def draw_step(self):
+        ''' each player, in order, tries to draw a card'''
+        self.logger.DEBUG("----------- NEW BATCHED TURN -----------")
+
+        self.played_cards.fill(-1)
+        self.num_played = 0
+
+        for i in range(self.num_players):
+            self.draw_cards(self.players_order[:, i])
+
+
+    def play_step(self, actions):
+        ''' the current player of each game plays the card at index actions[i] of its hand'''
+        actions = np.asarray(actions)
+        player_ids = self.get_current_players()
+
+        hands = self.hands[self.games, player_ids]
+        sizes = self.hand_sizes[self.games, player_ids]
+        if (actions < 0).any() or (actions >= sizes).any():
+            raise ValueError("BatchedBriscolaGame.play_step called with invalid actions!")
+
+        cards = hands[self.games, actions]
+
+        # remove the played cards shifting the following ones to the left
+        slots = np.arange(HAND_SIZE)
+        shifted = np.minimum(slots + (slots >= actions[:, np.newaxis]), HAND_SIZE - 1)
+        hands = np.take_along_axis(hands, shifted, axis=1)
+        hands[self.games, sizes - 1] = -1
+
+        self.hands[self.games, player_ids] = hands
+        self.hand_sizes[self.games, player_ids] -= 1
+
+        self.played_cards[:, self.num_played] = cards
+        self.num_played += 1
+        self.history[:, self.history_length] = cards
+        self.history_length += 1
+
+
+    def get_rewards_from_step(self):
+        ''' compute rewards for each player according to the just played cards.
+            rewards[i, j] is the reward of the j-th player in the new players order of game i
+        '''
+        winner_player_ids, points = self.evaluate_step()
+
+        winners = self.players_order == winner_player_ids[:, np.newaxis]
+        rewards = np.where(winners, points[:, np.newaxis], -points[:, np.newaxis])
+
+        return rewards
+
+
+    def evaluate_step(self):
+        ''' look at played cards and decide which player won the hand in each game'''
+        briscola_seeds = SEED[self.briscola]
+
+        ordered_winner_ids = np.zeros(self.num_games, dtype=np.int64)
+        strongest_cards = self.played_cards[:, 0]
+        for ordered_id in range(1, self.num_played):
+            cards = self.played_cards[:, ordered_id]
+            pair_winners = batched_scoring(briscola_seeds, strongest_cards, cards)
+            ordered_winner_ids = np.where(pair_winners == 1, ordered_id, ordered_winner_ids)
+            strongest_cards = np.where(pair_winners == 1, cards, strongest_cards)
+
+        winner_player_ids = self.players_order[self.games, ordered_winner_ids]
+        points = POINTS[self.played_cards[:, :self.num_played]].sum(axis=1)
+
+        self.update_game(winner_player_ids, points)
+
+        return winner_player_ids, points
+
+
+    def check_end_game(self):
+        ''' check which games are ended'''
+        player_has_cards = self.hand_sizes.any(axis=1)
+        return np.logical_and(self.end_deck, np.logical_not(player_has_cards))
+
+
+    def get_winner(self):
+        ''' returns the player with most points in each game, ties are won by the lowest id'''
+        winner_player_ids = self.points.argmax(axis=1)
+        winner_points = self.points[self.games, winner_player_ids]
+        return winner_player_ids, winner_points
+
+
+    def end_game(self):
+        ''' returns ids of the winners of the games'''
+        if not self.check_end_game().all():
+            raise ValueError('Calling BatchedBriscolaGame.end_game when the games have not ended!')
+
+        return self.get_winner()
+
+
+    def update_game(self, winner_player_ids, points):
+
+        self.points[self.games, winner_player_ids] += points
+
+        self.turn_player[:] = winner_player_ids
+        self.players_order = self.get_players_order()
+
+
 
 def get_strongest_card(briscola_seed, cards):
     ''' Get the strongest card in the provided set'''
+    winner_table = _winner_lists[briscola_seed]
     ordered_winner_id = 0
     strongest_card = cards[0]
 
     for ordered_id, card in enumerate(cards[1:]):
         ordered_id += 1 # adjustment since we are starting from firsr element
-        pair_winner = scoring(briscola_seed, strongest_card, card)
-        if pair_winner is 1:
+        if winner_table[strongest_card.id][card.id]:
             ordered_winner_id = ordered_id
             strongest_card = card
 
@@ -309,13 +746,13 @@ def get_strongest_card(briscola_seed, cards):
 
 def get_weakest_card(briscola_seed, cards):
     ''' Get the weakest card in the provided set'''
+    winner_table = _winner_lists_no_order[briscola_seed]
     ordered_loser_id = 0
     weakest_card = cards[0]
 
     for ordered_id, card in enumerate(cards[1:]):
         ordered_id += 1 # adjustment since we are starting from firsr element
-        pair_winner = scoring(briscola_seed, weakest_card, card, keep_order=False)
-        if pair_winner is 0:
+        if not winner_table[weakest_card.id][card.id]:
             ordered_loser_id = ordered_id
             weakest_card = card
 
@@ -326,23 +763,62 @@ def scoring(briscola_seed, card_0, card_1, keep_order=True):
     ''' compare a pair of cards and decide who wins.
         keep_order variable decides wether the first played card has a priority
     '''
+    if keep_order:
+        return _winner_lists[briscola_seed][card_0.id][card_1.id]
+    return _winner_lists_no_order[briscola_seed][card_0.id][card_1.id]
+
+
+def batched_scoring(briscola_seeds, cards_0, cards_1, keep_order=True):
+    ''' array version of scoring(), cards are given as card ids'''
+    winner_table = WINNER_TABLE if keep_order else WINNER_TABLE_NO_ORDER
+    return winner_table[briscola_seeds, cards_0, cards_1]
+
 
-    if briscola_seed is not card_0.seed and briscola_seed is card_1.seed:
+def _scoring_rule(briscola_seed, card_0, card_1, keep_order):
+    ''' rules of a pair of cards given as ids, used for building the winner tables'''
+
+    if briscola_seed != SEED[card_0] and briscola_seed == SEED[card_1]:
         winner = 1
-    elif briscola_seed is card_0.seed and briscola_seed is not card_1.seed:
+    elif briscola_seed == SEED[card_0] and briscola_seed != SEED[card_1]:
         winner = 0
-    elif card_0.seed is card_1.seed:
-        winner = 1 if card_1.strength > card_0.strength else 0
+    elif SEED[card_0] == SEED[card_1]:
+        winner = 1 if STRENGTH[card_1] > STRENGTH[card_0] else 0
     else:
         # if different seeds and none of them is briscola, first wins
-        winner = 0 if keep_order or card_0.points > card_1.points else 1
+        winner = 0 if keep_order or POINTS[card_0] > POINTS[card_1] else 1
 
     return winner
 
 
-def play_episode(game, agents, train=True):
+def _build_winner_table(keep_order):
+    ''' winner_table[briscola_seed, card_0, card_1] is scoring() of the two cards'''
+    winner_table = np.zeros((len(SEED_NAMES), DECK_SIZE, DECK_SIZE), dtype=np.int8)
+    for briscola_seed in range(len(SEED_NAMES)):
+        for card_0 in range(DECK_SIZE):
+            for card_1 in range(DECK_SIZE):
+                winner_table[briscola_seed, card_0, card_1] = _scoring_rule(briscola_seed, card_0, card_1, keep_order)
+    return winner_table
+
+
+# Precomputed trick resolution: index with [briscola_seed, first_card_id, second_card_id]
+WINNER_TABLE = _build_winner_table(keep_order=True)
+WINNER_TABLE_NO_ORDER = _build_winner_table(keep_order=False)
+
+# STRENGTH_RANK[briscola_seed, card_id]: higher rank means stronger card, briscola cards rank above all the others
+STRENGTH_RANK = STRENGTH + len(NUMBER_NAMES) * (SEED == np.arange(len(SEED_NAMES))[:, np.newaxis])
+
+# python lists versions of the tables, faster to index with scalars
+_winner_lists = WINNER_TABLE.tolist()
+_winner_lists_no_order = WINNER_TABLE_NO_ORDER.tolist()
+_strength_rank_lists = STRENGTH_RANK.tolist()
+
+
+
+def play_episode(game, agents, train=True, deal=None):
 
-    game.reset()
+    game.reset(deal)
+    for agent in agents:
+        agent.start_episode()
     rewards = []
     while not game.check_end_game():
 
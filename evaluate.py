@@ -1,64 +1,525 @@
-import tensorflow as tf
 import argparse
+import math
+import multiprocessing
+import os
+import random
 import numpy as np
 from statistics import mean
 
 from agents.random_agent import RandomAgent
 from agents.ai_agent import AIAgent
-from agents.q_agent import QAgent
+from agents.q_agent import QAgent, layers_from_weights
 from graphic_visualizations import stats_plotter
 import environment as brisc
+from environment import DECK_SIZE
+from networks.replay_memory import EpisodeReplayMemory
 from utils import BriscolaLogger
-from utils import NetworkTypes
+from utils import CardsEncoding, CardsOrder, NetworkTypes, PlayerState
 
 
-def evaluate(game, agents, num_evaluations):
+class PortableQAgent:
+    ''' Picklable copy of a QAgent, its configuration and the weights of its network,
+        rebuilt by build() in an evaluation process. A DQN is rebuilt as a NumpyDQN, all the
+        evaluations play with the copies so that their results do not depend on the processes.
+    '''
 
-    total_wins = [0] * len(agents)
-    points_history = [ [] for i in range(len(agents))]
+    def __init__(self, agent):
+        self.name = agent.name
+        self.network = NetworkTypes.NUMPY if agent.network in (NetworkTypes.DQN, NetworkTypes.NUMPY) else agent.network
+        self.n_features = agent.n_features
+        self.solve_endgame = agent.solve_endgame
+        self.cards_encoding = agent.cards_encoding
+        self.player_state = agent.player_state
+        self.epsilon = agent.epsilon
+        self.weights = agent.q_learning.get_weights()
+        self.layers = layers_from_weights(agent.network, self.weights)
 
-    for _ in range(num_evaluations):
 
-        game_winner_id, winner_points = brisc.play_episode(game, agents, train=False)
+    def config(self):
+        ''' configuration of the network, the copies with the same configuration can share a built agent'''
+        return (self.network, tuple(self.layers), self.n_features, self.solve_endgame, self.cards_encoding, self.player_state)
 
-        for player in game.players:
-            points_history[player.id].append(player.points)
-            if player.id == game_winner_id:
-                total_wins[player.id] += 1
 
-    print("\nTotal wins: ",total_wins)
-    for i in range(len(agents)):
-        print(agents[i].name + " " + str(i) + " won {:.2%}".format(total_wins[i]/num_evaluations), " with average points {:.2f}".format(mean(points_history[i])))
+    def build(self):
+        # the copy never learns, so a recurrent network gets a minimal replay memory
+        replay_memory = EpisodeReplayMemory(1, self.n_features, num_rows=1) if self.network == NetworkTypes.DRQN else None
+        agent = QAgent(network=self.network, layers=self.layers, solve_endgame=self.solve_endgame, cards_encoding=self.cards_encoding, player_state=self.player_state, replay_memory=replay_memory)
+        self.load(agent)
+        return agent
+
+
+    def load(self, agent):
+        ''' sets the weights of an agent built with the same configuration'''
+        agent.q_learning.set_weights(self.weights)
+        agent.name = self.name
+        agent.epsilon = self.epsilon
+
+
+
+def portable_agent(agent):
+    ''' agent which can be sent to an evaluation process, QAgents are sent as PortableQAgent'''
+    if isinstance(agent, QAgent):
+        return PortableQAgent(agent)
+    return agent
+
+
+
+def play_evaluation_games(game, agents, seeds, deals=None):
+    ''' plays a game for each seed, seeding the random generators with it if it is not None.
+        With deals, the i-th game is played on the i-th deal.
+        returns the winner id and the points of each player of each game
+    '''
+    if deals is None:
+        deals = [None] * len(seeds)
+
+    results = []
+    for seed, deal in zip(seeds, deals):
+        if seed is not None:
+            random.seed(seed)
+            np.random.seed(seed)
+
+        game_winner_id, winner_points = brisc.play_episode(game, agents, train=False, deal=deal)
+        results.append((game_winner_id, [player.points for player in game.players]))
+
+    return results
+
+
+
+def play_duplicate_games(game, agents, seeds, deals):
+    ''' plays each deal twice, the second time with the two agents swapping seats,
+        so that each agent plays both hands of the deal.
+        returns for each deal the results of the two games, with winner ids and points
+        referring to the agents and not to the seats
+    '''
+    results = []
+    for seed, deal in zip(seeds, deals):
+        straight, = play_evaluation_games(game, agents, [seed], [deal])
+        (swapped_winner_id, swapped_points), = play_evaluation_games(game, agents[::-1], [seed], [deal])
+        swapped = (1 - swapped_winner_id if swapped_winner_id >= 0 else swapped_winner_id, swapped_points[::-1])
+        results.append((straight, swapped))
+
+    return results
+
+
+
+def play_games(game, agents, seeds, deals=None, duplicate=False):
+    if duplicate:
+        return play_duplicate_games(game, agents, seeds, deals)
+    return play_evaluation_games(game, agents, seeds, deals)
+
+
+
+# games of an evaluation process and agents built from PortableQAgents, kept across the evaluations
+_worker_games = {}
+_evaluation_agents = {}
+
+def evaluation_agent(position, agent):
+    ''' agent playing an evaluation, the network of a PortableQAgent is built only the
+        first time its configuration plays in that position, afterwards only its weights are set
+    '''
+    if not isinstance(agent, PortableQAgent):
+        return agent
+    key = (position,) + agent.config()
+    if key in _evaluation_agents:
+        agent.load(_evaluation_agents[key])
+    else:
+        _evaluation_agents[key] = agent.build()
+    return _evaluation_agents[key]
+
+
+def evaluation_worker(num_players, cards_order, agents, seeds, deals=None, duplicate=False):
+    if (num_players, cards_order) not in _worker_games:
+        logger = BriscolaLogger(BriscolaLogger.LoggerLevels.TEST)
+        _worker_games[num_players, cards_order] = brisc.BriscolaGame(num_players, logger, cards_order)
+    agents = [evaluation_agent(position, agent) for position, agent in enumerate(agents)]
+    return play_games(_worker_games[num_players, cards_order], agents, seeds, deals, duplicate)
+
+
+
+class EvaluationPool:
+    ''' Evaluation processes kept for many evaluations, so that they are spawned, and import
+        tensorflow, once per training run instead of once per evaluation. The agents are sent
+        with the games of each evaluation. The processes are started by the first evaluation with
+        at least min_games_per_worker games for each process, smaller ones are played in this process.
+    '''
+
+    def __init__(self, num_workers, min_games_per_worker=20):
+        self.num_workers = num_workers
+        self.min_games_per_worker = min_games_per_worker
+        self.pool = None
+
+
+    def start(self):
+        if self.pool is None:
+            # spawn instead of fork, tensorflow sessions are not fork safe
+            context = multiprocessing.get_context('spawn')
+            self.pool = context.Pool(self.num_workers)
+        return self
+
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+    def run(self, game, agents, seeds, deals=None, duplicate=False):
+        ''' plays the games of seeds and deals, returns their results in the order of the seeds'''
+        # the games played in this process use the same copies of the QAgents as the processes
+        agents = [portable_agent(agent) for agent in agents]
+        if self.num_workers == 0 or len(seeds) < self.num_workers * self.min_games_per_worker:
+            agents = [evaluation_agent(position, agent) for position, agent in enumerate(agents)]
+            return play_games(game, agents, seeds, deals, duplicate)
+
+        self.start()
+        num_chunks = min(4 * self.num_workers, len(seeds) // self.min_games_per_worker)
+        chunks = [(game.num_players, game.cards_order, agents, seeds[i::num_chunks], deals[i::num_chunks] if deals is not None else None, duplicate)
+                  for i in range(num_chunks)]
+        chunk_results = self.pool.starmap(evaluation_worker, chunks)
+
+        # back to the order of the games
+        results = [None] * len(seeds)
+        for i, chunk_result in enumerate(chunk_results):
+            results[i::num_chunks] = chunk_result
+        return results
+
+
+
+def run_evaluation_games(game, agents, seeds, deals=None, duplicate=False, num_workers=0, pool=None):
+    ''' plays the evaluation games with pool, or in a pool of num_workers processes used only for
+        these games, or in this process. returns the results in the order of the seeds
+    '''
+    if pool is not None:
+        return pool.run(game, agents, seeds, deals, duplicate)
+    with EvaluationPool(num_workers) as pool:
+        return pool.run(game, agents, seeds, deals, duplicate)
+
+
+
+def count_wins(results, num_agents):
+    ''' total wins and points history of each agent from the results of the evaluation games'''
+    total_wins = [0] * num_agents
+    points_history = [ [] for i in range(num_agents)]
+
+    for game_winner_id, points in results:
+        for player_id, player_points in enumerate(points):
+            points_history[player_id].append(player_points)
+            if player_id == game_winner_id:
+                total_wins[player_id] += 1
 
     return total_wins, points_history
 
 
 
+def evaluate(game, agents, num_evaluations, num_workers=0, seed=None, verbose=True, pool=None):
+    ''' plays num_evaluations games between agents, returns the wins and the points history of each agent.
+        If seed is set, the i-th game is played after seeding the random generators with seed + i,
+        so the results are reproducible and do not depend on num_workers; the random generators
+        state is restored afterwards. With num_workers > 0 the games are split among a pool of
+        processes, each playing with copies of the agents; an EvaluationPool passed as pool is
+        used instead, for keeping the processes across evaluations.
+    '''
+    if (num_workers > 0 or pool is not None) and seed is None:
+        # the processes need distinct seeds anyway
+        seed = random.randrange(2**31)
+    seeds = [(seed + i) % 2**32 if seed is not None else None for i in range(num_evaluations)]
+
+    random_state = random.getstate()
+    np_random_state = np.random.get_state()
+
+    results = run_evaluation_games(game, agents, seeds, num_workers=num_workers, pool=pool)
+
+    if seed is not None:
+        random.setstate(random_state)
+        np.random.set_state(np_random_state)
+
+    total_wins, points_history = count_wins(results, len(agents))
+
+    if verbose:
+        print("\nTotal wins: ",total_wins)
+        for i in range(len(agents)):
+            print(agents[i].name + " " + str(i) + " won {:.2%}".format(total_wins[i]/num_evaluations), " with average points {:.2f}".format(mean(points_history[i])))
+
+    return total_wins, points_history
+
+
+
+def generate_deals(num_deals, num_players=2, seed=None):
+    ''' pool of random deals, an int8 array with a row for each deal:
+        the shuffled deck, drawn from its end as in BriscolaDeck.draw_card, followed by the starting player
+    '''
+    generator = np.random.RandomState(seed)
+    deals = np.empty((num_deals, DECK_SIZE + 1), dtype=np.int8)
+    deals[:, :DECK_SIZE] = np.argsort(generator.random_sample((num_deals, DECK_SIZE)), axis=1)
+    deals[:, DECK_SIZE] = generator.randint(0, num_players, size=num_deals)
+    return deals
+
+
+def save_deals(deals, path):
+    np.save(path, deals)
+
+
+def load_deals(path, num_players=2):
+    ''' loads a pool of deals saved by save_deals'''
+    deals = np.load(path)
+    if deals.ndim != 2 or deals.shape[1] != DECK_SIZE + 1 or deals.dtype != np.int8:
+        raise ValueError("load_deals: {} does not contain a pool of deals, found array {} {}".format(path, deals.dtype, deals.shape))
+    if np.any(np.sort(deals[:, :DECK_SIZE], axis=1) != np.arange(DECK_SIZE)):
+        raise ValueError("load_deals: {} contains decks which are not permutations of the cards".format(path))
+    if np.any(deals[:, DECK_SIZE] >= num_players) or np.any(deals[:, DECK_SIZE] < 0):
+        raise ValueError("load_deals: {} contains starting players of games with more than {} players".format(path, num_players))
+    return deals
+
+
+def get_deals(path, num_deals, num_players=2, seed=0):
+    ''' the first num_deals deals of the pool saved in path, which is generated and saved
+        if it does not exist, so every evaluation with the same file plays identical deals
+    '''
+    if os.path.exists(path):
+        deals = load_deals(path, num_players)
+        if num_deals is not None and len(deals) < num_deals:
+            raise ValueError("get_deals: {} contains {} deals, {} requested".format(path, len(deals), num_deals))
+    else:
+        deals = generate_deals(num_deals, num_players, seed)
+        save_deals(deals, path)
+    return deals[:num_deals]
+
+
+
+def duplicate_evaluate(game, agents, deals, num_workers=0, seed=None, verbose=True, pool=None):
+    ''' plays each deal twice with the two agents swapping seats, the same cards and the same
+        starting seat, so the luck of the deal cancels out in the paired score difference, the
+        average of the points difference of agents[0] over the two games.
+        seed, num_workers and pool are as in evaluate.
+        returns the wins and the points history of each agent and the paired differences
+    '''
+    if game.num_players != 2 or len(agents) != 2:
+        raise ValueError("duplicate_evaluate requires a game between two agents")
+
+    num_deals = len(deals)
+    if (num_workers > 0 or pool is not None) and seed is None:
+        seed = random.randrange(2**31)
+    seeds = [(seed + i) % 2**32 if seed is not None else None for i in range(num_deals)]
+    deals = [(deal[:DECK_SIZE], deal[DECK_SIZE]) for deal in deals]
+
+    random_state = random.getstate()
+    np_random_state = np.random.get_state()
+
+    results = run_evaluation_games(game, agents, seeds, deals, duplicate=True, num_workers=num_workers, pool=pool)
+
+    if seed is not None:
+        random.setstate(random_state)
+        np.random.set_state(np_random_state)
+
+    total_wins, points_history = count_wins([result for pair in results for result in pair], 2)
+    differences = np.array([
+        (straight_points[0] - straight_points[1] + swapped_points[0] - swapped_points[1]) / 2
+        for (_, straight_points), (_, swapped_points) in results])
+
+    if verbose:
+        num_games = 2 * num_deals
+        standard_error = differences.std(ddof=1) / math.sqrt(num_deals) if num_deals > 1 else float('inf')
+        print("\nTotal wins: ", total_wins, " in ", num_games, " games on ", num_deals, " duplicate deals")
+        for i in range(len(agents)):
+            print(agents[i].name + " " + str(i) + " won {:.2%}".format(total_wins[i]/num_games), " with average points {:.2f}".format(mean(points_history[i])))
+        print(agents[0].name + " paired score difference {:.2f} +- {:.2f}".format(differences.mean(), 1.96 * standard_error))
+
+    return total_wins, points_history, differences
+
+
+
+def wilson_interval(wins, num_games, z=1.96):
+    ''' confidence interval of a win rate, 95% by default'''
+    if num_games == 0:
+        return 0., 1.
+    win_rate = wins / num_games
+    center = (win_rate + z**2 / (2 * num_games)) / (1 + z**2 / num_games)
+    half_width = z * math.sqrt(win_rate * (1 - win_rate) / num_games + z**2 / (4 * num_games**2)) / (1 + z**2 / num_games)
+    return center - half_width, center + half_width
+
+
+
+def sequential_evaluate(game, agents, baseline, max_evaluations, delta=0.05, alpha=0.05, beta=0.05, batch_size=20, num_workers=0, seed=None, pool=None):
+    ''' decides if the win rate of agents[0] is better than the baseline win rate playing only the
+        games needed by a sequential probability ratio test of baseline - delta against baseline + delta,
+        with alpha and beta error probabilities. Games are played in batches of batch_size and at most
+        max_evaluations are played, then the decision is whether the win rate is above the baseline.
+        Without a baseline all the max_evaluations games are played and the agent is better.
+        With num_workers > 0 or an EvaluationPool, all the batches are played by the same processes,
+        each playing batch_size games of every batch.
+        returns (better, win rate, 95% confidence interval of the win rate, number of games)
+    '''
+    if pool is None and num_workers > 0:
+        with EvaluationPool(num_workers) as pool:
+            return sequential_evaluate(game, agents, baseline, max_evaluations, delta, alpha, beta, batch_size, seed=seed, pool=pool)
+
+    if pool is not None and pool.num_workers > 0:
+        batch_size *= pool.num_workers
+        if seed is None:
+            # consecutive batches play distinct seeds
+            seed = random.randrange(2**31)
+
+    if baseline is None:
+        batch_size = max_evaluations
+
+    # log likelihood ratio bounds, a win adds log(p1 / p0) and another result log((1 - p1) / (1 - p0))
+    if baseline is not None:
+        p0 = min(max(baseline - delta, 1e-3), 1 - 1e-3)
+        p1 = min(max(baseline + delta, 1e-3), 1 - 1e-3)
+        upper = math.log((1 - beta) / alpha)
+        lower = math.log(beta / (1 - alpha))
+
+    wins = 0
+    num_games = 0
+    better = None
+    while num_games < max_evaluations and better is None:
+        num_batch_games = min(batch_size, max_evaluations - num_games)
+        batch_seed = seed + num_games if seed is not None else None
+        total_wins, _ = evaluate(game, agents, num_batch_games, seed=batch_seed, verbose=False, pool=pool)
+        wins += total_wins[0]
+        num_games += num_batch_games
+
+        if baseline is None:
+            better = True
+        elif p1 > p0:
+            log_likelihood_ratio = wins * math.log(p1 / p0) + (num_games - wins) * math.log((1 - p1) / (1 - p0))
+            if log_likelihood_ratio >= upper:
+                better = True
+            elif log_likelihood_ratio <= lower:
+                better = False
+
+    win_rate = wins / num_games
+    if better is None:
+        better = win_rate > baseline
+    interval = wilson_interval(wins, num_games)
+
+    print("\n" + agents[0].name + " won {:.2%} [{:.2%}, {:.2%}] of {} games".format(win_rate, *interval, num_games),
+          "better" if better else "not better", "than {:.2%}".format(baseline) if baseline is not None else "")
+
+    return better, win_rate, interval, num_games
+
+
+
+class CheckpointEvaluator:
+    ''' Evaluates the agents[0] trained against agents[1] and keeps track of its best checkpoint.
+        An evaluation plays num_evaluations games, or with sequential only the games needed by
+        sequential_evaluate for comparing the agent with the best checkpoint, followed by
+        num_evaluations games confirming a better agent, so that the win rate of the best checkpoint,
+        which is the baseline of the next tests, is never an early stopped estimate. With deals the
+        deals played twice by duplicate_evaluate, where the best checkpoint is the one with the
+        best paired score difference. The num_workers evaluation processes are kept until close().
+    '''
+
+    def __init__(self, num_evaluations, num_workers=0, sequential=False, deals=None):
+        if sequential and deals is not None:
+            raise ValueError("CheckpointEvaluator: the sequential evaluation does not play duplicate deals")
+        self.num_evaluations = num_evaluations
+        self.sequential = sequential
+        self.deals = deals
+        self.pool = EvaluationPool(num_workers)
+
+        self.best_win_rate = None
+        self.best_difference = None
+        self.evaluation_games = 0
+
+
+    def close(self):
+        self.pool.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+    def evaluate(self, game, agents):
+        ''' evaluates the greedy agents, returns if agents[0] is better than the best checkpoint and its win rate'''
+        for agent in agents:
+            agent.make_greedy()
+
+        if self.sequential:
+            # play only the games needed for deciding if the agent is better than the best checkpoint
+            better, win_rate, interval, num_games = sequential_evaluate(game, agents, self.best_win_rate, self.num_evaluations, pool=self.pool)
+            if better and self.best_win_rate is not None:
+                # the test may have stopped after a few lucky games
+                total_wins, points_history = evaluate(game, agents, self.num_evaluations, verbose=False, pool=self.pool)
+                num_games += self.num_evaluations
+                win_rate = total_wins[0] / self.num_evaluations
+                better = win_rate > self.best_win_rate
+                print(agents[0].name + " won {:.2%} of {} confirmation games".format(win_rate, self.num_evaluations))
+        elif self.deals is not None:
+            # every checkpoint plays the same deals, it is better if its paired score difference is
+            total_wins, points_history, differences = duplicate_evaluate(game, agents, self.deals, pool=self.pool)
+            num_games = 2 * len(self.deals)
+            win_rate = total_wins[0] / num_games
+            better = self.best_difference is None or differences.mean() > self.best_difference
+            if better:
+                self.best_difference = differences.mean()
+        else:
+            total_wins, points_history = evaluate(game, agents, self.num_evaluations, pool=self.pool)
+            num_games = self.num_evaluations
+            win_rate = total_wins[0] / num_games
+            better = self.best_win_rate is None or win_rate > self.best_win_rate
+
+        for agent in agents:
+            agent.restore_epsilon()
+
+        self.evaluation_games += num_games
+        if better:
+            self.best_win_rate = win_rate
+        return better, win_rate
+
+
+
 def main(argv=None):
     '''Evaluate agent performances against RandomAgent and AIAgent'''
 
     logger = BriscolaLogger(BriscolaLogger.LoggerLevels.TEST)
-    game = brisc.BriscolaGame(2, logger)
+    game = brisc.BriscolaGame(2, logger, FLAGS.cards_order)
 
     # agent to be evaluated is RandomAgent or QAgent if a model is provided
     if FLAGS.model_dir:
-        eval_agent = QAgent(network=FLAGS.network)
+        eval_agent = QAgent(network=FLAGS.network, solve_endgame=FLAGS.solve_endgame, cards_encoding=FLAGS.cards_encoding, player_state=FLAGS.player_state)
         eval_agent.load_model(FLAGS.model_dir)
         eval_agent.make_greedy()
     else:
         eval_agent = RandomAgent()
 
-    # test agent against RandomAgent
-    agents = [eval_agent, RandomAgent()]
+    # every agent evaluated with the same deals file plays the same games
+    if FLAGS.deals_file:
+        deals = get_deals(FLAGS.deals_file, FLAGS.num_deals)
 
-    total_wins, points_history = evaluate(game, agents, FLAGS.num_evaluations)
-    stats_plotter(agents, points_history, total_wins)
+    # the evaluation processes are spawned once for both opponents
+    with EvaluationPool(FLAGS.num_workers) as evaluation_pool:
+        # test agent against RandomAgent
+        agents = [eval_agent, RandomAgent()]
 
-    # test agent against AIAgent
-    agents = [eval_agent, AIAgent()]
+        if FLAGS.deals_file:
+            total_wins, points_history, differences = duplicate_evaluate(game, agents, deals, seed=FLAGS.seed, pool=evaluation_pool)
+        else:
+            total_wins, points_history = evaluate(game, agents, FLAGS.num_evaluations, seed=FLAGS.seed, pool=evaluation_pool)
+        stats_plotter(agents, points_history, total_wins)
 
-    total_wins, points_history = evaluate(game, agents, FLAGS.num_evaluations)
-    stats_plotter(agents, points_history, total_wins)
+        # test agent against AIAgent
+        agents = [eval_agent, AIAgent()]
+
+        if FLAGS.deals_file:
+            total_wins, points_history, differences = duplicate_evaluate(game, agents, deals, seed=FLAGS.seed, pool=evaluation_pool)
+        else:
+            total_wins, points_history = evaluate(game, agents, FLAGS.num_evaluations, seed=FLAGS.seed, pool=evaluation_pool)
+        stats_plotter(agents, points_history, total_wins)
 
 
 
@@ -70,12 +531,22 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser()
 
     parser.add_argument("--model_dir", default=None, help="Provide a trained model path if you want to play against a deep agent", type=str)
-    parser.add_argument("--network", default=NetworkTypes.DRQN, choices=[NetworkTypes.DQN, NetworkTypes.DRQN], help="Neural Network used for approximating value function")
+    parser.add_argument("--network", default=NetworkTypes.DRQN, choices=[NetworkTypes.DQN, NetworkTypes.DRQN, NetworkTypes.NUMPY], help="Neural Network used for approximating value function, numpy for a DQN model exported by export_numpy.py")
+    parser.add_argument("--solve_endgame", action="store_true", help="Let the evaluated deep agent play the last turns with the endgame solver")
     parser.add_argument("--num_evaluations", default=20, help="Number of evaluation games against each type of opponent for each test", type=int)
+    parser.add_argument("--num_workers", default=0, help="Number of processes playing the evaluation games, 0 plays them in this process", type=int)
+    parser.add_argument("--seed", default=None, help="Seed of the evaluation games, the results do not depend on the number of processes", type=int)
+    parser.add_argument("--deals_file", default=None, help="Pool of deals (.npy) each played twice with the agents swapping seats, generated if it does not exist", type=str)
+    parser.add_argument("--num_deals", default=500, help="Number of deals of the deals file played against each type of opponent", type=int)
+
+    # State parameters
+    parser.add_argument("--cards_order", default=CardsOrder.APPEND, choices=[CardsOrder.APPEND, CardsOrder.REPLACE, CardsOrder.VALUE], help="Where a drawn card is put in the hand")
+    parser.add_argument("--cards_encoding", default=CardsEncoding.HOT_ON_NUM_SEED, choices=[CardsEncoding.HOT_ON_DECK, CardsEncoding.HOT_ON_NUM_SEED], help="How to encode cards")
+    parser.add_argument("--player_state", default=PlayerState.HAND_PLAYED_BRISCOLA, choices=[PlayerState.HAND_PLAYED_BRISCOLA, PlayerState.HAND_PLAYED_BRISCOLASEED, PlayerState.HAND_PLAYED_BRISCOLA_HISTORY], help="Which cards to encode in the player state")
 
     FLAGS = parser.parse_args()
 
-    tf.app.run()
+    main()
 
 
 
@@ -0,0 +1,43 @@
+import argparse
+
+from agents.q_agent import QAgent
+from networks.numpy_dqn import NumpyDQN
+from utils import CardsEncoding, NetworkTypes, PlayerState
+
+
+def export_numpy(model_dir, output_dir, cards_encoding=CardsEncoding.HOT_ON_NUM_SEED, player_state=PlayerState.HAND_PLAYED_BRISCOLA):
+    ''' exports the evaluation network weights of a trained DQN model to a NumpyDQN model'''
+    agent = QAgent(network=NetworkTypes.DQN, cards_encoding=cards_encoding, player_state=player_state)
+    agent.load_model(model_dir)
+
+    network = NumpyDQN.from_weights(agent.q_learning.get_weights())
+    network.save_model(output_dir)
+    return network
+
+
+
+def main(argv=None):
+
+    output_dir = FLAGS.output_dir if FLAGS.output_dir else FLAGS.model_dir
+    network = export_numpy(FLAGS.model_dir, output_dir, FLAGS.cards_encoding, FLAGS.player_state)
+    print("Exported a NumpyDQN with layers", network.layers, "to", output_dir)
+
+
+
+if __name__ == '__main__':
+
+    # Parameters
+    # ==================================================
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("--model_dir", default="saved_model", help="Trained DQN model to export", type=str)
+    parser.add_argument("--output_dir", default=None, help="Where to save the NumpyDQN model, by default in model_dir", type=str)
+
+    # State parameters
+    parser.add_argument("--cards_encoding", default=CardsEncoding.HOT_ON_NUM_SEED, choices=[CardsEncoding.HOT_ON_DECK, CardsEncoding.HOT_ON_NUM_SEED], help="How to encode cards")
+    parser.add_argument("--player_state", default=PlayerState.HAND_PLAYED_BRISCOLA, choices=[PlayerState.HAND_PLAYED_BRISCOLA, PlayerState.HAND_PLAYED_BRISCOLASEED, PlayerState.HAND_PLAYED_BRISCOLA_HISTORY], help="Which cards to encode in the player state")
+
+    FLAGS = parser.parse_args()
+
+    main()
@@ -1,35 +1,45 @@
-import tensorflow as tf
 import argparse
 
 from agents.ai_agent import AIAgent
 from agents.q_agent import QAgent
 from agents.human_agent import HumanAgent
+from agents.ismcts_agent import ISMCTSAgent
+from agents.pimc_agent import PIMCAgent
 
 import environment as brisc
 from utils import BriscolaLogger
-from utils import NetworkTypes
+from utils import CardsEncoding, CardsOrder, NetworkTypes, PlayerState
 
 def main(argv=None):
 
     # Initializing the environment
     logger = BriscolaLogger(BriscolaLogger.LoggerLevels.PVP)
-    game = brisc.BriscolaGame(2, logger)
+    game = brisc.BriscolaGame(2, logger, FLAGS.cards_order)
 
     # Initialize agents
     agents = []
     agents.append(HumanAgent())
 
     if FLAGS.model_dir:
-        agent = QAgent(network=FLAGS.network)
+        agent = QAgent(network=FLAGS.network, cards_encoding=FLAGS.cards_encoding, player_state=FLAGS.player_state)
         agent.load_model(FLAGS.model_dir)
         agent.make_greedy()
         agents.append(agent)
+    elif FLAGS.opponent == 'ismcts':
+        agent = ISMCTSAgent(FLAGS.search_iterations, FLAGS.search_time)
+        agents.append(agent)
+    elif FLAGS.opponent == 'pimc':
+        agent = PIMCAgent(FLAGS.search_iterations, time_budget=FLAGS.search_time)
+        agents.append(agent)
     else:
         agent = AIAgent()
         agents.append(agent)
 
     brisc.play_episode(game, agents, train=False)
 
+    if isinstance(agent, ISMCTSAgent) and agent.total_time:
+        print("ISMCTSAgent searched {:.0f} nodes/sec".format(agent.total_nodes / agent.total_time))
+
 
 
 if __name__ == '__main__':
@@ -40,10 +50,18 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser()
 
     parser.add_argument("--model_dir", default=None, help="Provide a trained model path if you want to play against a deep agent", type=str)
-    parser.add_argument("--network", default=NetworkTypes.DRQN, choices=[NetworkTypes.DQN, NetworkTypes.DRQN], help="Neural Network used for approximating value function")
+    parser.add_argument("--opponent", default='ai', choices=['ai', 'pimc', 'ismcts'], help="Opponent used when no trained model is provided")
+    parser.add_argument("--search_iterations", default=1000, help="Iterations (ismcts) or determinizations (pimc) of the search opponent for each move", type=int)
+    parser.add_argument("--search_time", default=None, help="Maximum seconds spent by the search opponent for each move", type=float)
+    parser.add_argument("--network", default=NetworkTypes.DRQN, choices=[NetworkTypes.DQN, NetworkTypes.DRQN, NetworkTypes.NUMPY], help="Neural Network used for approximating value function, numpy for a DQN model exported by export_numpy.py")
+
+    # State parameters
+    parser.add_argument("--cards_order", default=CardsOrder.APPEND, choices=[CardsOrder.APPEND, CardsOrder.REPLACE, CardsOrder.VALUE], help="Where a drawn card is put in the hand")
+    parser.add_argument("--cards_encoding", default=CardsEncoding.HOT_ON_NUM_SEED, choices=[CardsEncoding.HOT_ON_DECK, CardsEncoding.HOT_ON_NUM_SEED], help="How to encode cards")
+    parser.add_argument("--player_state", default=PlayerState.HAND_PLAYED_BRISCOLA, choices=[PlayerState.HAND_PLAYED_BRISCOLA, PlayerState.HAND_PLAYED_BRISCOLASEED, PlayerState.HAND_PLAYED_BRISCOLA_HISTORY], help="Which cards to encode in the player state")
 
     FLAGS = parser.parse_args()
 
-    tf.app.run()
+    main()
 
 
@@ -51,11 +51,10 @@ def train_agent(hype_space):
     agents.append(agent)
     agents.append(RandomAgent())
 
-    best_total_wins = train(game, agents, NUM_EPOCHS, EVALUATE_EVERY, EVALUATE_FOR, MODEL_DIR)
+    best_win_rate = train(game, agents, NUM_EPOCHS, EVALUATE_EVERY, EVALUATE_FOR, MODEL_DIR)
 
-    print ("Best total wins ----->", best_total_wins)
-    best_total_loses = EVALUATE_FOR - best_total_wins
-    return best_total_loses
+    print ("Best win rate ----->", best_win_rate)
+    return 1 - best_win_rate
 
 
 
@@ -0,0 +1,267 @@
+import collections
+import queue
+import threading
+import time
+import numpy as np
+
+import environment as brisc
+from state_encoder import StateEncoder
+from utils import BriscolaLogger, CardsEncoding, CardsOrder, PlayerState
+
+
+class _Request:
+
+    __slots__ = ('state', 'actions', 'start', 'event', 'result', 'error')
+
+    def __init__(self, state, actions):
+        self.state = state
+        self.actions = actions
+        self.start = time.perf_counter()
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+
+class InferenceBroker:
+    ''' Serves the q values of a DQN to many games played concurrently.
+        Threads submit their states and wait, a broker thread collects the pending requests
+        (up to max_batch_size, waiting at most max_wait seconds for more of them) and runs a
+        single forward pass for all of them. Batched games can call select_actions directly.
+        Batch sizes and requests latencies are recorded for report().
+    '''
+
+    def __init__(self, network, max_batch_size=256, max_wait=1e-3, max_latencies=100000):
+        if not hasattr(network, 'get_q_tables'):
+            raise ValueError("InferenceBroker requires a network with batched inference, recurrent networks are not supported")
+
+        self.network = network
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+
+        # preallocated batch, the states are copied in it before the forward pass
+        self.states = np.zeros((max_batch_size, network.n_features), dtype=np.float32)
+        self.masks = np.zeros((max_batch_size, network.n_actions), dtype=bool)
+
+        self.requests = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+        # statistics
+        self.batch_sizes = collections.Counter()
+        self.latencies = collections.deque(maxlen=max_latencies)
+        self.num_requests = 0
+        self.num_batches = 0
+
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+        return self
+
+
+    def close(self):
+        if self.thread is not None:
+            self.requests.put(None)
+            self.thread.join()
+            self.thread = None
+
+
+    def __enter__(self):
+        return self.start()
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+    def submit(self, state, actions):
+        if self.thread is None:
+            raise RuntimeError("InferenceBroker used before being started")
+        request = _Request(state, actions)
+        self.requests.put(request)
+        request.event.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+
+    def get_q_table(self, state):
+        ''' q values of a state, computed in the next batch'''
+        return self.submit(state, None)
+
+
+    def select_action(self, state, available_actions):
+        ''' available action with the highest q value, computed in the next batch'''
+        return self.submit(state, available_actions)
+
+
+    def select_actions(self, states, masks):
+        ''' greedy actions of a batch of states, masks are the legal actions of each state'''
+        start = time.perf_counter()
+        with self.lock:
+            q = self.network.get_q_tables(states)
+        actions = np.where(masks, q, -np.inf).argmax(axis=1)
+        self.record(len(states), [start])
+        return actions
+
+
+    def run(self):
+        stop = False
+        while not stop:
+            request = self.requests.get()
+            if request is None:
+                break
+            batch = [request]
+
+            # collect the requests arriving within max_wait
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                try:
+                    request = self.requests.get(timeout=max(0., deadline - time.perf_counter()))
+                except queue.Empty:
+                    break
+                if request is None:
+                    stop = True
+                    break
+                batch.append(request)
+
+            self.serve(batch)
+
+
+    def serve(self, batch):
+        size = len(batch)
+        states = self.states[:size]
+        masks = self.masks[:size]
+        for i, request in enumerate(batch):
+            states[i] = request.state
+            if request.actions is None:
+                masks[i] = True
+            else:
+                masks[i] = False
+                masks[i, request.actions] = True
+
+        try:
+            with self.lock:
+                q = self.network.get_q_tables(states)
+            actions = np.where(masks, q, -np.inf).argmax(axis=1)
+        except Exception as error:
+            for request in batch:
+                request.error = error
+                request.event.set()
+            return
+
+        for i, request in enumerate(batch):
+            request.result = q[i] if request.actions is None else int(actions[i])
+        self.record(size, [request.start for request in batch])
+        for request in batch:
+            request.event.set()
+
+
+    def record(self, size, starts):
+        end = time.perf_counter()
+        self.batch_sizes[size] += 1
+        self.num_batches += 1
+        self.num_requests += len(starts)
+        self.latencies.extend(end - start for start in starts)
+
+
+    def report(self):
+        ''' returns and prints the batch sizes histogram and the latency percentiles in ms'''
+        latencies = 1e3 * np.array(self.latencies) if self.latencies else np.zeros(1)
+        stats = {
+            'requests': self.num_requests,
+            'batches': self.num_batches,
+            'mean_batch_size': self.num_requests / max(1, self.num_batches),
+            'batch_sizes': dict(sorted(self.batch_sizes.items())),
+            'latency_ms': {percentile: float(np.percentile(latencies, percentile)) for percentile in (50, 90, 99)},
+        }
+
+        print("Inference requests: ", stats['requests'], " batches: ", stats['batches'], " mean batch size: {:.1f}".format(stats['mean_batch_size']))
+        print("Latency ms p50: {:.3f} p90: {:.3f} p99: {:.3f}".format(*stats['latency_ms'].values()))
+        # histogram with power of two buckets
+        buckets = collections.Counter()
+        for size, count in self.batch_sizes.items():
+            buckets[1 << (size.bit_length() - 1)] += count
+        for low, count in sorted(buckets.items()):
+            print("  batch size {:4d}-{:<4d}: {}".format(low, 2 * low - 1, count))
+
+        return stats
+
+
+
+class BrokerAgent:
+    ''' Greedy agent selecting its actions with an InferenceBroker, a lightweight player
+        for running many concurrent games on the network of the broker
+    '''
+
+    def __init__(self, broker, cards_encoding=CardsEncoding.HOT_ON_NUM_SEED, player_state=PlayerState.HAND_PLAYED_BRISCOLA):
+        self.name = 'BrokerAgent'
+        self.broker = broker
+        # each agent has its own encoder, encoders have scratch buffers and are not thread safe
+        self.encoder = StateEncoder(cards_encoding, player_state)
+        self.state = np.zeros(self.encoder.n_features, dtype=np.float32)
+
+    def observe(self, game, player):
+        self.encoder.encode(game, player, out=self.state)
+
+    def select_action(self, actions):
+        return self.broker.select_action(self.state, actions)
+
+    def start_episode(self):
+        pass
+
+    def update(self, reward):
+        pass
+
+    def make_greedy(self):
+        pass
+
+    def restore_epsilon(self):
+        pass
+
+
+
+def evaluate_concurrent(broker, make_opponent, num_games, num_threads, cards_encoding=CardsEncoding.HOT_ON_NUM_SEED, player_state=PlayerState.HAND_PLAYED_BRISCOLA, cards_order=CardsOrder.APPEND):
+    ''' plays num_games between BrokerAgents and the opponents returned by make_opponent()
+        in num_threads threads, so that the broker batches the moves of concurrent games.
+        returns the total wins and the points history of the two players, as evaluate
+    '''
+    total_wins = [0, 0]
+    points_history = [[], []]
+    results_lock = threading.Lock()
+    games_per_thread = [num_games // num_threads + (i < num_games % num_threads) for i in range(num_threads)]
+    errors = []
+
+    def play(num_thread_games):
+        try:
+            logger = BriscolaLogger(BriscolaLogger.LoggerLevels.TEST)
+            game = brisc.BriscolaGame(2, logger, cards_order)
+            agents = [BrokerAgent(broker, cards_encoding, player_state), make_opponent()]
+            for _ in range(num_thread_games):
+                game_winner_id, winner_points = brisc.play_episode(game, agents, train=False)
+                with results_lock:
+                    for player in game.players:
+                        points_history[player.id].append(player.points)
+                    if game_winner_id >= 0:
+                        total_wins[game_winner_id] += 1
+        except Exception as error:
+            errors.append(error)
+
+    started = broker.thread is None
+    broker.start()
+    try:
+        threads = [threading.Thread(target=play, args=(n,)) for n in games_per_thread]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        if started:
+            broker.close()
+
+    if errors:
+        raise errors[0]
+
+    return total_wins, points_history
@@ -1,6 +1,8 @@
 import tensorflow as tf
 import os
 
+from networks.replay_memory import load_replay_snapshot, save_replay_snapshot
+
 
 class BaseNetwork:
 
@@ -23,15 +25,49 @@ class BaseNetwork:
 
         self.session.run(self.init)
 
+        # assign operations used by set_weights, created on first use
+        self.assign_ops = {}
+
+        # inference operations, resolved by name on first use since loading a model replaces the graph
+        self.inference_ops = None
+
+
+    def start_episode(self):
+        '''Called at the beginning of each episode, networks with a recurrent state reset it'''
+        pass
+
+
+    def observe_state(self, state):
+        '''Called with each observed state, recurrent networks keep the states of the episode'''
+        pass
+
+
+    def get_weights(self, scope='eval_net'):
+        '''Returns the values of the trainable variables in scope as a list of numpy arrays'''
+        variables = self.graph.get_collection(tf.GraphKeys.TRAINABLE_VARIABLES, scope=scope)
+        return self.session.run(variables)
+
+
+    def set_weights(self, weights, scope='eval_net'):
+        '''Assign a list of numpy arrays returned by get_weights to the trainable variables in scope'''
+        if scope not in self.assign_ops:
+            with self.graph.as_default():
+                variables = tf.get_collection(tf.GraphKeys.TRAINABLE_VARIABLES, scope=scope)
+                placeholders = [tf.placeholder(variable.dtype.base_dtype, variable.shape) for variable in variables]
+                operations = [tf.assign(variable, placeholder) for variable, placeholder in zip(variables, placeholders)]
+            self.assign_ops[scope] = (placeholders, operations)
+
+        placeholders, operations = self.assign_ops[scope]
+        self.session.run(operations, feed_dict=dict(zip(placeholders, weights)))
+
 
     def save_model(self, output_dir):
         '''Save the network graph and weights to disk'''
         if not output_dir:
             raise ValueError('You have to specify a valid output directory for DeepAgent.save_model')
 
-        if not os.path.exists(output_dir):
-            # if provided output_dir does not already exists, create it
-            os.mkdir(output_dir)
+        # if provided output_dir does not already exists, create it with its parents
+        os.makedirs(output_dir, exist_ok=True)
 
         self.saver.save(self.session, './' + output_dir + '/')
 
@@ -45,3 +81,14 @@ class BaseNetwork:
 
         self.initialize_session()
         self.saver.restore(self.session, './' + saved_model_dir + '/')
+
+
+    def save_replay_memory(self, output_dir):
+        '''Save a snapshot of the replay memory and of the training steps counter to disk'''
+        save_replay_snapshot(self.replay_memory, output_dir, learn_step_counter=self.learn_step_counter)
+
+
+    def load_replay_memory(self, snapshot_dir):
+        '''Memory map a replay memory snapshot, training resumes from its training steps counter'''
+        counters = load_replay_snapshot(self.replay_memory, snapshot_dir)
+        self.learn_step_counter = counters['learn_step_counter']
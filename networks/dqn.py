@@ -6,48 +6,12 @@ import tensorflow as tf
 import random
 
 from networks.base_network import BaseNetwork
-
-class ReplayMemory:
-
-    def __init__(self, capacity, n_features):
-
-        # initialize zero memory, each sample in memory has size [s + a + r + s_ + t]
-        # where s and s_ are 1xn_features, a r t are scalar
-
-        self.capacity = capacity
-        self.event_size = n_features * 2 + 3
-        self.memory = np.zeros((self.capacity, self.event_size))
-        self.memory_counter = 0
-
-    def push(self, item):
-        # get the index where to insert the event
-        index = self.memory_counter % self.capacity
-        self.memory[index, :] = item
-
-        # increment memory_counter avoiding overflow (I only need to keep track if memory is full or not)
-        self.memory_counter += 1
-        if self.memory_counter == (self.capacity * 2):
-            self.memory_counter = self.capacity
-
-    def sample(self, batch_size):
-
-        if self.memory_counter > self.capacity:
-            # the replay memory is all written, so I can sample on all the array size [0, self.capacity]
-            sample_index = np.random.choice(self.capacity, size=batch_size)
-        else:
-            # only part of the replay memory is written, so I sample up to where it's written [0, self.memory_counter]
-            sample_index = np.random.choice(self.memory_counter, size=batch_size)
-
-        batch_memory = self.memory[sample_index, :]
-        return batch_memory
-
-    def size(self):
-        return min(self.capacity, self.memory_counter)
+from networks.replay_memory import CompactReplayMemory, PrioritizedReplayMemory, ReplayMemory
 
 
 class DQN(BaseNetwork):
 
-    def __init__(self, n_actions, n_features, layers=[256, 128], learning_rate=1e-3, batch_size=100, replace_target_iter=2000, discount=0.85):
+    def __init__(self, n_actions, n_features, layers=[256, 128], learning_rate=1e-3, batch_size=100, replace_target_iter=2000, discount=0.85, replay_memory=None, prioritized_replay=False, replay_capacity=10000):
         # initialize base class
         super().__init__()
 
@@ -67,9 +31,16 @@ class DQN(BaseNetwork):
         # layers parameters
         self.layers = layers
 
-        # create replay memroy
-        capacity = 10000
-        self.replay_memory = ReplayMemory(capacity, self.n_features)
+        # create replay memroy, unless a replay memory shared with other processes is passed
+        capacity = replay_capacity
+        if replay_memory is None and prioritized_replay:
+            replay_memory = PrioritizedReplayMemory(capacity, self.n_features)
+        elif replay_memory is None:
+            replay_memory = ReplayMemory(capacity, self.n_features)
+        self.replay_memory = replay_memory
+        self.prioritized_replay = isinstance(replay_memory, PrioritizedReplayMemory)
+        # a compact replay memory stores the compact records of the states
+        self.compact_replay = isinstance(replay_memory, CompactReplayMemory)
 
         # create network
         self.session = None
@@ -87,6 +58,7 @@ class DQN(BaseNetwork):
             self.r = tf.placeholder(tf.float32, [None, ], name='rewards')  # input Reward
             self.s_ = tf.placeholder(tf.float32, [None, self.n_features], name='states_')  # input Next State
             self.terminal = tf.placeholder(tf.float32, [None, ], name='terminal') # indication if next state is terminal
+            self.is_weights = tf.placeholder_with_default(tf.ones_like(self.r), [None, ], name='is_weights') # importance sampling weights of prioritized replay
 
             w_initializer, b_initializer = tf.random_normal_initializer(0., 0.3), tf.constant_initializer(0.1)
 
@@ -124,7 +96,9 @@ class DQN(BaseNetwork):
                 self.q_wrt_a = tf.gather_nd(params=self.q, indices=a_indices)
             with tf.variable_scope('loss'):
                 # loss computed as difference between predicted q[a] and (current_reward + discount * q_target[best_future_action])
-                self.loss = tf.reduce_mean(tf.squared_difference(self.q_target, self.q_wrt_a, name='td_error'))
+                # each sample is weighted by its importance sampling weight, 1 without prioritized replay
+                self.td_error = tf.subtract(self.q_target, self.q_wrt_a, name='td_error')
+                self.loss = tf.reduce_mean(self.is_weights * tf.square(self.td_error))
             with tf.variable_scope('train'):
                 opt = tf.train.AdamOptimizer(self.learning_rate)
                 grads_and_vars = opt.compute_gradients(self.loss)
@@ -140,19 +114,28 @@ class DQN(BaseNetwork):
 
     def get_q_table(self, state):
         ''' Compute q table for current state'''
+        return self.get_q_tables(np.expand_dims(state, axis=0))[0]
 
-        states_op = self.session.graph.get_operation_by_name("states").outputs[0]
-        #argmax_op = self.session.graph.get_operation_by_name("predictions/argmax").outputs[0]
-        q_op = self.session.graph.get_operation_by_name("eval_net/q/BiasAdd").outputs[0]
+    def get_q_tables(self, states):
+        ''' Compute the q tables of a batch of states with a single forward pass'''
 
-        input_state = np.expand_dims(state, axis=0)
-        q = self.session.run([q_op], feed_dict={states_op: input_state})
+        if self.inference_ops is None:
+            graph = self.session.graph
+            self.inference_ops = (
+                graph.get_operation_by_name("states").outputs[0],
+                graph.get_operation_by_name("eval_net/q/BiasAdd").outputs[0])
+        states_op, q_op = self.inference_ops
 
-        return q[0][0]
+        return self.session.run(q_op, feed_dict={states_op: states})
 
     def store(self, last_state, action, reward, state, terminal):
         ''' Store the current experience in memory '''
 
+        if self.compact_replay:
+            # the states are compact records, expanded only when sampled
+            self.replay_memory.push((last_state, action, reward, state, terminal))
+            return
+
         # stacks together all states element
         state_vector = np.hstack((last_state, action, reward, state, terminal))
 
@@ -163,33 +146,65 @@ class DQN(BaseNetwork):
         ''' Sample from memory and train neural network on a batch of experiences '''
 
         self.store(last_state, action, reward, state, terminal)
+        self.learn_step()
+
+
+    def commit(self, action, reward, terminal):
+        ''' Complete the transition whose states have been written in the replay memory
+            slot returned by replay_memory.prepare, then train as learn
+        '''
+        self.replay_memory.commit(action, reward, terminal)
+        self.learn_step()
+
+
+    def learn_step(self):
+        ''' Count a stored experience and train the network when it's time'''
 
         # check if it's time to update the network
         self.learn_step_counter += 1
         if self.learn_step_counter % self.update_each != 0 or self.learn_step_counter < self.update_after:
             return
 
+        self.optimize()
+
+        # check if it's time to copy the target network into the evaluation network
+        if self.learn_step_counter % self.replace_target_iter == 0:
+            self.replace_target()
+
+
+    def optimize(self):
+        ''' Run a training step on a batch of experiences sampled from memory, returns the loss'''
+
         if self.replay_memory.size() < self.batch_size:
             # there are not enough samples for a training step in the replay memory
-            return
+            return None
 
         # get a batch of samples from replay memory
-        batch_memory = self.replay_memory.sample(self.batch_size)
+        if self.prioritized_replay:
+            batch_memory, sample_index, weights = self.replay_memory.sample_prioritized(self.batch_size)
+        else:
+            batch_memory = self.replay_memory.sample(self.batch_size)
+
+        feed_dict = {
+            self.s: batch_memory[:, : self.n_features],
+            self.a: batch_memory[:, self.n_features],
+            self.r: batch_memory[:, self.n_features + 1],
+            self.s_: batch_memory[:, -self.n_features-1:-1],
+            self.terminal: batch_memory[:, -1],
+        }
+        if self.prioritized_replay:
+            feed_dict[self.is_weights] = weights
 
         # run a newtork training step
-        _, loss = self.session.run(
-            [self._train_op, self.loss,],
-            feed_dict={
-                self.s: batch_memory[:, : self.n_features],
-                self.a: batch_memory[:, self.n_features],
-                self.r: batch_memory[:, self.n_features + 1],
-                self.s_: batch_memory[:, -self.n_features-1:-1],
-                self.terminal: batch_memory[:, -1],
-            })
+        _, loss, td_error = self.session.run([self._train_op, self.loss, self.td_error], feed_dict=feed_dict)
 
-        # check if it's time to copy the target network into the evaluation network
-        if self.learn_step_counter % self.replace_target_iter == 0:
-            self.session.run(self.target_replace_op)
-            #print("Loss: ", loss)
+        if self.prioritized_replay:
+            # update the priorities of the sampled transitions with their new td errors
+            self.replay_memory.update_priorities(sample_index, td_error)
+
+        return loss
 
 
+    def replace_target(self):
+        ''' Copy the evaluation network weights into the target network'''
+        self.session.run(self.target_replace_op)
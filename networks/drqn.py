@@ -5,57 +5,12 @@ import numpy as np
 import tensorflow as tf
 
 from networks.base_network import BaseNetwork
-
-
-class ReplayMemory:
-
-    def __init__(self, capacity, n_features):
-
-        # initialize zero memory, each sample in memory has size episode_length * [s + a + r + s_ + t]
-        # where s and s_ are 1xn_features, a r t are scalar
-
-        self.capacity = capacity
-        self.episode_length = 20
-        self.event_size = n_features * 2 + 3
-        self.memory = np.zeros((self.capacity, self.episode_length, self.event_size))
-        self.memory_counter = 0
-
-    def push(self, item):
-        # get the index where to insert the episode
-        index = self.memory_counter % self.capacity
-        self.memory[index, :] = item
-
-        # increment memory_counter avoiding overflow (I only need to keep track if memory is full or not)
-        self.memory_counter += 1
-        if self.memory_counter == (self.capacity * 2):
-            self.memory_counter = self.capacity
-
-    def sample(self, batch_size, trace_length):
-
-        if self.memory_counter > self.capacity:
-            # the replay memory is all written, so I can sample on all the array size [0, self.capacity]
-            sample_index = np.random.choice(self.capacity, size=batch_size)
-        else:
-            # only part of the replay memory is written, so I sample up to where it's written [0, self.memory_counter]
-            sample_index = np.random.choice(self.memory_counter, size=batch_size)
-
-        batch_episodes = self.memory[sample_index, :]
-
-        sampled_traces = []
-        for episode in batch_episodes:
-            start_index = np.random.randint(0, len(episode) + 1 - trace_length)
-            sampled_traces.append(episode[start_index:start_index+trace_length])
-
-        sampled_traces = np.array(sampled_traces)
-        return np.reshape(sampled_traces,[batch_size*trace_length,self.event_size])
-
-    def size(self):
-        return min(self.capacity, self.memory_counter)
+from networks.replay_memory import EpisodeReplayMemory
 
 
 class DRQN(BaseNetwork):
 
-    def __init__(self, n_actions, n_features, layers=[256, 128], learning_rate=1e-3, batch_size=25, replace_target_iter=2000, discount=0.85):
+    def __init__(self, n_actions, n_features, layers=[256, 128], learning_rate=1e-3, batch_size=25, replace_target_iter=2000, discount=0.85, replay_memory=None):
         # initialize base class
         super().__init__()
 
@@ -76,15 +31,23 @@ class DRQN(BaseNetwork):
         # layers parameters
         self.lstm_layers = layers
 
-        # TODO: use only 1 variable
-        # store the sequence of states in an episode
+        # with stateful inference the LSTM states are carried across the moves of an episode and only
+        # the states observed since the last q table are fed, otherwise the last trace_length states are
+        self.stateful_inference = True
+        self.pending_states = []
         self.states_history = []
-        # store the sequence of training samples (s, a, r, s_) in an episode
-        self.samples_history = []
-
-        # create replay memroy
-        capacity = 2500
-        self.replay_memory = ReplayMemory(capacity, n_features)
+        self.lstm_state = None
+        # store the states, actions, rewards and terminals of the current episode
+        self.episode_states = []
+        self.episode_actions = []
+        self.episode_rewards = []
+        self.episode_terminals = []
+
+        # create replay memroy, unless a replay memory shared with other processes is passed
+        capacity = 25000
+        if replay_memory is None:
+            replay_memory = EpisodeReplayMemory(capacity, n_features)
+        self.replay_memory = replay_memory
 
         # create network
         self.session = None
@@ -113,10 +76,22 @@ class DRQN(BaseNetwork):
                 rnn_s = tf.reshape(tf.contrib.slim.flatten(e1),[-1,self.events_length, 128])
                 rnn_multi_cells_e = tf.contrib.rnn.MultiRNNCell([tf.nn.rnn_cell.LSTMCell(layer_size) for layer_size in self.lstm_layers])
 
-                rnn_output_e, _ = tf.nn.dynamic_rnn(
-                    rnn_multi_cells_e, rnn_s, dtype=tf.float32)
+                # initial states of the LSTM layers, zeros unless they are fed by the stateful inference
+                initial_state_e = []
+                for i, layer_size in enumerate(self.lstm_layers):
+                    zeros = tf.zeros([tf.shape(rnn_s)[0], layer_size])
+                    initial_state_e.append(tf.nn.rnn_cell.LSTMStateTuple(
+                        tf.placeholder_with_default(zeros, [None, layer_size], name='lstm_c_{}'.format(i)),
+                        tf.placeholder_with_default(zeros, [None, layer_size], name='lstm_h_{}'.format(i))))
+
+                rnn_output_e, final_state_e = tf.nn.dynamic_rnn(
+                    rnn_multi_cells_e, rnn_s, initial_state=tuple(initial_state_e), dtype=tf.float32)
                 rnn_output_e = rnn_output_e[:, -1, :]
 
+                for i, layer_state in enumerate(final_state_e):
+                    tf.identity(layer_state.c, name='lstm_c_out_{}'.format(i))
+                    tf.identity(layer_state.h, name='lstm_h_out_{}'.format(i))
+
                 e2 = tf.layers.dense(rnn_output_e, 32, kernel_initializer=w_initializer,
                                         bias_initializer=b_initializer, name='e2')
 
@@ -178,37 +153,83 @@ class DRQN(BaseNetwork):
                 self.target_replace_op = [tf.assign(t, e) for t, e in zip(t_params, e_params)]
 
 
-    def get_q_table(self, state):
-        ''' Compute q table for current state'''
+    def start_episode(self):
+        ''' Reset the recurrent state at the beginning of an episode'''
+        self.pending_states = []
+        self.states_history = []
+        self.lstm_state = None
+
+
+    def observe_state(self, state):
+        ''' Add a state of the current episode, fed to the LSTM by the next get_q_table'''
+        # the agent reuses its state buffers, so keep a copy
+        self.pending_states.append(np.copy(state))
 
-        # HACK for check end episode
-        if len(self.states_history) == 20:
-            self.states_history = []
 
-        self.states_history.append(state)
+    def get_inference_ops(self):
+        if self.inference_ops is None:
+            graph = self.session.graph
+            states_op = graph.get_operation_by_name("states").outputs[0]
+            events_op = graph.get_operation_by_name("events_length").outputs[0]
+            q_op = graph.get_operation_by_name("eval_net/q/BiasAdd").outputs[0]
 
-        states_op = self.session.graph.get_operation_by_name("states").outputs[0]
-        events_op = self.session.graph.get_operation_by_name("events_length").outputs[0]
-        q_op = self.session.graph.get_operation_by_name("eval_net/q/BiasAdd").outputs[0]
+            # models saved before the stateful inference have no LSTM state inputs
+            try:
+                lstm_state_ops = []
+                lstm_state_out_ops = []
+                for i in range(len(self.lstm_layers)):
+                    for name in ('c', 'h'):
+                        lstm_state_ops.append(graph.get_operation_by_name("eval_net/lstm_{}_{}".format(name, i)).outputs[0])
+                        lstm_state_out_ops.append(graph.get_operation_by_name("eval_net/lstm_{}_out_{}".format(name, i)).outputs[0])
+            except KeyError:
+                lstm_state_ops = lstm_state_out_ops = None
 
-        #input_state = np.expand_dims(state, axis=0)
-        input_state = self.states_history[-self.trace_length:]
+            self.inference_ops = (states_op, events_op, q_op, lstm_state_ops, lstm_state_out_ops)
+        return self.inference_ops
 
-        # q has shape 1 x len(input_state) x len(actions)
-        q = self.session.run([q_op], feed_dict={states_op: input_state, events_op : len(input_state)})
 
-        return q[0][-1]
+    def get_q_table(self, state):
+        ''' Compute q table for current state, the states of the episode are the ones passed to observe_state'''
+
+        states_op, events_op, q_op, lstm_state_ops, lstm_state_out_ops = self.get_inference_ops()
+        if not self.pending_states:
+            self.observe_state(state)
+
+        if self.stateful_inference and lstm_state_ops is not None:
+            # one recurrent step for each new state, starting from the carried LSTM states
+            feed_dict = {states_op: self.pending_states, events_op: len(self.pending_states)}
+            if self.lstm_state is not None:
+                feed_dict.update(zip(lstm_state_ops, self.lstm_state))
+            outputs = self.session.run([q_op] + lstm_state_out_ops, feed_dict=feed_dict)
+            self.lstm_state = outputs[1:]
+            q = outputs[0]
+        else:
+            # run the LSTM on the last trace_length states of the episode
+            self.states_history = (self.states_history + self.pending_states)[-self.trace_length:]
+            q = self.session.run(q_op, feed_dict={states_op: self.states_history, events_op: len(self.states_history)})
+
+        self.pending_states = []
+
+        # q has shape 1 x len(actions)
+        return q[-1]
 
     def store(self, last_state, action, reward, state, terminal):
         ''' Store the current experience in memory '''
 
-        state_vector = np.hstack((last_state, action, reward, state, terminal))
-        self.samples_history.append(state_vector)
+        # the next state of a transition is the last state of the following one
+        self.episode_states.append(np.array(last_state, dtype=np.uint8))
+        self.episode_actions.append(action)
+        self.episode_rewards.append(reward)
+        self.episode_terminals.append(terminal)
 
         # if terminal state reached, I can store the full episode in memory
         if terminal:
-            self.replay_memory.push(self.samples_history)
-            self.samples_history = []
+            self.episode_states.append(np.array(state, dtype=np.uint8))
+            self.replay_memory.push(self.episode_states, self.episode_actions, self.episode_rewards, self.episode_terminals)
+            self.episode_states = []
+            self.episode_actions = []
+            self.episode_rewards = []
+            self.episode_terminals = []
 
     def learn(self, last_state, action, reward, state, terminal):
         ''' Sample from memory and train neural network on a batch of experiences '''
@@ -219,26 +240,38 @@ class DRQN(BaseNetwork):
         self.learn_step_counter += 1
         if self.learn_step_counter % self.update_each != 0 or self.learn_step_counter < self.update_after:
             return
+        self.optimize()
+
+        # check if it's time to copy the target network into the evaluation network
+        if self.learn_step_counter % self.replace_target_iter == 0:
+            self.replace_target()
+
+
+    def optimize(self):
+        ''' Run a training step on a batch of experiences sampled from memory, returns the loss'''
+
         if self.replay_memory.size() < self.batch_size:
             # there are not enough samples for a training step in the replay memory
-            return
+            return None
 
         # get a batch of samples from replay memory
-        batch_memory = self.replay_memory.sample(self.batch_size, self.trace_length)
+        states, actions, rewards, next_states, terminals = self.replay_memory.sample(self.batch_size, self.trace_length)
 
         # run a newtork training step
         _, loss = self.session.run(
             [self._train_op, self.loss,],
             feed_dict={
-                self.s: batch_memory[:, : self.n_features],
-                self.a: batch_memory[:, self.n_features],
-                self.r: batch_memory[:, self.n_features + 1],
-                self.s_: batch_memory[:, -self.n_features-1:-1],
-                self.terminal: batch_memory[:, -1],
+                self.s: states,
+                self.a: actions,
+                self.r: rewards,
+                self.s_: next_states,
+                self.terminal: terminals,
                 self.events_length : self.trace_length,
             })
 
-        # check if it's time to copy the target network into the evaluation network
-        if self.learn_step_counter % self.replace_target_iter == 0:
-            self.session.run(self.target_replace_op)
-            #print("Loss: ", loss)
+        return loss
+
+
+    def replace_target(self):
+        ''' Copy the evaluation network weights into the target network'''
+        self.session.run(self.target_replace_op)
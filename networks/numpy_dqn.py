@@ -0,0 +1,103 @@
+import os
+import numpy as np
+
+
+class NumpyDQN:
+    ''' Inference only copy of the evaluation network of a DQN, computed with numpy.
+        It has the same get_q_table interface of DQN, so a greedy QAgent can play with it
+        without tensorflow. The weights are exported from a trained DQN by export_numpy.py.
+    '''
+
+    # name of the weights file inside a model directory
+    FILE_NAME = 'numpy_dqn.npz'
+
+    def __init__(self, n_actions, n_features, layers=[256, 128]):
+        self.n_actions = n_actions
+        self.n_features = n_features
+        self.layers = layers
+
+        # there is nothing to train
+        self.replay_memory = None
+        self.learn_step_counter = 0
+
+        sizes = [n_features] + list(layers) + [n_actions]
+        self.set_weights([
+            array
+            for input_size, output_size in zip(sizes[:-1], sizes[1:])
+            for array in (np.zeros((input_size, output_size), dtype=np.float32), np.zeros(output_size, dtype=np.float32))])
+
+
+    @classmethod
+    def from_weights(cls, weights):
+        ''' NumpyDQN with the weights returned by DQN.get_weights(), [kernel, bias] of each dense layer'''
+        kernels = weights[0::2]
+        network = cls(kernels[-1].shape[1], kernels[0].shape[0], [kernel.shape[1] for kernel in kernels[:-1]])
+        network.set_weights(weights)
+        return network
+
+
+    def get_weights(self):
+        return [array for layer in zip(self.kernels, self.biases) for array in layer]
+
+
+    def set_weights(self, weights):
+        self.kernels = [np.asarray(kernel, dtype=np.float32) for kernel in weights[0::2]]
+        self.biases = [np.asarray(bias, dtype=np.float32) for bias in weights[1::2]]
+
+
+    def predict(self, states):
+        ''' q values of a batch of states'''
+        last_tensor = np.asarray(states, dtype=np.float32)
+        for kernel, bias in zip(self.kernels[:-1], self.biases[:-1]):
+            last_tensor = last_tensor @ kernel
+            last_tensor += bias
+            np.maximum(last_tensor, 0, out=last_tensor)
+        q = last_tensor @ self.kernels[-1]
+        q += self.biases[-1]
+        return q
+
+
+    def get_q_tables(self, states):
+        return self.predict(states)
+
+
+    def get_q_table(self, state):
+        ''' Compute q table for current state'''
+        return self.predict(state[np.newaxis])[0]
+
+
+    def start_episode(self):
+        pass
+
+
+    def observe_state(self, state):
+        pass
+
+
+    def save_model(self, output_dir):
+        '''Save the weights in output_dir'''
+        if not output_dir:
+            raise ValueError('You have to specify a valid output directory for NumpyDQN.save_model')
+        os.makedirs(output_dir, exist_ok=True)
+
+        arrays = {}
+        for i, (kernel, bias) in enumerate(zip(self.kernels, self.biases)):
+            arrays['kernel_{}'.format(i)] = kernel
+            arrays['bias_{}'.format(i)] = bias
+        np.savez(os.path.join(output_dir, self.FILE_NAME), **arrays)
+
+
+    def load_model(self, saved_model_dir):
+        '''Load the weights exported in saved_model_dir'''
+        with np.load(os.path.join(saved_model_dir, self.FILE_NAME)) as arrays:
+            num_layers = len(arrays.files) // 2
+            weights = []
+            for i in range(num_layers):
+                weights += [arrays['kernel_{}'.format(i)], arrays['bias_{}'.format(i)]]
+
+        if weights[0].shape[0] != self.n_features or weights[-1].shape[0] != self.n_actions:
+            raise ValueError("NumpyDQN.load_model: the model in {} has {} features and {} actions, expected {} and {}".format(
+                saved_model_dir, weights[0].shape[0], weights[-1].shape[0], self.n_features, self.n_actions))
+
+        self.layers = [kernel.shape[1] for kernel in weights[0:-2:2]]
+        self.set_weights(weights)
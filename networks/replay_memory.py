@@ -0,0 +1,617 @@
+import contextlib
+import json
+import multiprocessing
+import os
+from multiprocessing import shared_memory
+import numpy as np
+
+
+# version of the replay snapshots format written by save_replay_snapshot
+REPLAY_SNAPSHOT_VERSION = 1
+
+
+class SharedArrays:
+    ''' Numpy arrays allocated in a single multiprocessing shared memory block, or in the
+        process memory if shared is False. Each array of specs, a list of (name, shape, dtype),
+        is an attribute; when pickled to another process the arrays attach to the same block.
+    '''
+
+    def __init__(self, specs, shared=True):
+        self.specs = [(name, tuple(shape), np.dtype(dtype)) for name, shape, dtype in specs]
+        self.shared = shared
+        self.owner = True
+        self.shm = None
+
+        if shared:
+            size = sum(self.aligned_size(shape, dtype) for _, shape, dtype in self.specs)
+            self.shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+            self.attach(self.shm.buf)
+        else:
+            for name, shape, dtype in self.specs:
+                setattr(self, name, np.zeros(shape, dtype=dtype))
+
+
+    @staticmethod
+    def aligned_size(shape, dtype):
+        # each array starts at a multiple of 8 bytes
+        return -(-int(np.prod(shape)) * dtype.itemsize // 8) * 8
+
+
+    def attach(self, buffer):
+        offset = 0
+        for name, shape, dtype in self.specs:
+            setattr(self, name, np.ndarray(shape, dtype=dtype, buffer=buffer, offset=offset))
+            offset += self.aligned_size(shape, dtype)
+
+
+    def __getstate__(self):
+        if not self.shared:
+            return self.__dict__.copy()
+        return {'specs': self.specs, 'shared': True, 'name': self.shm.name}
+
+
+    def __setstate__(self, state):
+        name = state.pop('name', None)
+        self.__dict__.update(state)
+        if name is not None:
+            self.owner = False
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.attach(self.shm.buf)
+
+
+    def items(self):
+        ''' list of (name, array) of the arrays'''
+        return [(name, getattr(self, name)) for name, _, _ in self.specs]
+
+
+    def assign(self, arrays):
+        ''' replace the arrays with the ones of the arrays dict, which are copied in the shared block if shared'''
+        for name, _, _ in self.specs:
+            if self.shared:
+                getattr(self, name)[:] = arrays[name]
+            else:
+                setattr(self, name, arrays[name])
+
+
+    def copy_from(self, other):
+        ''' copy the values of the arrays of another SharedArrays with the same specs'''
+        for name, _, _ in self.specs:
+            getattr(self, name)[:] = getattr(other, name)
+
+
+    def unshare(self):
+        ''' copy the arrays into the process memory and release the shared block'''
+        if not self.shared:
+            return
+        arrays = {name: np.copy(getattr(self, name)) for name, _, _ in self.specs}
+        for name in arrays:
+            delattr(self, name)
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+        self.shm = None
+        self.shared = False
+        self.__dict__.update(arrays)
+
+
+
+class SharedReplayMemory:
+    ''' Replay memory of transitions [s + a + r + s_ + t] stored in a multiprocessing shared
+        memory block, so that several processes can push transitions and the learner can
+        sample them without pickling.
+        Writers only hold the lock for reserving the next slot of the ring, then they
+        write their transition in place; a sample may rarely read a transition being overwritten.
+        The memory can be passed to processes started with the multiprocessing context,
+        which attach to the same block.
+    '''
+
+    def __init__(self, capacity, n_features, context=multiprocessing):
+
+        self.capacity = capacity
+        self.n_features = n_features
+        self.event_size = n_features * 2 + 3
+        self.lock = context.Lock()
+
+        self.arrays = SharedArrays([
+            ('counter', (1,), np.int64),
+            ('memory', (capacity, self.event_size), np.float32)])
+
+
+    @property
+    def memory(self):
+        return self.arrays.memory
+
+
+    @property
+    def memory_counter(self):
+        return int(self.arrays.counter[0])
+
+
+    @memory_counter.setter
+    def memory_counter(self, value):
+        self.arrays.counter[0] = value
+
+
+    def push(self, item):
+        counter = self.arrays.counter
+
+        # reserve the index where to insert the transition
+        with self.lock:
+            index = counter[0] % self.capacity
+
+            # increment memory_counter avoiding overflow (I only need to keep track if memory is full or not)
+            counter[0] += 1
+            if counter[0] == (self.capacity * 2):
+                counter[0] = self.capacity
+
+        self.arrays.memory[index] = item
+
+
+    def sample(self, batch_size):
+        # sample only up to where the memory is written
+        sample_index = np.random.randint(0, self.size(), size=batch_size)
+        return self.arrays.memory[sample_index]
+
+
+    def size(self):
+        return min(self.capacity, self.memory_counter)
+
+
+    def snapshot(self):
+        ''' arrays and counters saved by save_replay_snapshot, in the format of ReplayMemory'''
+        return {'memory': self.arrays.memory}, {'memory_counter': self.memory_counter}
+
+
+    def restore(self, arrays, counters):
+        self.arrays.memory[:] = arrays['memory']
+        self.memory_counter = counters['memory_counter']
+
+
+    def unshare(self):
+        ''' copy the memory into the process and release the shared block,
+            the memory can still be used only by this process
+        '''
+        self.arrays.unshare()
+
+
+
+class CompactReplayMemory:
+    ''' Replay memory of transitions storing the states as the compact uint8 records of a
+        StateEncoder (card ids, briscola seed and packed seen cards) and actions, rewards and
+        terminals in small integer types. Sampled batches are expanded to the [s + a + r + s_ + t]
+        rows of the DQN replay memory. Rewards are stored as integers, as the points of a turn.
+        If shared is True the arrays are in a multiprocessing shared memory block, as in
+        SharedReplayMemory, and writers only hold the lock for reserving their slot.
+    '''
+
+    def __init__(self, capacity, encoder, shared=False, context=multiprocessing):
+
+        self.capacity = capacity
+        self.encoder = encoder
+        self.n_features = encoder.n_features
+        self.event_size = self.n_features * 2 + 3
+        self.lock = context.Lock() if shared else contextlib.nullcontext()
+
+        self.arrays = SharedArrays([
+            ('counter', (1,), np.int64),
+            ('states', (capacity, encoder.compact_size), np.uint8),
+            ('next_states', (capacity, encoder.compact_size), np.uint8),
+            ('actions', (capacity,), np.int8),
+            ('rewards', (capacity,), np.int16),
+            ('terminals', (capacity,), np.uint8)], shared)
+
+
+    @property
+    def memory_counter(self):
+        return int(self.arrays.counter[0])
+
+
+    def push(self, item):
+        ''' store a transition (s, a, r, s_, t) where s and s_ are compact records'''
+        last_state, action, reward, state, terminal = item
+        arrays = self.arrays
+        counter = arrays.counter
+
+        # reserve the index where to insert the transition
+        with self.lock:
+            index = counter[0] % self.capacity
+
+            # increment memory_counter avoiding overflow (I only need to keep track if memory is full or not)
+            counter[0] += 1
+            if counter[0] == (self.capacity * 2):
+                counter[0] = self.capacity
+
+        arrays.states[index] = last_state
+        arrays.next_states[index] = state
+        arrays.actions[index] = action
+        arrays.rewards[index] = reward
+        arrays.terminals[index] = terminal
+
+
+    def sample(self, batch_size):
+        arrays = self.arrays
+        n_features = self.n_features
+
+        # sample only up to where the memory is written
+        sample_index = np.random.randint(0, self.size(), size=batch_size)
+
+        batch_memory = np.empty((batch_size, self.event_size), dtype=np.float32)
+        self.encoder.decode_batch(arrays.states[sample_index], out=batch_memory[:, :n_features])
+        batch_memory[:, n_features] = arrays.actions[sample_index]
+        batch_memory[:, n_features + 1] = arrays.rewards[sample_index]
+        self.encoder.decode_batch(arrays.next_states[sample_index], out=batch_memory[:, n_features + 2:-1])
+        batch_memory[:, -1] = arrays.terminals[sample_index]
+
+        return batch_memory
+
+
+    def size(self):
+        return min(self.capacity, self.memory_counter)
+
+
+    def snapshot(self):
+        ''' arrays and counters saved by save_replay_snapshot, the counters are in the arrays'''
+        return dict(self.arrays.items()), {}
+
+
+    def restore(self, arrays, counters):
+        self.arrays.assign(arrays)
+
+
+    def unshare(self):
+        ''' copy the memory into the process and release the shared block'''
+        self.arrays.unshare()
+        self.lock = contextlib.nullcontext()
+
+
+
+class EpisodeReplayMemory:
+    ''' Replay memory of whole episodes for recurrent networks.
+        Episodes have variable length and are stored one after the other in flat arrays:
+        an episode of n transitions takes n + 1 rows, the states s_0 ... s_n, since the next
+        state of a transition is the state of the following one. States are one hot encoded,
+        so they are stored as uint8. A ring of episodes keeps their offsets and lengths, the
+        oldest episodes are dropped when their rows are needed.
+        If shared is True the arrays are in a multiprocessing shared memory block, as in
+        SharedReplayMemory, and writers only hold the lock for reserving their rows.
+    '''
+
+    def __init__(self, capacity, n_features, num_rows=None, shared=False, context=multiprocessing):
+        ''' capacity is the maximum number of episodes, num_rows the number of stored states,
+            by default enough for capacity episodes of 20 transitions
+        '''
+        self.capacity = capacity
+        self.n_features = n_features
+        self.num_rows = num_rows if num_rows is not None else capacity * 21
+        self.lock = context.Lock() if shared else contextlib.nullcontext()
+
+        # header: [episodes counter, oldest episode, number of episodes, next free row]
+        self.arrays = SharedArrays([
+            ('header', (4,), np.int64),
+            ('offsets', (capacity,), np.int64),
+            ('lengths', (capacity,), np.int64),
+            ('states', (self.num_rows, n_features), np.uint8),
+            ('actions', (self.num_rows,), np.int8),
+            ('rewards', (self.num_rows,), np.float32),
+            ('terminals', (self.num_rows,), np.uint8)], shared)
+
+
+    @property
+    def memory_counter(self):
+        return int(self.arrays.header[0])
+
+
+    def push(self, states, actions, rewards, terminals):
+        ''' store an episode of len(actions) transitions, states are its len(actions) + 1 states'''
+        arrays = self.arrays
+        header = arrays.header
+        length = len(actions)
+        if length + 1 > self.num_rows:
+            raise ValueError("EpisodeReplayMemory.push called with an episode longer than the memory")
+
+        with self.lock:
+            position = header[3]
+            start = position if position + length + 1 <= self.num_rows else 0
+            end = start + length + 1
+
+            # drop the oldest episodes while the memory is full or their rows are needed,
+            # after wrapping around all the episodes after the last position are the oldest
+            while header[2] > 0:
+                oldest = header[1]
+                oldest_start = arrays.offsets[oldest]
+                oldest_end = oldest_start + arrays.lengths[oldest] + 1
+                wrapped = start < position <= oldest_start
+                overlaps = start < oldest_end and oldest_start < end
+                if header[2] < self.capacity and not wrapped and not overlaps:
+                    break
+                header[1] = (oldest + 1) % self.capacity
+                header[2] -= 1
+
+            index = (header[1] + header[2]) % self.capacity
+            arrays.offsets[index] = start
+            arrays.lengths[index] = length
+            header[0] += 1
+            header[2] += 1
+            header[3] = end
+
+        arrays.states[start:end] = states
+        arrays.actions[start:end - 1] = actions
+        arrays.rewards[start:end - 1] = rewards
+        arrays.terminals[start:end - 1] = terminals
+
+
+    def sample(self, batch_size, trace_length):
+        ''' sample batch_size traces of trace_length consecutive transitions,
+            returns the stacked states, actions, rewards, next states and terminals
+        '''
+        arrays = self.arrays
+        oldest, num_episodes = arrays.header[1], arrays.header[2]
+
+        episodes = (oldest + np.random.randint(0, num_episodes, size=batch_size)) % self.capacity
+        lengths = arrays.lengths[episodes]
+        starts = arrays.offsets[episodes] + (np.random.random(batch_size) * (lengths - trace_length + 1)).astype(np.int64)
+        rows = (starts[:, np.newaxis] + np.arange(trace_length)).reshape(-1)
+
+        return arrays.states[rows], arrays.actions[rows], arrays.rewards[rows], arrays.states[rows + 1], arrays.terminals[rows]
+
+
+    def size(self):
+        return int(self.arrays.header[2])
+
+
+    def snapshot(self):
+        ''' arrays and counters saved by save_replay_snapshot, the counters are in the arrays'''
+        return dict(self.arrays.items()), {}
+
+
+    def restore(self, arrays, counters):
+        self.arrays.assign(arrays)
+
+
+    def unshare(self):
+        ''' copy the memory into the process and release the shared block'''
+        self.arrays.unshare()
+        self.lock = contextlib.nullcontext()
+
+
+
+class ReplayMemory:
+
+    def __init__(self, capacity, n_features):
+
+        # initialize zero memory, each sample in memory has size [s + a + r + s_ + t]
+        # where s and s_ are 1xn_features, a r t are scalar
+
+        self.capacity = capacity
+        self.n_features = n_features
+        self.event_size = n_features * 2 + 3
+        self.memory = np.zeros((self.capacity, self.event_size), dtype=np.float32)
+        self.memory_counter = 0
+
+    def push(self, item):
+        # get the index where to insert the event
+        index = self.memory_counter % self.capacity
+        self.memory[index, :] = item
+        self.advance()
+
+    def advance(self):
+        # increment memory_counter avoiding overflow (I only need to keep track if memory is full or not)
+        self.memory_counter += 1
+        if self.memory_counter == (self.capacity * 2):
+            self.memory_counter = self.capacity
+
+    def prepare(self, last_state):
+        ''' start writing a transition in the next slot without intermediate arrays: last_state
+            is copied as its state and the views of its state and next state are returned,
+            the agent encodes its next observation directly in the next state view.
+            Until commit is called the slot can be prepared again, moving its next state to the state.
+        '''
+        row = self.memory[self.memory_counter % self.capacity]
+        state = row[:self.n_features]
+        if last_state is not None:
+            state[:] = last_state
+        return state, row[self.n_features + 2:-1]
+
+    def commit(self, action, reward, terminal):
+        ''' complete the transition started by prepare'''
+        row = self.memory[self.memory_counter % self.capacity]
+        row[self.n_features] = action
+        row[self.n_features + 1] = reward
+        row[-1] = terminal
+        self.advance()
+
+    def sample(self, batch_size):
+
+        if self.memory_counter >= self.capacity:
+            # the replay memory is all written, so I can sample on all the array size except the slot being prepared
+            sample_index = (self.memory_counter + 1 + np.random.choice(self.capacity - 1, size=batch_size)) % self.capacity
+        else:
+            # only part of the replay memory is written, so I sample up to where it's written [0, self.memory_counter]
+            sample_index = np.random.choice(self.memory_counter, size=batch_size)
+
+        batch_memory = self.memory[sample_index, :]
+        return batch_memory
+
+    def size(self):
+        return min(self.capacity, self.memory_counter)
+
+    def snapshot(self):
+        ''' arrays and counters saved by save_replay_snapshot'''
+        return {'memory': self.memory}, {'memory_counter': self.memory_counter}
+
+    def restore(self, arrays, counters):
+        self.memory = arrays['memory']
+        self.memory_counter = counters['memory_counter']
+
+
+
+class SumTree:
+    ''' Array based binary tree where each node is the sum of its children.
+        Leaves hold the priorities of the items, so sampling an item proportionally to its
+        priority and updating priorities are O(log n) operations, vectorized over batches.
+    '''
+
+    def __init__(self, capacity):
+        # the number of leaves is a power of two, node i has children 2i and 2i+1, the root is 1
+        self.depth = max(1, int(np.ceil(np.log2(capacity))))
+        self.num_leaves = 2 ** self.depth
+        self.tree = np.zeros(2 * self.num_leaves)
+
+
+    def total(self):
+        return self.tree[1]
+
+
+    def get(self, indices):
+        return self.tree[indices + self.num_leaves]
+
+
+    def update(self, indices, priorities):
+        ''' set the priorities of the leaves at indices and update their ancestors'''
+        nodes = np.asarray(indices) + self.num_leaves
+        self.tree[nodes] = priorities
+        for _ in range(self.depth):
+            nodes = nodes // 2
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+
+    def find(self, values):
+        ''' indices of the leaves where the cumulative sums of the priorities reach values'''
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        for _ in range(self.depth):
+            left = 2 * nodes
+            left_sums = self.tree[left]
+            go_right = values >= left_sums
+            values -= np.where(go_right, left_sums, 0.)
+            nodes = left + go_right
+        return nodes - self.num_leaves
+
+
+
+class PrioritizedReplayMemory(ReplayMemory):
+    ''' Replay memory of transitions [s + a + r + s_ + t] sampled proportionally to their
+        priority (|td_error| + epsilon) ** alpha, new transitions get the maximum priority.
+        Importance sampling weights ((size * probability) ** -beta, normalized by their
+        maximum) correct the bias, beta is annealed to 1 by beta_increment at each sample.
+    '''
+
+    def __init__(self, capacity, n_features, alpha=0.6, beta=0.4, beta_increment=1e-5, epsilon=1e-6):
+        super().__init__(capacity, n_features)
+
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_increment = beta_increment
+        self.epsilon = epsilon
+        self.max_priority = 1.
+        self.priorities = SumTree(capacity)
+
+    def push(self, item):
+        self.priorities.update([self.memory_counter % self.capacity], self.max_priority)
+        super().push(item)
+
+    def commit(self, action, reward, terminal):
+        index = self.memory_counter % self.capacity
+        super().commit(action, reward, terminal)
+
+        # the next slot is being prepared, so it can not be sampled
+        self.priorities.update([index, self.memory_counter % self.capacity], [self.max_priority, 0.])
+
+    def sample_prioritized(self, batch_size):
+        ''' returns the sampled transitions, their indices and importance sampling weights'''
+
+        # stratified sampling, one item in each of batch_size equal ranges of the total priority
+        segment = self.priorities.total() / batch_size
+        values = (np.arange(batch_size) + np.random.random(batch_size)) * segment
+        sample_index = np.minimum(self.priorities.find(values), self.size() - 1)
+
+        probabilities = self.priorities.get(sample_index) / self.priorities.total()
+        weights = (self.size() * probabilities) ** -self.beta
+        weights /= weights.max()
+        self.beta = min(1., self.beta + self.beta_increment)
+
+        return self.memory[sample_index], sample_index, weights
+
+    def sample(self, batch_size):
+        batch_memory, _, _ = self.sample_prioritized(batch_size)
+        return batch_memory
+
+    def update_priorities(self, indices, td_errors):
+        priorities = (np.abs(td_errors) + self.epsilon) ** self.alpha
+        self.priorities.update(indices, priorities)
+        self.max_priority = max(self.max_priority, priorities.max())
+
+    def snapshot(self):
+        arrays, counters = super().snapshot()
+        arrays['priorities'] = self.priorities.tree
+        counters.update(max_priority=self.max_priority, beta=self.beta)
+        return arrays, counters
+
+    def restore(self, arrays, counters):
+        super().restore(arrays, counters)
+        self.priorities.tree = arrays['priorities']
+        self.max_priority = counters['max_priority']
+        self.beta = counters['beta']
+
+
+
+def has_replay_snapshot(directory):
+    ''' True if directory contains a complete replay snapshot'''
+    return os.path.isfile(os.path.join(directory, 'header.json'))
+
+
+def save_replay_snapshot(memory, directory, **counters):
+    ''' write the arrays of a replay memory in directory as .npy files, and a header.json with
+        the format version, the memory type, the arrays shapes and dtypes, the memory counters
+        and the passed counters. The header is written last, so an interrupted save is not loaded.
+    '''
+    os.makedirs(directory, exist_ok=True)
+    header_path = os.path.join(directory, 'header.json')
+    if os.path.exists(header_path):
+        os.remove(header_path)
+
+    arrays, memory_counters = memory.snapshot()
+    for name, array in arrays.items():
+        # the previous file is replaced and not overwritten, since it may still be memory mapped
+        path = os.path.join(directory, name + '.npy')
+        with open(path + '.tmp', 'wb') as f:
+            np.save(f, array)
+        os.replace(path + '.tmp', path)
+
+    memory_counters.update(counters)
+    header = {
+        'version': REPLAY_SNAPSHOT_VERSION,
+        'type': type(memory).__name__,
+        'arrays': {name: [list(array.shape), array.dtype.str] for name, array in arrays.items()},
+        'counters': {name: value.item() if isinstance(value, np.generic) else value for name, value in memory_counters.items()},
+    }
+    with open(header_path + '.tmp', 'w') as f:
+        json.dump(header, f, indent=2)
+    os.replace(header_path + '.tmp', header_path)
+
+
+def load_replay_snapshot(memory, directory):
+    ''' load a snapshot written by save_replay_snapshot into a replay memory with the same arrays.
+        The arrays are memory mapped copy on write: pages are read from disk only when they are
+        accessed and the changes to the memory are not written back to the snapshot.
+        returns the counters of the snapshot
+    '''
+    with open(os.path.join(directory, 'header.json')) as f:
+        header = json.load(f)
+
+    if header['version'] != REPLAY_SNAPSHOT_VERSION:
+        raise ValueError("Replay snapshot {} has format version {}, expected {}".format(directory, header['version'], REPLAY_SNAPSHOT_VERSION))
+
+    expected_arrays, _ = memory.snapshot()
+    arrays = {}
+    for name, expected in expected_arrays.items():
+        if name not in header['arrays']:
+            raise ValueError("Replay snapshot {} of a {} has no array {}".format(directory, header['type'], name))
+        array = np.load(os.path.join(directory, name + '.npy'), mmap_mode='c')
+        if array.shape != expected.shape or array.dtype != expected.dtype:
+            raise ValueError("Replay snapshot {} array {} has shape {} {}, expected {} {}".format(
+                directory, name, array.shape, array.dtype, expected.shape, expected.dtype))
+        arrays[name] = array
+
+    memory.restore(arrays, header['counters'])
+    return header['counters']
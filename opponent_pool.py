@@ -0,0 +1,139 @@
+import random
+import time
+
+from agents.q_agent import QAgent
+from networks.replay_memory import EpisodeReplayMemory
+from utils import NetworkTypes
+
+
+class CopyAgent(QAgent):
+    '''Copied agent. Identical to a QAgent, but does not update itself.
+       The weights of the agent are copied in memory: a DQN into a NumpyDQN,
+       a DRQN into a new DRQN graph whose variables are assigned
+    '''
+    def __init__(self, agent):
+
+        if type(agent) is not QAgent:
+            raise TypeError("CopyAgent __init__ requires argument of type QAgent")
+
+        start_time = time.time()
+        weights = agent.q_learning.get_weights()
+
+        if agent.network == NetworkTypes.DQN:
+            # a greedy copy only needs the forward pass of the evaluation network
+            super().__init__(network=NetworkTypes.NUMPY, layers=agent.layers, solve_endgame=agent.solve_endgame, cards_encoding=agent.cards_encoding, player_state=agent.player_state)
+        else:
+            # the copy never learns, so its replay memory is minimal
+            replay_memory = EpisodeReplayMemory(1, agent.n_features, num_rows=1)
+            super().__init__(network=agent.network, layers=agent.layers, solve_endgame=agent.solve_endgame, cards_encoding=agent.cards_encoding, player_state=agent.player_state, replay_memory=replay_memory)
+        self.q_learning.set_weights(weights)
+
+        # cost of the copy
+        self.copy_seconds = time.time() - start_time
+        self.copy_bytes = sum(array.nbytes for array in weights)
+
+        self.name = "CopyAgent"
+
+        # A copy agent must always be greedy since it is not learning
+        self.make_greedy()
+
+
+    def update(self, *args):
+        pass
+
+
+
+class OpponentPool:
+    ''' Past versions of a QAgent used as self play opponents.
+        Each version is only the list of its weights arrays, all the versions play through a
+        single CopyAgent whose weights are swapped when a different version is sampled.
+        When the weights exceed memory_budget bytes, or there are more than max_size versions,
+        the oldest versions are evicted; the last added version is always kept.
+    '''
+
+    def __init__(self, agent, memory_budget=64 * 2**20, max_size=None):
+        self.memory_budget = memory_budget
+        self.max_size = max_size
+
+        # the shared agent starts with the weights of the first version
+        self.agent = CopyAgent(agent)
+        self.versions = []
+        self.memory_bytes = 0
+        self.loaded = None
+
+        # statistics
+        self.num_added = 0
+        self.num_evicted = 0
+        self.num_samples = 0
+        self.num_swaps = 0
+        self.swap_seconds = 0.
+        self.add_seconds = 0.
+
+        self.add(agent)
+
+
+    def __len__(self):
+        return len(self.versions)
+
+
+    def add(self, agent):
+        ''' add the current weights of agent as the newest version'''
+        start_time = time.time()
+        weights = agent.q_learning.get_weights()
+        self.versions.append(weights)
+        self.memory_bytes += sum(array.nbytes for array in weights)
+        self.add_seconds += time.time() - start_time
+        self.num_added += 1
+
+        while len(self.versions) > 1 and (self.memory_bytes > self.memory_budget or (self.max_size and len(self.versions) > self.max_size)):
+            self.evict(0)
+
+
+    def evict(self, index):
+        weights = self.versions.pop(index)
+        self.memory_bytes -= sum(array.nbytes for array in weights)
+        self.num_evicted += 1
+
+        # the indices of the following versions are shifted
+        if self.loaded is not None:
+            self.loaded = None if self.loaded == index else self.loaded - (self.loaded > index)
+
+
+    def sample(self):
+        ''' returns the shared agent with the weights of a random version'''
+        index = random.randrange(len(self.versions))
+        self.num_samples += 1
+
+        if index != self.loaded:
+            start_time = time.time()
+            self.agent.q_learning.set_weights(self.versions[index])
+            self.swap_seconds += time.time() - start_time
+            self.num_swaps += 1
+            self.loaded = index
+
+        return self.agent
+
+
+    def stats(self):
+        return {
+            'size': len(self.versions),
+            'memory_bytes': self.memory_bytes,
+            'memory_budget': self.memory_budget,
+            'added': self.num_added,
+            'evicted': self.num_evicted,
+            'samples': self.num_samples,
+            'swaps': self.num_swaps,
+            'mean_swap_seconds': self.swap_seconds / max(1, self.num_swaps),
+            'mean_add_seconds': self.add_seconds / max(1, self.num_added),
+            'copy_seconds': self.agent.copy_seconds,
+            'copy_bytes': self.agent.copy_bytes,
+        }
+
+
+    def report(self):
+        stats = self.stats()
+        print("Opponent pool: {} versions, {:.2f}/{:.0f} MB, {} evicted, {} swaps in {} samples, {:.3f} ms per swap, {:.3f} ms per added version".format(
+            stats['size'], stats['memory_bytes'] / 2**20, stats['memory_budget'] / 2**20, stats['evicted'],
+            stats['swaps'], stats['samples'], 1e3 * stats['mean_swap_seconds'], 1e3 * stats['mean_add_seconds']))
+        print("Copy agent built in {:.3f} ms, {:.3f} MB of weights for each version".format(1e3 * stats['copy_seconds'], stats['copy_bytes'] / 2**20))
+        return stats
@@ -2,8 +2,6 @@ import tensorflow as tf
 import argparse
 import numpy as np
 import os, time
-import random
-import shutil
 
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'  # or any {'0', '1', '2'}
 
@@ -11,11 +9,13 @@ os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'  # or any {'0', '1', '2'}
 ## our stuff import
 import graphic_visualizations as gv
 import environment as brisc
-from evaluate import evaluate
+from evaluate import evaluate, EvaluationPool
 
 from agents.random_agent import RandomAgent
 from agents.q_agent import QAgent
 from agents.ai_agent import AIAgent
+from networks.replay_memory import has_replay_snapshot
+from opponent_pool import OpponentPool
 from utils import BriscolaLogger
 from utils import CardsEncoding, CardsOrder, NetworkTypes, PlayerState
 
@@ -23,120 +23,88 @@ from utils import CardsEncoding, CardsOrder, NetworkTypes, PlayerState
 ### New arena self play mode
 
 
-class CopyAgent(QAgent):
-    '''Copied agent. Identical to a QAgent, but does not update itself'''
-    def __init__(self, agent):
+def self_train(game, agent1, agent2, num_epochs, evaluate_every, num_evaluations, copy_every, model_dir = "", evaluation_dir = "evaluation_dir", max_old_agents=50, pool_memory_budget=64 * 2**20, evaluation_workers=0):
 
-        # create a default QAgent
-        super().__init__(network=agent.network)
-
-        # make the CopyAgent always greedy
-        self.epsilon = 1.0
-
-        # TODO: find a better way for copying the agent without saving the model
-        # initialize the CopyAgent with the same weights as the passed QAgent
-        if type(agent) is not QAgent:
-            raise TypeError("CopyAgent __init__ requires argument of type QAgent")
-
-        # create a temp directory where to save agent current model
-        if not os.path.isdir('__tmp_model_dir__'):
-            os.makedirs('__tmp_model_dir__')
-
-        agent.save_model('__tmp_model_dir__')
-        super().load_model('__tmp_model_dir__')
-
-        # remove the temp directory after loading the model into the CopyAgent
-        shutil.rmtree('__tmp_model_dir__')
-
-        self.name = "CopyAgent"
-
-        # A copy agent must always be greedy since it is not learning
-        self.make_greedy()
-
-
-    def update(self, *args):
-        pass
-
-
-def self_train(game, agent1, agent2, num_epochs, evaluate_every, num_evaluations, copy_every, model_dir = "", evaluation_dir = "evaluation_dir"):
-
-    # initialize the list of old agents with a copy of the non trained agent
-    old_agents = [[CopyAgent(agent1)], [CopyAgent(agent2)]]
+    # initialize the pools of old agents with a copy of the non trained agents
+    pools = [OpponentPool(agent1, pool_memory_budget, max_old_agents), OpponentPool(agent2, pool_memory_budget, max_old_agents)]
 
     # Training starts
     best_total_wins = -1
-    for epoch in range(1, num_epochs + 1):
-        gv.printProgressBar(epoch, num_epochs,
-                            prefix = "Epoch: " + str(epoch),
-                            length= 50)
-
-        for a in [agent1,agent2]:
-            other = 0 if a == agent2 else 1
-
-
-            # picking an agent from the past as adversary
-            agents = [a, random.choice(old_agents[other])]
-
-            # Play a briscola game to train the agent
-            brisc.play_episode(game, agents)
-
-        # Evaluation step
-        if epoch % evaluate_every == 0:
-
-            # Evaluation visualization directory
-            if not os.path.isdir(evaluation_dir):
-                os.mkdir(evaluation_dir)
-
-            # Greedy for evaluation
-            for ag in [agent1,agent2]:
-                ag.make_greedy()
-
-            # Evaluation of the two agents
-            agents = [agent1,agent2]
-            winners, points = evaluate(game, agents, num_evaluations)
-            gv.evaluate_summary(winners, points, agents, evaluation_dir+
-                "/epoch:" + str(epoch) + " " + agents[0].name + "1 vs " + agents[1].name + "2")
-            victory_history_1v2.append(winners)
-            points_history_1v2.append(points)
-
-            # Evaluation against random agent
-            agents = [agent1,RandomAgent()]
-            winners, points = evaluate(game, agents, num_evaluations)
-            gv.evaluate_summary(winners, points, agents, evaluation_dir+
-                "/epoch:" + str(epoch) + " " + agents[0].name + "1 vs " + agents[1].name)
-            victory_history_1vR.append(winners)
-            points_history_1vR.append(points)
-            # Saving the model if the agent performs better against random agent
-            if winners[0] > best_total_wins:
-                best_total_wins = winners[0]
-                agent1.save_model(model_dir)
-
-
-            agents = [agent2,RandomAgent()]
-            winners, points = evaluate(game, agents, num_evaluations)
-            gv.evaluate_summary(winners, points, agents, evaluation_dir+
-                "/epoch:" + str(epoch) + " " + agents[0].name + "2 vs " + agents[1].name)
-            victory_history_2vR.append(winners)
-            points_history_2vR.append(points)
-            # Saving the model if the agent performs better against random agent
-            if winners[0] > best_total_wins:
-                best_total_wins = winners[0]
-                agent2.save_model(model_dir)
-
-            # Getting ready for more training
-            for ag in [agent1,agent2]:
-                ag.restore_epsilon()
-
-
-        if epoch % copy_every == 0:
-
-            old_agents[other].append(CopyAgent(a))
-
-            # Eliminating the oldest agent if maximum number of agents
-            if len(old_agents) > FLAGS.max_old_agents:
-                old_agents.pop(0)
-
-
+    # the evaluation processes are spawned once for the whole training
+    evaluation_pool = EvaluationPool(evaluation_workers)
+    try:
+        for epoch in range(1, num_epochs + 1):
+            gv.printProgressBar(epoch, num_epochs,
+                                prefix = "Epoch: " + str(epoch),
+                                length= 50)
+
+            for a in [agent1,agent2]:
+                other = 0 if a == agent2 else 1
+
+
+                # picking an agent from the past as adversary
+                agents = [a, pools[other].sample()]
+
+                # Play a briscola game to train the agent
+                brisc.play_episode(game, agents)
+
+            # Evaluation step
+            if epoch % evaluate_every == 0:
+
+                # Evaluation visualization directory
+                if not os.path.isdir(evaluation_dir):
+                    os.mkdir(evaluation_dir)
+
+                # Greedy for evaluation
+                for ag in [agent1,agent2]:
+                    ag.make_greedy()
+
+                # Evaluation of the two agents
+                agents = [agent1,agent2]
+                winners, points = evaluate(game, agents, num_evaluations, pool=evaluation_pool)
+                gv.evaluate_summary(winners, points, agents, evaluation_dir+
+                    "/epoch:" + str(epoch) + " " + agents[0].name + "1 vs " + agents[1].name + "2")
+                victory_history_1v2.append(winners)
+                points_history_1v2.append(points)
+
+                # Evaluation against random agent
+                agents = [agent1,RandomAgent()]
+                winners, points = evaluate(game, agents, num_evaluations, pool=evaluation_pool)
+                gv.evaluate_summary(winners, points, agents, evaluation_dir+
+                    "/epoch:" + str(epoch) + " " + agents[0].name + "1 vs " + agents[1].name)
+                victory_history_1vR.append(winners)
+                points_history_1vR.append(points)
+                # Saving the model if the agent performs better against random agent
+                if winners[0] > best_total_wins:
+                    best_total_wins = winners[0]
+                    agent1.save_model(model_dir)
+
+
+                agents = [agent2,RandomAgent()]
+                winners, points = evaluate(game, agents, num_evaluations, pool=evaluation_pool)
+                gv.evaluate_summary(winners, points, agents, evaluation_dir+
+                    "/epoch:" + str(epoch) + " " + agents[0].name + "2 vs " + agents[1].name)
+                victory_history_2vR.append(winners)
+                points_history_2vR.append(points)
+                # Saving the model if the agent performs better against random agent
+                if winners[0] > best_total_wins:
+                    best_total_wins = winners[0]
+                    agent2.save_model(model_dir)
+
+                # Getting ready for more training
+                for ag in [agent1,agent2]:
+                    ag.restore_epsilon()
+
+
+            if epoch % copy_every == 0:
+
+                # the pools evict their oldest agents when they are full
+                print()
+                for pool, ag in zip(pools, [agent1, agent2]):
+                    pool.add(ag)
+                    pool.report()
+    finally:
+        evaluation_pool.close()
 
     return best_total_wins
 
@@ -167,7 +135,7 @@ def main(argv=None):
 
     # Initializing the environment
     logger = BriscolaLogger(BriscolaLogger.LoggerLevels.TRAIN)
-    game = brisc.BriscolaGame(2, logger)
+    game = brisc.BriscolaGame(2, logger, FLAGS.cards_order)
 
     # Initialize agent
     global agent1
@@ -180,7 +148,13 @@ def main(argv=None):
         FLAGS.layers,
         FLAGS.learning_rate,
         FLAGS.replace_target_iter,
-        FLAGS.batch_size
+        FLAGS.batch_size,
+        FLAGS.solve_endgame,
+        FLAGS.cards_encoding,
+        FLAGS.player_state,
+        prioritized_replay=FLAGS.prioritized_replay,
+        compact_replay=FLAGS.compact_replay,
+        replay_capacity=FLAGS.replay_capacity
      )
     global agent2
     agent2 = QAgent(
@@ -192,9 +166,22 @@ def main(argv=None):
         FLAGS.layers,
         FLAGS.learning_rate,
         FLAGS.replace_target_iter,
-        FLAGS.batch_size
+        FLAGS.batch_size,
+        FLAGS.solve_endgame,
+        FLAGS.cards_encoding,
+        FLAGS.player_state,
+        prioritized_replay=FLAGS.prioritized_replay,
+        compact_replay=FLAGS.compact_replay,
+        replay_capacity=FLAGS.replay_capacity
     )
 
+    # warm restart from the replay memories of a previous run
+    snapshot_dirs = [os.path.join(FLAGS.replay_snapshot, 'agent1'), os.path.join(FLAGS.replay_snapshot, 'agent2')]
+    if FLAGS.replay_snapshot:
+        for agent, snapshot_dir in zip([agent1, agent2], snapshot_dirs):
+            if has_replay_snapshot(snapshot_dir):
+                agent.load_replay_memory(snapshot_dir)
+
     # Training
     start_time = time.time()
     best_total_wins = self_train(game, agent1, agent2,
@@ -202,10 +189,17 @@ def main(argv=None):
                                     FLAGS.evaluate_every,
                                     FLAGS.num_evaluations,
                                     FLAGS.copy_every,
-                                    FLAGS.model_dir)
+                                    FLAGS.model_dir,
+                                    max_old_agents=FLAGS.max_old_agents,
+                                    pool_memory_budget=FLAGS.pool_memory_budget * 2**20,
+                                    evaluation_workers=FLAGS.evaluation_workers)
     print('Best winning ratio : {:.2%}'.format(best_total_wins/FLAGS.num_evaluations))
     print(time.time()-start_time)
 
+    if FLAGS.replay_snapshot:
+        for agent, snapshot_dir in zip([agent1, agent2], snapshot_dirs):
+            agent.save_replay_memory(snapshot_dir)
+
     # Summary graphs
     x = [FLAGS.evaluate_every*i for i in range(1,1+len(victory_history_1v2))]
 
@@ -229,15 +223,16 @@ def main(argv=None):
 
 
      # Evaluation against ai agent
-    agents = [agent1,AIAgent()]
-    winners, points = evaluate(game, agents, FLAGS.num_evaluations)
-    gv.evaluate_summary(winners, points, agents, "evaluation_dir/"+
-        agents[0].name + "1 vs " + agents[1].name)
+    with EvaluationPool(FLAGS.evaluation_workers) as evaluation_pool:
+        agents = [agent1,AIAgent()]
+        winners, points = evaluate(game, agents, FLAGS.num_evaluations, pool=evaluation_pool)
+        gv.evaluate_summary(winners, points, agents, "evaluation_dir/"+
+            agents[0].name + "1 vs " + agents[1].name)
 
-    agents = [agent2,AIAgent()]
-    winners, points = evaluate(game, agents, FLAGS.num_evaluations)
-    gv.evaluate_summary(winners, points, agents, "evaluation_dir/"+
-        {agents[0].name} + "2 vs " + agents[1].name)
+        agents = [agent2,AIAgent()]
+        winners, points = evaluate(game, agents, FLAGS.num_evaluations, pool=evaluation_pool)
+        gv.evaluate_summary(winners, points, agents, "evaluation_dir/"+
+            {agents[0].name} + "2 vs " + agents[1].name)
 
 
 
@@ -253,10 +248,12 @@ if __name__ == '__main__':
     parser.add_argument("--num_epochs", default=1000, help="Number of training games played", type=int)
     parser.add_argument("--max_old_agents", default=50, help="Maximum number of old copies of QAgent stored", type=int)
     parser.add_argument("--copy_every", default=100, help="Add the copy after tot number of epochs", type=int)
+    parser.add_argument("--pool_memory_budget", default=64, help="Maximum MB of weights of the old copies of each QAgent", type=float)
 
     # Evaluation parameters
     parser.add_argument("--evaluate_every", default=100, help="Evaluate model after this many epochs", type=int)
     parser.add_argument("--num_evaluations", default=500, help="Number of evaluation games against each type of opponent for each test", type=int)
+    parser.add_argument("--evaluation_workers", default=0, help="Number of processes playing the evaluation games, 0 plays them in the training process", type=int)
 
     # State parameters
     parser.add_argument("--cards_order", default=CardsOrder.APPEND, choices=[CardsOrder.APPEND, CardsOrder.REPLACE, CardsOrder.VALUE], help="Where a drawn card is put in the hand")
@@ -268,6 +265,7 @@ if __name__ == '__main__':
     parser.add_argument("--epsilon_increment", default=5e-5, help="How much epsilon is increased after each action taken up to epsilon_max", type=float)
     parser.add_argument("--epsilon_max", default=0.85, help="The maximum value for the incremented epsilon", type=float)
     parser.add_argument("--discount", default=0.85, help="How much a reward is discounted after each step", type=float)
+    parser.add_argument("--solve_endgame", action="store_true", help="Play the last turns with the perfect-information endgame solver")
 
     # Network parameters
     parser.add_argument("--network", default=NetworkTypes.DQN, choices=[NetworkTypes.DQN, NetworkTypes.DRQN], help="Neural Network used for approximating value function")
@@ -275,6 +273,10 @@ if __name__ == '__main__':
     parser.add_argument("--learning_rate", default=1e-4, help="Learning rate for the network updates", type=float)
     parser.add_argument("--replace_target_iter", default=2000, help="Number of update steps before copying evaluation weights into target network", type=int)
     parser.add_argument("--batch_size", default=100, help="Training batch size", type=int)
+    parser.add_argument("--prioritized_replay", action="store_true", help="Sample the training batches proportionally to their td error (DQN only)")
+    parser.add_argument("--compact_replay", action="store_true", help="Store the states in the replay memory as card ids, expanded when sampled (DQN only)")
+    parser.add_argument("--replay_capacity", default=10000, help="Number of transitions stored in the DQN replay memory", type=int)
+    parser.add_argument("--replay_snapshot", default="", help="Directory where the replay memories are saved after training and loaded from when restarting", type=str)
 
 
     FLAGS = parser.parse_args()
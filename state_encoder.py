@@ -0,0 +1,166 @@
+import numpy as np
+
+import environment as brisc
+from utils import CardsEncoding, PlayerState
+
+
+class StateEncoder:
+    ''' Encodes the state of a player as a vector of features.
+        The state is made of card slots (the hand, the cards already played in the turn
+        and, unless only its seed is used, the briscola) each encoded according to
+        cards_encoding, optionally followed by the briscola seed and the seen cards.
+        Empty slots are all zeros.
+    '''
+
+    def __init__(self, cards_encoding=CardsEncoding.HOT_ON_NUM_SEED, player_state=PlayerState.HAND_PLAYED_BRISCOLA, num_players=2):
+
+        self.cards_encoding = cards_encoding
+        self.player_state = player_state
+        self.num_players = num_players
+
+        # each row is the encoding of a card id, the last one is used for empty slots (id -1)
+        if cards_encoding == CardsEncoding.HOT_ON_DECK:
+            self.card_size = brisc.DECK_SIZE
+            self.card_codes = np.zeros((brisc.DECK_SIZE + 1, self.card_size), dtype=np.float32)
+            self.card_codes[np.arange(brisc.DECK_SIZE), np.arange(brisc.DECK_SIZE)] = 1
+        elif cards_encoding == CardsEncoding.HOT_ON_NUM_SEED:
+            num_numbers = len(brisc.NUMBER_NAMES)
+            self.card_size = num_numbers + len(brisc.SEED_NAMES)
+            self.card_codes = np.zeros((brisc.DECK_SIZE + 1, self.card_size), dtype=np.float32)
+            self.card_codes[np.arange(brisc.DECK_SIZE), brisc.NUMBER] = 1
+            self.card_codes[np.arange(brisc.DECK_SIZE), num_numbers + brisc.SEED] = 1
+        else:
+            raise ValueError("Not implemented cards encoding passed to StateEncoder")
+
+        if player_state not in [PlayerState.HAND_PLAYED_BRISCOLA, PlayerState.HAND_PLAYED_BRISCOLASEED, PlayerState.HAND_PLAYED_BRISCOLA_HISTORY]:
+            raise ValueError("Not implemented player state passed to StateEncoder")
+
+        # card slots: hand, cards played by the previous players and the briscola
+        self.played_offset = brisc.HAND_SIZE
+        self.num_card_slots = brisc.HAND_SIZE + num_players - 1
+        self.encode_briscola_card = player_state != PlayerState.HAND_PLAYED_BRISCOLASEED
+        if self.encode_briscola_card:
+            self.num_card_slots += 1
+        self.cards_features = self.num_card_slots * self.card_size
+        self.n_features = self.cards_features
+
+        self.briscola_seed_offset = self.n_features
+        if player_state == PlayerState.HAND_PLAYED_BRISCOLASEED:
+            self.n_features += len(brisc.SEED_NAMES)
+
+        self.history_offset = self.n_features
+        if player_state == PlayerState.HAND_PLAYED_BRISCOLA_HISTORY:
+            self.n_features += brisc.DECK_SIZE
+
+        # compact record of a state: card ids + 1 of the card slots (0 for empty slots),
+        # the briscola seed and the seen cards packed in bits, if they are encoded
+        self.compact_size = self.num_card_slots
+        self.compact_seed_offset = self.compact_size
+        if player_state == PlayerState.HAND_PLAYED_BRISCOLASEED:
+            self.compact_size += 1
+        self.compact_history_offset = self.compact_size
+        self.history_bytes = (brisc.DECK_SIZE + 7) // 8
+        if player_state == PlayerState.HAND_PLAYED_BRISCOLA_HISTORY:
+            self.compact_size += self.history_bytes
+
+        # preallocated buffers
+        self.slot_ids = np.zeros(self.num_card_slots, dtype=np.int64)
+        self.seen_bits = np.zeros(brisc.DECK_SIZE, dtype=np.int64)
+        self.bit_shifts = np.arange(brisc.DECK_SIZE, dtype=np.int64)
+
+
+    def get_slot_ids(self, game, player, out):
+        ''' write the card ids of the card slots of a player into out, -1 for empty slots'''
+        out.fill(-1)
+        for i, card in enumerate(player.hand_ids):
+            out[i] = card
+        for i, card in enumerate(game.played_ids[:self.num_players - 1]):
+            out[self.played_offset + i] = card
+        if self.encode_briscola_card:
+            out[-1] = game.briscola_id
+        return out
+
+
+    def encode(self, game, player, out=None):
+        ''' encode the state of a player of a BriscolaGame into out'''
+        if out is None:
+            out = np.zeros(self.n_features, dtype=np.float32)
+
+        self.get_slot_ids(game, player, self.slot_ids)
+        np.take(self.card_codes, self.slot_ids, axis=0, out=out[:self.cards_features].reshape(self.num_card_slots, self.card_size))
+
+        if self.player_state == PlayerState.HAND_PLAYED_BRISCOLASEED:
+            seeds = out[self.briscola_seed_offset:self.briscola_seed_offset + len(brisc.SEED_NAMES)]
+            seeds.fill(0)
+            seeds[game.briscola.seed] = 1
+
+        if self.player_state == PlayerState.HAND_PLAYED_BRISCOLA_HISTORY:
+            np.right_shift(game.seen_mask, self.bit_shifts, out=self.seen_bits)
+            np.bitwise_and(self.seen_bits, 1, out=self.seen_bits)
+            out[self.history_offset:self.history_offset + brisc.DECK_SIZE] = self.seen_bits
+
+        return out
+
+
+    def encode_batch(self, game, player_ids, out=None):
+        ''' encode the states of player_ids[i] in the i-th game of a BatchedBriscolaGame into out'''
+        if out is None:
+            out = np.zeros((game.num_games, self.n_features), dtype=np.float32)
+
+        slot_ids = np.full((game.num_games, self.num_card_slots), -1, dtype=np.int64)
+        slot_ids[:, :brisc.HAND_SIZE] = game.hands[game.games, player_ids]
+        slot_ids[:, self.played_offset:self.played_offset + self.num_players - 1] = game.played_cards[:, :self.num_players - 1]
+        if self.encode_briscola_card:
+            slot_ids[:, -1] = game.briscola
+
+        out[:, :self.cards_features] = self.card_codes[slot_ids].reshape(game.num_games, self.cards_features)
+
+        if self.player_state == PlayerState.HAND_PLAYED_BRISCOLASEED:
+            seeds = out[:, self.briscola_seed_offset:self.briscola_seed_offset + len(brisc.SEED_NAMES)]
+            seeds.fill(0)
+            seeds[game.games, brisc.SEED[game.briscola]] = 1
+
+        if self.player_state == PlayerState.HAND_PLAYED_BRISCOLA_HISTORY:
+            # the extra column collects the empty history slots (id -1)
+            seen = np.zeros((game.num_games, brisc.DECK_SIZE + 1), dtype=np.float32)
+            seen[game.games[:, np.newaxis], game.history] = 1
+            out[:, self.history_offset:self.history_offset + brisc.DECK_SIZE] = seen[:, :brisc.DECK_SIZE]
+
+        return out
+
+
+    def encode_compact(self, game, player, out=None):
+        ''' write the compact uint8 record of the state of a player of a BriscolaGame into out'''
+        if out is None:
+            out = np.zeros(self.compact_size, dtype=np.uint8)
+
+        self.get_slot_ids(game, player, self.slot_ids)
+        np.add(self.slot_ids, 1, out=out[:self.num_card_slots], casting='unsafe')
+
+        if self.player_state == PlayerState.HAND_PLAYED_BRISCOLASEED:
+            out[self.compact_seed_offset] = game.briscola.seed
+
+        if self.player_state == PlayerState.HAND_PLAYED_BRISCOLA_HISTORY:
+            out[self.compact_history_offset:] = np.frombuffer(game.seen_mask.to_bytes(self.history_bytes, 'little'), dtype=np.uint8)
+
+        return out
+
+
+    def decode_batch(self, records, out=None):
+        ''' expand a batch of compact records into their encoded states'''
+        if out is None:
+            out = np.zeros((len(records), self.n_features), dtype=np.float32)
+
+        slot_ids = records[:, :self.num_card_slots].astype(np.int64) - 1
+        out[:, :self.cards_features] = self.card_codes[slot_ids].reshape(len(records), self.cards_features)
+
+        if self.player_state == PlayerState.HAND_PLAYED_BRISCOLASEED:
+            seeds = out[:, self.briscola_seed_offset:self.briscola_seed_offset + len(brisc.SEED_NAMES)]
+            seeds.fill(0)
+            seeds[np.arange(len(records)), records[:, self.compact_seed_offset]] = 1
+
+        if self.player_state == PlayerState.HAND_PLAYED_BRISCOLA_HISTORY:
+            seen = np.unpackbits(records[:, self.compact_history_offset:], axis=1, bitorder='little')
+            out[:, self.history_offset:self.history_offset + brisc.DECK_SIZE] = seen[:, :brisc.DECK_SIZE]
+
+        return out
@@ -6,32 +6,45 @@ import environment as brisc
 from agents.random_agent import RandomAgent
 from agents.q_agent import QAgent
 from agents.ai_agent import AIAgent
-from evaluate import evaluate
+from agents.ismcts_agent import ISMCTSAgent
+from agents.pimc_agent import PIMCAgent
+from actor_learner import train_actor_learner
+from evaluate import CheckpointEvaluator, get_deals
 import environment as brisc
+from networks.replay_memory import has_replay_snapshot
 from utils import BriscolaLogger
 from utils import CardsEncoding, CardsOrder, NetworkTypes, PlayerState
 
 
 
-def train(game, agents, num_epochs, evaluate_every, num_evaluations, model_dir = ""):
+def train(game, agents, num_epochs, evaluate_every, num_evaluations, model_dir = "", evaluation_workers=0, sequential_evaluation=False, deals=None, callback=None):
+    ''' trains agents[0] playing num_epochs games, evaluating it every evaluate_every games and
+        saving the best checkpoint in model_dir. After each evaluation callback(epoch, win_rate) is
+        called if given, training stops early when it returns True.
+        returns the win rate of the best checkpoint, over the games of its evaluation
+    '''
 
-    best_total_wins = -1
-    for epoch in range(1, num_epochs + 1):
-        print ("Epoch: ", epoch, end='\r')
+    # the evaluation processes are spawned once for the whole training
+    evaluator = CheckpointEvaluator(num_evaluations, evaluation_workers, sequential_evaluation, deals)
+    try:
+        for epoch in range(1, num_epochs + 1):
+            print ("Epoch: ", epoch, end='\r')
 
-        game_winner_id, winner_points = brisc.play_episode(game, agents)
+            game_winner_id, winner_points = brisc.play_episode(game, agents)
 
-        if epoch % evaluate_every == 0:
-            for agent in agents:
-                agent.make_greedy()
-            total_wins, points_history = evaluate(game, agents, num_evaluations)
-            for agent in agents:
-                agent.restore_epsilon()
-            if total_wins[0] > best_total_wins:
-                best_total_wins = total_wins[0]
-                agents[0].save_model(model_dir)
+            if epoch % evaluate_every == 0:
+                better, win_rate = evaluator.evaluate(game, agents)
+                if better:
+                    agents[0].save_model(model_dir)
+                if callback is not None and callback(epoch, win_rate):
+                    break
+    finally:
+        evaluator.close()
 
-    return best_total_wins
+    if sequential_evaluation:
+        print("\nEvaluation games played: ", evaluator.evaluation_games)
+
+    return evaluator.best_win_rate
 
 
 
@@ -39,25 +52,53 @@ def main(argv=None):
 
     # Initializing the environment
     logger = BriscolaLogger(BriscolaLogger.LoggerLevels.TRAIN)
-    game = brisc.BriscolaGame(2, logger)
+    game = brisc.BriscolaGame(2, logger, FLAGS.cards_order)
 
     # Initialize agents
     agents = []
-    agent = QAgent(
-        FLAGS.epsilon,
-        FLAGS.epsilon_increment,
-        FLAGS.epsilon_max,
-        FLAGS.discount,
-        FLAGS.network,
-        FLAGS.layers,
-        FLAGS.learning_rate,
-        FLAGS.replace_target_iter,
-        FLAGS.batch_size)
+    agent_config = dict(
+        epsilon=FLAGS.epsilon,
+        epsilon_increment=FLAGS.epsilon_increment,
+        epsilon_max=FLAGS.epsilon_max,
+        discount=FLAGS.discount,
+        network=FLAGS.network,
+        layers=FLAGS.layers,
+        learning_rate=FLAGS.learning_rate,
+        replace_target_iter=FLAGS.replace_target_iter,
+        batch_size=FLAGS.batch_size,
+        solve_endgame=FLAGS.solve_endgame,
+        cards_encoding=FLAGS.cards_encoding,
+        player_state=FLAGS.player_state,
+        prioritized_replay=FLAGS.prioritized_replay,
+        compact_replay=FLAGS.compact_replay,
+        replay_capacity=FLAGS.replay_capacity)
+    agent = QAgent(**agent_config)
     agents.append(agent)
-    agent = RandomAgent()
+    if FLAGS.opponent == 'ai':
+        agent = AIAgent()
+    elif FLAGS.opponent == 'pimc':
+        agent = PIMCAgent(FLAGS.search_iterations, time_budget=FLAGS.search_time)
+    elif FLAGS.opponent == 'ismcts':
+        agent = ISMCTSAgent(FLAGS.search_iterations, FLAGS.search_time)
+    else:
+        agent = RandomAgent()
     agents.append(agent)
 
-    train(game, agents, FLAGS.num_epochs, FLAGS.evaluate_every, FLAGS.num_evaluations, FLAGS.model_dir)
+    # warm restart from the replay memory of a previous run
+    if FLAGS.replay_snapshot and has_replay_snapshot(FLAGS.replay_snapshot):
+        agents[0].load_replay_memory(FLAGS.replay_snapshot)
+
+    # checkpoints evaluated on the same deals
+    deals = get_deals(FLAGS.deals_file, FLAGS.num_deals) if FLAGS.deals_file else None
+
+    if FLAGS.num_workers > 0:
+        train_actor_learner(game, agents, agent_config, FLAGS.num_workers, FLAGS.num_epochs, FLAGS.evaluate_every, FLAGS.num_evaluations, FLAGS.model_dir, FLAGS.weights_every,
+                            evaluation_workers=FLAGS.evaluation_workers, sequential_evaluation=FLAGS.sequential_evaluation, deals=deals)
+    else:
+        train(game, agents, FLAGS.num_epochs, FLAGS.evaluate_every, FLAGS.num_evaluations, FLAGS.model_dir, FLAGS.evaluation_workers, FLAGS.sequential_evaluation, deals)
+
+    if FLAGS.replay_snapshot:
+        agents[0].save_replay_memory(FLAGS.replay_snapshot)
 
 
 
@@ -71,10 +112,19 @@ if __name__ == '__main__':
     # Training parameters
     parser.add_argument("--model_dir", default="saved_model", help="Where to save the trained model, checkpoints and stats", type=str)
     parser.add_argument("--num_epochs", default=100000, help="Number of training games played", type=int)
+    parser.add_argument("--opponent", default='random', choices=['random', 'ai', 'pimc', 'ismcts'], help="Opponent the agent is trained against")
+    parser.add_argument("--search_iterations", default=200, help="Iterations (ismcts) or determinizations (pimc) of the search opponent for each move", type=int)
+    parser.add_argument("--search_time", default=None, help="Maximum seconds spent by the search opponent for each move", type=float)
+    parser.add_argument("--num_workers", default=0, help="Number of actor processes playing the training games, 0 trains in a single process", type=int)
+    parser.add_argument("--weights_every", default=100, help="Number of training steps before sending the learner weights to the actors", type=int)
 
     # Evaluation parameters
     parser.add_argument("--evaluate_every", default=1000, help="Evaluate model after this many epochs", type=int)
     parser.add_argument("--num_evaluations", default=500, help="Number of evaluation games against each type of opponent for each test", type=int)
+    parser.add_argument("--evaluation_workers", default=0, help="Number of processes playing the evaluation games, 0 plays them in the training process", type=int)
+    parser.add_argument("--deals_file", default=None, help="Evaluate on a pool of deals (.npy) each played twice with the agents swapping seats, generated if it does not exist", type=str)
+    parser.add_argument("--num_deals", default=250, help="Number of deals of the deals file played in each evaluation", type=int)
+    parser.add_argument("--sequential_evaluation", action="store_true", help="Stop each evaluation as soon as a sequential test decides if the agent is better than the best checkpoint, playing at most num_evaluations games")
 
     # State parameters
     parser.add_argument("--cards_order", default=CardsOrder.APPEND, choices=[CardsOrder.APPEND, CardsOrder.REPLACE, CardsOrder.VALUE], help="Where a drawn card is put in the hand")
@@ -86,6 +136,7 @@ if __name__ == '__main__':
     parser.add_argument("--epsilon_increment", default=1e-5, help="How much epsilon is increased after each action taken up to epsilon_max", type=float)
     parser.add_argument("--epsilon_max", default=0.85, help="The maximum value for the incremented epsilon", type=float)
     parser.add_argument("--discount", default=0.85, help="How much a reward is discounted after each step", type=float)
+    parser.add_argument("--solve_endgame", action="store_true", help="Play the last turns with the perfect-information endgame solver")
 
     # Network parameters
     parser.add_argument("--network", default=NetworkTypes.DRQN, choices=[NetworkTypes.DQN, NetworkTypes.DRQN], help="Neural Network used for approximating value function")
@@ -93,7 +144,13 @@ if __name__ == '__main__':
     parser.add_argument("--learning_rate", default=1e-4, help="Learning rate for the network updates", type=float)
     parser.add_argument("--replace_target_iter", default=2000, help="Number of update steps before copying evaluation weights into target network", type=int)
     parser.add_argument("--batch_size", default=100, help="Training batch size", type=int)
+    parser.add_argument("--prioritized_replay", action="store_true", help="Sample the training batches proportionally to their td error (DQN only)")
+    parser.add_argument("--compact_replay", action="store_true", help="Store the states in the replay memory as card ids, expanded when sampled (DQN only)")
+    parser.add_argument("--replay_capacity", default=10000, help="Number of transitions stored in the DQN replay memory", type=int)
+    parser.add_argument("--replay_snapshot", default="", help="Directory where the replay memory is saved after training and loaded from when restarting", type=str)
 
     FLAGS = parser.parse_args()
+    if FLAGS.sequential_evaluation and FLAGS.deals_file:
+        parser.error("--sequential_evaluation can not be used with --deals_file")
 
     tf.app.run()
@@ -34,6 +34,15 @@ class BriscolaLogger:
         self.TEST = print
 
 
+    def __getstate__(self):
+        # the logging functions are lambdas, which can not be pickled
+        return {'verbosity': self.verbosity}
+
+
+    def __setstate__(self, state):
+        self.configure_logger(state['verbosity'])
+
+
 # Enumerations
 
 class CardsEncoding:
@@ -49,6 +58,7 @@ class NetworkTypes:
     DQN = 'dqn'
     DRQN = 'drqn'
     AC = 'actor_critic'
+    NUMPY = 'numpy'
 
 class PlayerState:
     HAND_PLAYED_BRISCOLA = 'hand_played_briscola'
@@ -0,0 +1,249 @@
+import numpy as np
+
+import environment as brisc
+from state_encoder import StateEncoder
+from utils import BriscolaLogger, CardsOrder
+
+
+class VectorBriscolaEnv:
+    ''' Gym-style environment stepping num_envs games at once.
+        At each step the current player of every game plays a card; observations, legal
+        actions masks and player ids always refer to the players which have to act next.
+        All the games end together, then they are automatically reset.
+    '''
+
+    def __init__(self, num_envs, num_players=2, encoder=None, logger=BriscolaLogger()):
+        self.num_envs = num_envs
+        self.num_players = num_players
+        self.game = brisc.BatchedBriscolaGame(num_envs, num_players, logger)
+        self.encoder = encoder if encoder is not None else StateEncoder(num_players=num_players)
+        self.n_features = self.encoder.n_features
+        self.n_actions = brisc.HAND_SIZE
+
+        # preallocated outputs, they are overwritten at each step
+        self.observations = np.zeros((num_envs, self.n_features), dtype=np.float32)
+        self.rewards = np.zeros((num_envs, num_players), dtype=np.float32)
+
+
+    def reset(self, decks=None, turn_players=None):
+        ''' starts new games, returns (observations, actions masks, player ids)'''
+        self.game.reset(decks, turn_players)
+        return self.observe()
+
+
+    def observe(self):
+        ''' returns (observations, actions masks, player ids) of the players which have to act'''
+        player_ids = self.game.get_current_players()
+        self.encoder.encode_batch(self.game, player_ids, out=self.observations)
+        return self.observations, self.game.get_player_actions(), player_ids
+
+
+    def step(self, actions):
+        ''' the current player of each game plays the card at index actions[i] of its hand.
+            returns (observations, actions masks, player ids, rewards, dones, info) where
+            rewards[i, p] is the reward of player p for the turn closed by this step, if any.
+            When the games end, info contains the final 'winners', 'winner_points', 'points'
+            and the 'terminal_observations' of each player, then the games are reset.
+        '''
+        game = self.game
+        game.play_step(actions)
+
+        self.rewards.fill(0)
+        if game.num_played == game.num_players:
+            winner_player_ids, points = game.evaluate_step()
+            winners = np.arange(self.num_players) == winner_player_ids[:, np.newaxis]
+            self.rewards[:] = np.where(winners, points[:, np.newaxis], -points[:, np.newaxis])
+            game.draw_step()
+
+        info = {}
+        dones = game.check_end_game()
+        if dones.all():
+            info['winners'], info['winner_points'] = game.end_game()
+            info['points'] = game.points.copy()
+            info['terminal_observations'] = np.stack([
+                self.encoder.encode_batch(game, np.full(self.num_envs, player_id))
+                for player_id in range(self.num_players)], axis=1)
+            game.reset()
+
+        observations, masks, player_ids = self.observe()
+        return observations, masks, player_ids, self.rewards, dones, info
+
+
+
+class _DeckView:
+
+    def __init__(self, game):
+        self.game = game
+
+    @property
+    def end_deck(self):
+        return self.game.end_deck
+
+
+
+class PlayerView:
+    ''' BriscolaPlayer interface of a player in one game of a BatchedBriscolaGame'''
+
+    def __init__(self, game, index, player_id):
+        self.game = game
+        self.index = index
+        self.id = player_id
+
+    @property
+    def hand_ids(self):
+        size = self.game.hand_sizes[self.index, self.id]
+        return self.game.hands[self.index, self.id, :size].tolist()
+
+    @property
+    def hand(self):
+        return [brisc.CARDS[card_id] for card_id in self.hand_ids]
+
+    @property
+    def hand_mask(self):
+        hand_mask = 0
+        for card_id in self.hand_ids:
+            hand_mask |= 1 << card_id
+        return hand_mask
+
+    @property
+    def points(self):
+        return int(self.game.points[self.index, self.id])
+
+
+
+class GameView:
+    ''' BriscolaGame interface of one game of a BatchedBriscolaGame,
+        used for letting the existing agents observe batched games
+    '''
+
+    def __init__(self, game, index):
+        self.game = game
+        self.index = index
+        self.num_players = game.num_players
+        self.cards_order = CardsOrder.APPEND
+        self.logger = game.logger
+        self.deck = _DeckView(game)
+        self.players = [PlayerView(game, index, player_id) for player_id in range(game.num_players)]
+
+    @property
+    def briscola_id(self):
+        return int(self.game.briscola[self.index])
+
+    @property
+    def briscola(self):
+        return brisc.CARDS[self.briscola_id]
+
+    @property
+    def played_ids(self):
+        return self.game.played_cards[self.index, :self.game.num_played].tolist()
+
+    @property
+    def played_cards(self):
+        return [brisc.CARDS[card_id] for card_id in self.played_ids]
+
+    @property
+    def history_ids(self):
+        return self.game.history[self.index, :self.game.history_length].tolist()
+
+    @property
+    def history(self):
+        return [brisc.CARDS[card_id] for card_id in self.history_ids]
+
+    @property
+    def seen_mask(self):
+        seen_mask = 0
+        for card_id in self.history_ids:
+            seen_mask |= 1 << card_id
+        return seen_mask
+
+    @property
+    def turn_player(self):
+        return int(self.game.turn_player[self.index])
+
+    @property
+    def players_order(self):
+        return self.game.players_order[self.index].tolist()
+
+    def get_players_order(self):
+        return self.players_order
+
+    def get_player_actions(self, player_id):
+        return list(range(self.game.hand_sizes[self.index, player_id]))
+
+    def check_end_game(self):
+        return bool(self.game.check_end_game()[self.index])
+
+    def snapshot(self):
+        ''' BriscolaGame.snapshot() record of the game'''
+        game = self.game
+        state = game.decks[self.index].tolist() + [
+            game.deck_cursor,
+            self.briscola_id if game.briscola_placed else -1,
+            int(game.end_deck),
+            self.briscola_id,
+            self.turn_player,
+            self.seen_mask,
+            game.history_length,
+            game.num_played]
+        state += game.history[self.index].tolist()
+        state += game.played_cards[self.index].tolist()
+        for player in self.players:
+            state += [player.points, player.hand_mask, len(player.hand_ids)]
+            state += game.hands[self.index, player.id].tolist()
+            state.append(brisc.HAND_SIZE)
+
+        return state
+
+
+
+def play_vector_episode(game, agents, train=True):
+    ''' play_episode on all the games of a BatchedBriscolaGame, agents[i][player_id] is the
+        agent of player_id in the i-th game. It follows the same observe, update,
+        select_action protocol of play_episode, so it works with all the existing agents.
+        returns the winner ids and points of all the games
+    '''
+    game.reset()
+    for game_agents in agents:
+        for agent in game_agents:
+            agent.start_episode()
+    views = [GameView(game, i) for i in range(game.num_games)]
+    actions = np.zeros(game.num_games, dtype=np.int64)
+    rewards = None
+
+    while not game.check_end_game().all():
+
+        # action step
+        for _ in range(game.num_players):
+            player_ids = game.get_current_players()
+            for i, view in enumerate(views):
+                player_id = player_ids[i]
+                player = view.players[player_id]
+                agent = agents[i][player_id]
+                # agent observes state before acting
+                agent.observe(view, player)
+
+                if train and rewards is not None:
+                    agent.update(rewards[i, player_id])
+
+                available_actions = view.get_player_actions(player_id)
+                actions[i] = agent.select_action(available_actions)
+
+            game.play_step(actions)
+
+        # rewards of each player id
+        winner_player_ids, points = game.evaluate_step()
+        winners = np.arange(game.num_players) == winner_player_ids[:, np.newaxis]
+        rewards = np.where(winners, points[:, np.newaxis], -points[:, np.newaxis])
+
+        # update the environment
+        game.draw_step()
+
+    # observe terminal state
+    for i, view in enumerate(views):
+        for player in view.players:
+            agent = agents[i][player.id]
+            agent.observe(view, player)
+            if train and rewards is not None:
+                agent.update(rewards[i, player.id])
+
+    return game.end_game()